@@ -0,0 +1,281 @@
+"""
+Бенчмарк функций database/core.py на нескольких объемах истории
+с файлом результатов и сравнением с сохраненным baseline.
+
+Для каждого размера (пользователи x дни истории) генерируется база
+(benchmarks.history), затем каждая операция выполняется --repeat раз для
+случайных пользователей через общий пул, как в боте. Результаты (p50, p95,
+среднее по операциям и размерам) пишутся в JSON. Если указан baseline,
+операции, у которых p50 вырос больше чем на --threshold, считаются
+регрессией и скрипт завершается с кодом 1.
+
+Сгенерированные базы можно переиспользовать между запусками (--cache-dir):
+каждый прогон работает на копии, потому что операции записи меняют базу.
+
+Запуск:
+    python -m benchmarks.core_suite --sizes s,m
+    python -m benchmarks.core_suite --sizes s,m --save-baseline
+    python -m benchmarks.core_suite --sizes l --cache-dir /tmp/tt_histories
+
+Baseline зависит от машины: сохраняйте его на той же машине, где сравниваете.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_core_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+from benchmarks import history  # noqa: E402
+from data.messages import DEFAULT_STATES  # noqa: E402
+from database import core as db  # noqa: E402
+from utils import date  # noqa: E402
+
+# Пользователи x дни истории
+SIZES = {
+    "s": (200, 180),
+    "m": (1000, 365),
+    "l": (2000, 730),
+}
+
+RESULTS_PATH = os.path.join("benchmarks", "results", "core_suite.json")
+BASELINE_PATH = os.path.join("benchmarks", "baselines", "core_suite.json")
+
+# Разница меньше этой считается шумом таймера, мс
+NOISE_FLOOR_MS = 0.05
+
+
+def reset_database() -> None:
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+
+
+async def prepare(size: str, users: int, days: int, seed: int, cache_dir: str | None) -> dict:
+    """Положить в DB_PATH сгенерированную базу размера `size`"""
+    await db.close_pool()
+    reset_database()
+
+    cached = os.path.join(cache_dir, f"history_{users}x{days}_seed{seed}.db") if cache_dir else None
+    if cached and os.path.exists(cached):
+        shutil.copyfile(cached, DB_PATH)
+        with open(cached + ".json", encoding='utf-8') as file:
+            info = json.load(file)
+    else:
+        await db.init_db()
+        info = await history.generate(DB_PATH, users, days, seed)
+
+        if cached:
+            os.makedirs(cache_dir, exist_ok=True)
+            shutil.copyfile(DB_PATH, cached)
+            with open(cached + ".json", "w", encoding='utf-8') as file:
+                json.dump(info, file)
+
+    info["db_mb"] = round(os.path.getsize(DB_PATH) / 2 ** 20, 1)
+
+    # Кэши core относятся к прошлой базе
+    db._user_ids.clear()
+    await db.init_db()
+    await db.open_pool()
+
+    return info
+
+
+def session_ids(users: int, count: int, rng: random.Random) -> list[tuple[int, int]]:
+    """Случайные закрытые сессии (tg_id, id) для update_state_info"""
+    conn = sqlite3.connect(DB_PATH)
+    max_id = conn.execute("SELECT MAX(id) FROM time_sessions").fetchone()[0]
+
+    picked = []
+    while len(picked) < count:
+        row = conn.execute("""
+            SELECT user_id, id FROM time_sessions WHERE id >= ? AND end_time IS NOT NULL LIMIT 1
+        """, (rng.randint(1, max_id),)).fetchone()
+        if row:
+            picked.append(row)
+
+    conn.close()
+    return picked
+
+
+def operations(users: int, days: int, rng: random.Random, repeat: int) -> dict:
+    """Имя операции -> фабрика корутины для i-го повтора"""
+    today = date.get_now().date()
+    states = list(DEFAULT_STATES)
+    edits = session_ids(users, repeat, rng)
+
+    def user() -> int:
+        return rng.randint(1, users)
+
+    def edit_info(i: int) -> dict:
+        kind = i % 3
+        if kind == 0:
+            return {"mood": rng.randint(1, 5)}
+        if kind == 1:
+            return {"tag": rng.choice(history.TAG_WORDS)}
+        return {"state_name": rng.choice(states)}
+
+    return {
+        "get_current_state": lambda i: db.get_current_state(tg_id=user()),
+        "get_user_states[20]": lambda i: db.get_user_states(tg_id=user(), limit=20),
+        "get_user_states[all]": lambda i: db.get_user_states(tg_id=user()),
+        "get_user_states_by_date": lambda i: db.get_user_states_by_date(
+            tg_id=user(), target_date=today - timedelta(days=rng.randint(0, days // 2))
+        ),
+        "get_user_states_page": lambda i: db.get_user_states_page(tg_id=user()),
+        "get_user_tags": lambda i: db.get_user_tags(tg_id=user()),
+        "switch_state": lambda i: db.switch_state(
+            tg_id=user(), new_state=rng.choice(states), tag=rng.choice(["", "python", "gym"])
+        ),
+        "fix_states": lambda i: db.fix_states(
+            first_state_end_time=date.get_now(), new_state=rng.choice(states),
+            new_tag="", tg_id=user()
+        ),
+        "update_state_info": lambda i: db.update_state_info(
+            edits[i][1], edit_info(i), tg_id=edits[i][0]
+        ),
+    }
+
+
+async def measure(factory, repeat: int) -> dict:
+    # Прогрев: кэш пользователей и страницы базы, как в работающем боте
+    for i in range(min(10, repeat)):
+        await factory(i)
+
+    timings = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        await factory(i)
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    return {
+        "n": repeat,
+        "p50_ms": round(timings[len(timings) // 2] * 1000, 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 4),
+        "mean_ms": round(statistics.mean(timings) * 1000, 4),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Напечатать сравнение p50 и вернуть список регрессий"""
+    regressions = []
+
+    for size, current in results["sizes"].items():
+        base = baseline["sizes"].get(size)
+        if base is None:
+            continue
+
+        print(f"\nРазмер {size} против baseline ({baseline['meta']['created']}):")
+        for name, stats in current["ops"].items():
+            if name not in base["ops"]:
+                continue
+
+            old, new = base["ops"][name]["p50_ms"], stats["p50_ms"]
+            ratio = new / old if old else float("inf")
+            regressed = ratio > 1 + threshold and new - old > NOISE_FLOOR_MS
+            mark = "  РЕГРЕССИЯ" if regressed else ""
+            print(f"  {name:<26}{old:>10.3f} -> {new:>10.3f} мс  x{ratio:5.2f}{mark}")
+
+            if regressed:
+                regressions.append(f"{size}/{name}: p50 {old:.3f} -> {new:.3f} мс")
+
+    return regressions
+
+
+def write_json(path: str, data: dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    results = {
+        "meta": {
+            "created": date.get_now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "sizes": {},
+    }
+
+    try:
+        for size in args.sizes.split(","):
+            users, days = SIZES[size]
+            info = await prepare(size, users, days, args.seed, args.cache_dir)
+            print(f"\nРазмер {size}: {info['users']} пользователей x {info['days']} дней, "
+                  f"{info['sessions']} сессий, {info['db_mb']} МБ, генерация {info['generate_s']} с")
+
+            rng = random.Random(args.seed)
+            ops = {}
+            for name, factory in operations(users, days, rng, args.repeat).items():
+                # Полная история пользователя - тысячи строк, хватит меньшего числа повторов
+                repeat = max(10, args.repeat // 10) if name.endswith("[all]") else args.repeat
+                ops[name] = await measure(factory, repeat)
+                print(f"  {name:<26}p50 {ops[name]['p50_ms']:8.3f} мс, "
+                      f"p95 {ops[name]['p95_ms']:8.3f} мс")
+
+            results["sizes"][size] = {**info, "ops": ops}
+    finally:
+        await db.close_pool()
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default="s,m", help=f"через запятую из {', '.join(SIZES)}")
+    parser.add_argument('--repeat', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cache-dir', help="каталог для сгенерированных баз")
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="записать результаты как baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="допустимый рост p50, доля")
+    args = parser.parse_args()
+
+    unknown = [size for size in args.sizes.split(",") if size not in SIZES]
+    if unknown:
+        parser.error(f"неизвестные размеры: {', '.join(unknown)}")
+
+    results = asyncio.run(run(args))
+    write_json(args.output, results)
+    print(f"\nРезультаты: {args.output}")
+
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print(f"Baseline сохранен: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("Baseline не найден, сравнение пропущено")
+        return
+
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("\nРегрессии:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+    print("\nOK: регрессий нет")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+/export и /import на сгенерированной истории (benchmarks.history).
+
+Команды проходят через диспетчер из main.build_dispatcher с ботом
+без сети (benchmarks.stub_bot): документ /export вычитывается сессией
+как при загрузке, файл для /import скачивается из ее памяти.
+
+Скрипт печатает:
+    - время и память выгрузки потоком (SessionsFile) против чтения всей
+      истории списком строк (get_user_states), строки/с выгрузки;
+    - время разбора CSV и вставки при импорте, строки/с;
+и проверяет:
+    - выгрузка пользователя, импортированная другому пользователю,
+      выгружается у него теми же строками (кроме открытой сессии);
+    - повторный импорт того же файла отклонен и ничего не добавил;
+    - файл с ошибками отклонен с номерами строк;
+    - daily/monthly итоги и переходы совпадают с полной пересборкой,
+      в том числе после переключения состояния и /fix сразу после импорта.
+
+Запуск:
+    python -m benchmarks.export_import --users 3 --days 730
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_export_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+os.environ.setdefault('BOT_TOKEN', '123456:stub-token')
+
+sys.path.append(os.getcwd())
+
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.types import ErrorEvent, Update  # noqa: E402
+
+import main  # noqa: E402
+from benchmarks import history  # noqa: E402
+from benchmarks.stub_bot import make_bot, make_document_update, make_message_update  # noqa: E402
+from data import messages as msg  # noqa: E402
+from database import core as db  # noqa: E402
+from utils import history_file  # noqa: E402
+
+# Пользователи, которым импортируется выгрузка пользователя 1:
+# после импорта первый переключает состояние, второй - /fix
+IMPORT_TG_ID = 100001
+FIX_TG_ID = 100002
+
+
+async def feed(dp, bot, update: dict) -> None:
+    await dp.feed_update(bot, Update.model_validate(update, context={"bot": bot}))
+
+
+async def measure_memory(tg_id: int) -> dict:
+    """Пик памяти Python при выгрузке потоком и при чтении всей истории списком"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    file = history_file.SessionsFile(db.iter_user_sessions(tg_id))
+    size = 0
+    async for chunk in file.read(None):
+        size += len(chunk)
+    stream_elapsed = time.perf_counter() - started
+    _, stream_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    states = await db.get_user_states(tg_id=tg_id)
+    list_elapsed = time.perf_counter() - started
+    _, list_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "rows": file.rows,
+        "size": size,
+        "stream_ms": stream_elapsed * 1000,
+        "stream_peak": stream_peak,
+        "list_rows": len(states),
+        "list_ms": list_elapsed * 1000,
+        "list_peak": list_peak,
+    }
+
+
+async def main_() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    await db.init_db()
+    info = await history.generate(DB_PATH, args.users, args.days, args.seed)
+    print(f"История: {info['sessions']} сессий у {args.users} пользователей")
+
+    await db.open_pool(2)
+    failures = []
+    try:
+        memory = await measure_memory(1)
+        print(f"\nВыгрузка пользователя 1: {memory['rows']} строк, {memory['size'] / 1024:.0f} КБ CSV")
+        print(f"  потоком (SessionsFile)  {memory['stream_ms']:>8.1f} мс, пик памяти {memory['stream_peak'] / 1024:>7.0f} КБ, "
+              f"{memory['rows'] / (memory['stream_ms'] / 1000):.0f} строк/с")
+        print(f"  списком (get_user_states) {memory['list_ms']:>6.1f} мс, пик памяти {memory['list_peak'] / 1024:>7.0f} КБ")
+        if memory["stream_peak"] >= memory["list_peak"]:
+            failures.append("выгрузка потоком занимает не меньше памяти, чем список")
+
+        bot = make_bot()
+        dp = main.build_dispatcher(MemoryStorage())
+
+        @dp.errors()
+        async def record_error(event: ErrorEvent) -> bool:
+            failures.append(f"ошибка обработчика: {event.exception!r}")
+            return True
+
+        # Выгрузка через /export: CSV и JSON
+        await feed(dp, bot, make_message_update(1, "/export"))
+        await feed(dp, bot, make_message_update(1, "/export json"))
+        (csv_name, exported), (json_name, exported_json) = bot.session.documents
+        rows = json.loads(exported_json)
+        if len(rows) != memory["rows"]:
+            failures.append(f"{json_name}: {len(rows)} строк вместо {memory['rows']}")
+
+        # Импорт выгрузки новому пользователю: /import, затем файл
+        bot.session.files["export-1"] = exported
+        await feed(dp, bot, make_message_update(IMPORT_TG_ID, "/start"))
+        await feed(dp, bot, make_message_update(IMPORT_TG_ID, "/import"))
+        texts_before = len(bot.session.texts())
+
+        started = time.perf_counter()
+        await feed(dp, bot, make_document_update(IMPORT_TG_ID, "export-1", csv_name, len(exported)))
+        elapsed = time.perf_counter() - started
+        result = bot.session.texts()[texts_before:]
+        print(f"\nИмпорт через /import: {elapsed * 1000:.0f} мс вместе с разбором")
+        print("  " + (result[-1] if result else "нет ответа").replace("\n", "\n  "))
+
+        # Повторный импорт того же файла (подпись /import) пересекается с уже импортированным
+        await feed(dp, bot, make_document_update(IMPORT_TG_ID, "export-1", csv_name, len(exported), caption="/import"))
+        if bot.session.texts()[-1] != msg.FAILURE['import_overlap']:
+            failures.append(f"повторный импорт не отклонен: {bot.session.texts()[-1]!r}")
+
+        # Файл с ошибками
+        bot.session.files["broken"] = (
+            "state,tag,start_time,end_time,mood\n"
+            "work,,2020-01-01 10:00:00,2020-01-01 09:00:00,\n"
+            "dance,,2020-01-02 10:00:00,2020-01-02 11:00:00,9\n"
+        ).encode()
+        await feed(dp, bot, make_document_update(IMPORT_TG_ID, "broken", "broken.csv", 100, caption="/import"))
+        if "строка 2" not in bot.session.texts()[-1] or "строка 3" not in bot.session.texts()[-1]:
+            failures.append(f"ошибки файла не показаны: {bot.session.texts()[-1]!r}")
+
+        # Выгрузка импортированного совпадает с исходной без открытой сессии
+        await feed(dp, bot, make_message_update(IMPORT_TG_ID, "/export"))
+        _, reexported = bot.session.documents[-1]
+        closed = [line for line in exported.decode().splitlines() if not line.split(",")[3:4] == [""]]
+        if reexported.decode().splitlines() != closed:
+            failures.append("выгрузка импортированной истории отличается от исходной")
+
+        # После импорта открытой сессии нет: первое переключение должно учесть
+        # переход из последней импортированной сессии (сверяется с пересборкой ниже)
+        await feed(dp, bot, make_message_update(IMPORT_TG_ID, "/work"))
+        await feed(dp, bot, make_message_update(IMPORT_TG_ID, "/chill"))
+
+        # То же для /fix: новая сессия становится следующей для последней импортированной
+        await feed(dp, bot, make_message_update(FIX_TG_ID, "/start"))
+        await feed(dp, bot, make_document_update(FIX_TG_ID, "export-1", csv_name, len(exported), caption="/import"))
+        last_state = closed[-1].split(",")[0]
+        fix_state = next(state for state in msg.DEFAULT_STATES if state != last_state)
+        texts_before = len(bot.session.texts())
+        await feed(dp, bot, make_message_update(FIX_TG_ID, f"/fix 1m {fix_state}"))
+        if not any("разеделено" in text for text in bot.session.texts()[texts_before:]):
+            failures.append(f"/fix после импорта не выполнен: {bot.session.texts()[texts_before:]!r}")
+    finally:
+        await db.close_pool()
+
+    failures += await history.check_derived(DB_PATH)
+
+    if failures:
+        print("\nОшибки:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+    print("\nOK: выгрузка и импорт совпадают, итоги и переходы согласованы")
+
+
+if __name__ == '__main__':
+    asyncio.run(main_())
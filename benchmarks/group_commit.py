@@ -0,0 +1,252 @@
+"""
+Групповой коммит против коммита на каждую запись.
+
+Конкурентные "обработчики" (--concurrency корутин) выполняют rate_state
+и switch_state для разных пользователей. Варианты:
+    - per-op: каждая запись - своя транзакция и COMMIT (координатор
+      отключен, core._submit выполняет запись на писателе пула);
+    - window=N: координатор с окном N мс.
+Каждый вариант прогоняется при PRAGMA synchronous=NORMAL (как в боте,
+WAL без fsync на коммит) и FULL (fsync на каждый коммит), печатаются
+пропускная способность, задержка записи и средний размер пачки.
+
+Перед замерами проверяется:
+    - изоляция операций в пачке: исключение одной операции откатывает
+      только ее, соседние операции фиксируются;
+    - ошибка учета после коммита не останавливает координатор;
+    - после отмены задачи координатора ожидающая операция получает
+      ошибку, а новые не принимаются (а не ждут вечно).
+
+Запуск:
+    python -m benchmarks.group_commit --users 200 --writes 3000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_group_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+from benchmarks import history  # noqa: E402
+from data.messages import DEFAULT_STATES  # noqa: E402
+from database import core as db  # noqa: E402
+from database.group_commit import WriteCoordinator  # noqa: E402
+from utils import metrics  # noqa: E402
+
+
+async def session_ids(users: int) -> list[int]:
+    async with db._read() as conn:
+        cursor = await conn.execute("""
+            SELECT MAX(id) FROM time_sessions WHERE user_id <= ? AND end_time IS NOT NULL GROUP BY user_id
+        """, (users,))
+        return [row[0] for row in await cursor.fetchall()]
+
+
+async def check_isolation(sessions: list[int]) -> list[str]:
+    """Пачка из трех операций, средняя из которых падает после UPDATE"""
+    class Failed(Exception):
+        pass
+
+    def rate(session_id: int, mood: int, fail: bool = False):
+        async def write(conn) -> None:
+            await conn.execute("UPDATE time_sessions SET mood = ? WHERE id = ?", (mood, session_id))
+            if fail:
+                raise Failed()
+        return write
+
+    ids = sessions[:3]
+    coordinator = WriteCoordinator(db._write, window=0.05)
+    coordinator.start()
+    results = await asyncio.gather(
+        coordinator.submit(rate(ids[0], 1)),
+        coordinator.submit(rate(ids[1], 1, fail=True)),
+        coordinator.submit(rate(ids[2], 1)),
+        return_exceptions=True
+    )
+    await coordinator.close()
+
+    async with db._read() as conn:
+        cursor = await conn.execute(
+            "SELECT id, mood FROM time_sessions WHERE id IN (?, ?, ?)", ids
+        )
+        moods = dict(await cursor.fetchall())
+
+    failures = []
+    if coordinator.stats()["batches"] != 1:
+        failures.append(f"операции выполнены в {coordinator.stats()['batches']} пачках вместо 1")
+    if not isinstance(results[1], Failed) or results[0] is not None or results[2] is not None:
+        failures.append(f"результаты операций: {results}")
+    if moods[ids[0]] != 1 or moods[ids[2]] != 1:
+        failures.append("соседние операции не зафиксированы")
+    if moods[ids[1]] == 1:
+        failures.append("упавшая операция не откачена")
+
+    return failures
+
+
+async def check_failures(sessions: list[int]) -> list[str]:
+    """Ошибка учета пачки и отмена задачи координатора"""
+    async def rate(conn) -> int:
+        await conn.execute("UPDATE time_sessions SET mood = 3 WHERE id = ?", (sessions[0],))
+        return sessions[0]
+
+    def broken_observe(value: float) -> None:
+        raise RuntimeError("учет сломан")
+
+    failures = []
+    coordinator = WriteCoordinator(db._write)
+    coordinator.start()
+
+    observe = metrics.write_commit_seconds.observe
+    metrics.write_commit_seconds.observe = broken_observe
+    try:
+        result = await asyncio.wait_for(coordinator.submit(rate), 5)
+        if result != sessions[0]:
+            failures.append(f"при ошибке учета операция вернула {result!r}")
+    except Exception as e:
+        failures.append(f"при ошибке учета операция завершилась ошибкой: {e!r}")
+    finally:
+        metrics.write_commit_seconds.observe = observe
+
+    try:
+        await asyncio.wait_for(coordinator.submit(rate), 5)
+    except Exception as e:
+        failures.append(f"после ошибки учета координатор не работает: {e!r}")
+    await coordinator.close()
+
+    # Операция ждет в окне сбора пачки, когда задачу отменяют
+    coordinator = WriteCoordinator(db._write, window=1.0)
+    coordinator.start()
+    pending = asyncio.create_task(coordinator.submit(rate))
+    await asyncio.sleep(0.05)
+    coordinator._task.cancel()
+
+    try:
+        await asyncio.wait_for(pending, 5)
+        failures.append("операция в отмененном координаторе выполнена")
+    except asyncio.TimeoutError:
+        failures.append("операция в отмененном координаторе ждет вечно")
+    except RuntimeError:
+        pass
+
+    try:
+        await asyncio.wait_for(coordinator.submit(rate), 5)
+        failures.append("отмененный координатор принял операцию")
+    except asyncio.TimeoutError:
+        failures.append("операция, поставленная после отмены координатора, ждет вечно")
+    except RuntimeError:
+        pass
+    await coordinator.close()
+
+    return failures
+
+
+async def worker(queue: asyncio.Queue, timings: list[float], sessions: list[int], users: int) -> None:
+    states = list(DEFAULT_STATES)
+    rng = random.Random()
+
+    while True:
+        try:
+            i = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+
+        started = time.perf_counter()
+        if i % 2:
+            await db.rate_state(rng.choice(sessions), rng.randint(1, 5))
+        else:
+            await db.switch_state(tg_id=rng.randint(1, users), new_state=rng.choice(states))
+        timings.append(time.perf_counter() - started)
+
+
+async def run_variant(window: float | None, args: argparse.Namespace, sessions: list[int]) -> dict:
+    coordinator = db._writes
+    if window is None:
+        db._writes = None
+    else:
+        db._writes = WriteCoordinator(db._write, window=window / 1000, max_batch=args.max_batch)
+        db._writes.start()
+
+    queue = asyncio.Queue()
+    for i in range(args.writes):
+        queue.put_nowait(i)
+
+    timings = []
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(queue, timings, sessions, args.users) for _ in range(args.concurrency)))
+    wall = time.perf_counter() - started
+
+    stats = {}
+    if db._writes is not None:
+        await db._writes.close()
+        stats = db._writes.stats()
+    db._writes = coordinator
+
+    timings.sort()
+    return {
+        "throughput": args.writes / wall,
+        "p50_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[int(len(timings) * 0.95)] * 1000,
+        "avg_batch": stats.get("avg_batch", 1.0),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--writes', type=int, default=3000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--windows', default="0,2,5", help="окна координатора, мс")
+    args = parser.parse_args()
+
+    await db.init_db()
+    await history.generate(DB_PATH, args.users, args.days)
+    await db.open_pool(2)
+
+    # Координатор из open_pool (если задан WRITE_BATCH_WINDOW_MS) не нужен: варианты создают свои
+    if db._writes is not None:
+        await db._writes.close()
+        db._writes = None
+
+    sessions = await session_ids(args.users)
+    # Оценки сессий для проверки заранее отличаются от той, что ставит проверка
+    async with db._write() as conn:
+        await conn.execute("UPDATE time_sessions SET mood = 5 WHERE id IN (?, ?, ?)", sessions[:3])
+        await conn.commit()
+    failures = await check_isolation(sessions)
+    failures += await check_failures(sessions)
+    variants = [None] + [float(window) for window in args.windows.split(",")]
+
+    try:
+        print(f"Записей: {args.writes}, конкурентных обработчиков: {args.concurrency}")
+        print(f"{'synchronous':<13}{'вариант':<12}{'зап/с':>9}{'p50, мс':>10}{'p95, мс':>10}{'пачка':>8}")
+        for synchronous in ("NORMAL", "FULL"):
+            async with db._write() as conn:
+                await conn.execute(f"PRAGMA synchronous={synchronous}")
+
+            for window in variants:
+                result = await run_variant(window, args, sessions)
+                name = "per-op" if window is None else f"window={window:g}"
+                print(f"{synchronous:<13}{name:<12}{result['throughput']:>9.0f}"
+                      f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['avg_batch']:>8.1f}")
+    finally:
+        await db.close_pool()
+
+    if failures:
+        print("\nОшибки:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+    print("\nOK: ошибка операции откатывает только ее, сбои координатора не блокируют записи")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,166 @@
+"""
+Генератор синтетической истории time_sessions для бенчмарков.
+
+Пользователи получают непрерывную ленту сессий за последние `days` дней:
+сон раз в сутки, остальное - состояния DEFAULT_STATES с реалистичной
+длительностью, часть сессий с тегами из личного словаря пользователя и
+оценками. Последняя сессия каждого пользователя открыта, как у активного
+пользователя бота. Строки вставляются пачками через executemany, затем
+пересобираются daily/monthly итоги и переходы.
+
+База должна быть создана заранее (core.init_db) - генератор пишет
+в уже мигрированную схему.
+"""
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from database import rollup, transitions
+from database.pool import connect
+from utils import date
+
+TAG_WORDS = [
+    "python", "bot", "english", "gym", "reading", "work-project", "music",
+    "chess", "cooking", "walk", "study", "series", "cleaning", "meetup",
+]
+
+# Длительность сессии по состоянию, минуты (нижняя, верхняя граница)
+DURATIONS = {"sleep": (300, 540), "work": (30, 180), "study": (30, 150)}
+DEFAULT_DURATION = (10, 120)
+
+BATCH_ROWS = 200_000
+
+
+def _user_sessions(
+    rng: random.Random,
+    user_id: int,
+    states: dict[str, int],
+    tag_ids: list[int],
+    start: datetime,
+    now: datetime
+) -> list[tuple]:
+    names = [name for name in states if name != "sleep"]
+    rows = []
+
+    current = start
+    next_sleep = datetime.combine(start.date(), datetime.min.time()) + timedelta(hours=rng.randint(22, 25))
+    while True:
+        if current >= next_sleep and "sleep" in states:
+            name = "sleep"
+            next_sleep += timedelta(days=1)
+        else:
+            name = rng.choice(names)
+
+        low, high = DURATIONS.get(name, DEFAULT_DURATION)
+        end = current + timedelta(minutes=rng.randint(low, high), seconds=rng.randint(0, 59))
+
+        tag_id = rng.choice(tag_ids) if tag_ids and rng.random() < 0.4 else None
+        mood = rng.randint(1, 5) if rng.random() < 0.7 else None
+
+        if end >= now:
+            rows.append((user_id, states[name], date.to_epoch(current), None, tag_id, None))
+            return rows
+
+        rows.append((user_id, states[name], date.to_epoch(current), date.to_epoch(end), tag_id, mood))
+        current = end
+
+
+def populate(db_path: str, users: int, days: int, seed: int = 1) -> int:
+    """
+    Добавить `users` пользователей (tg_id = users.id = 1..users) с историей за `days` дней.
+
+    Returns:
+        Количество вставленных сессий
+    """
+    rng = random.Random(seed)
+    now = date.get_now()
+    start = now - timedelta(days=days)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous = OFF")
+    states = dict(conn.execute("SELECT name, id FROM states"))
+
+    conn.executemany(
+        "INSERT INTO users (id, tg_id, username, full_name) VALUES (?, ?, ?, ?)",
+        [(user_id, user_id, f"user{user_id}", f"User {user_id}") for user_id in range(1, users + 1)]
+    )
+
+    total = 0
+    batch = []
+    for user_id in range(1, users + 1):
+        words = rng.sample(TAG_WORDS, rng.randint(0, 8))
+        tag_ids = [
+            conn.execute("INSERT INTO tags (user_id, name) VALUES (?, ?) RETURNING id", (user_id, word)).fetchone()[0]
+            for word in words
+        ]
+
+        # Пользователи пришли в бота в разное время
+        user_start = start + timedelta(days=rng.random() * days * 0.3)
+        batch += _user_sessions(rng, user_id, states, tag_ids, user_start, now)
+
+        if len(batch) >= BATCH_ROWS or user_id == users:
+            conn.executemany("""
+                INSERT INTO time_sessions (user_id, state_id, start_time, end_time, tag_id, mood)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, batch)
+            total += len(batch)
+            batch = []
+
+    conn.commit()
+    conn.close()
+
+    return total
+
+
+async def rebuild_derived(db_path: str) -> None:
+    """Итоги и переходы для истории, вставленной мимо core"""
+    conn = await connect(db_path)
+    try:
+        await rollup.rebuild_daily_totals(conn)
+        await transitions.rebuild_transitions(conn)
+    finally:
+        await conn.close()
+
+
+# Производные таблицы, которые core поддерживает инкрементально
+DERIVED = {
+    "daily_state_totals": "SELECT * FROM daily_state_totals ORDER BY 1, 2, 3",
+    "monthly_state_totals": "SELECT * FROM monthly_state_totals ORDER BY 1, 2, 3",
+    "state_transitions": "SELECT * FROM state_transitions WHERE count > 0 ORDER BY 1, 2, 3, 4, 5",
+}
+
+
+def derived_snapshot(db_path: str) -> dict[str, list]:
+    conn = sqlite3.connect(db_path)
+    try:
+        return {table: conn.execute(query).fetchall() for table, query in DERIVED.items()}
+    finally:
+        conn.close()
+
+
+async def check_derived(db_path: str) -> list[str]:
+    """Сравнить производные таблицы с полной пересборкой; база должна быть закрыта"""
+    incremental = derived_snapshot(db_path)
+    await rebuild_derived(db_path)
+    rebuilt = derived_snapshot(db_path)
+
+    return [
+        f"{table}: {len(set(incremental[table]) ^ set(rebuilt[table]))} строк отличаются от пересборки"
+        for table in DERIVED
+        if incremental[table] != rebuilt[table]
+    ]
+
+
+async def generate(db_path: str, users: int, days: int, seed: int = 1) -> dict:
+    """populate + rebuild_derived; возвращает размер и время генерации"""
+    started = time.perf_counter()
+    sessions = populate(db_path, users, days, seed)
+    await rebuild_derived(db_path)
+
+    return {
+        "users": users,
+        "days": days,
+        "sessions": sessions,
+        "generate_s": round(time.perf_counter() - started, 2),
+    }
@@ -0,0 +1,278 @@
+"""
+Нагрузочный прогон бота целиком: апдейты идут через Dispatcher.feed_update
+с теми же роутерами, что и в main.py, а Bot API заменен записывающей
+сессией (benchmarks.stub_bot), поэтому сеть не нужна.
+
+На временной базе создаются N пользователей с историей за последние дни.
+Каждый пользователь - отдельная корутина, которая шлет апдейты по одному,
+как Telegram для одного чата: смены состояний из DEFAULT_STATES с тегами,
+/stats, /history, листание дней (date_history / date_statistics), полная
+статистика и оценки только что закрытых сессий (rate_time_session по
+клавиатуре, которую бот прислал в ответ на смену).
+
+Время апдейта - весь feed_update, включая middleware диспетчера. Обработчик
+определяется inner-middleware на каждом роутере. В конце печатается
+пропускная способность и p50/p95/p99 по обработчикам.
+
+Запуск:
+    python -m benchmarks.load_test --users 50 --actions 40 --days 14
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_load_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+from aiogram.types import InlineKeyboardMarkup, Update  # noqa: E402
+
+import main  # noqa: E402
+from benchmarks.stub_bot import make_bot, make_callback_update, make_message_update  # noqa: E402
+from data.messages import DEFAULT_STATES  # noqa: E402
+from database import core as db  # noqa: E402
+from database import rollup, transitions  # noqa: E402
+from utils import date  # noqa: E402
+
+TAGS = ["", "", "python", "bot", "english", "gym", "reading"]
+
+
+def populate(users: int, days: int) -> None:
+    """Пользователи с tg_id 1..users и закрытыми сессиями за последние `days` дней"""
+    conn = sqlite3.connect(DB_PATH)
+    states = [row[0] for row in conn.execute("SELECT id FROM states")]
+
+    conn.executemany(
+        "INSERT INTO users (tg_id, username, full_name) VALUES (?, ?, ?)",
+        [(tg_id, f"user{tg_id}", f"User {tg_id}") for tg_id in range(1, users + 1)]
+    )
+
+    now = date.get_now()
+    start = datetime.combine(now.date() - timedelta(days=days), datetime.min.time())
+    for user_id in range(1, users + 1):
+        rows = []
+        current = start
+        while True:
+            end = current + timedelta(seconds=random.randint(300, 5400))
+            if end >= now:
+                break
+
+            rows.append((
+                user_id, random.choice(states), date.to_epoch(current),
+                date.to_epoch(end), random.randint(1, 5)
+            ))
+            current = end
+
+        conn.executemany("""
+            INSERT INTO time_sessions (user_id, state_id, start_time, end_time, mood)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+
+    conn.commit()
+    conn.close()
+
+
+async def rebuild_derived() -> None:
+    """Итоги и переходы для вставленной напрямую истории"""
+    async with db._write() as conn:
+        await rollup.rebuild_daily_totals(conn)
+        await transitions.rebuild_transitions(conn)
+
+
+def probe_middleware(routers) -> None:
+    """Записать в data["probe"] имя обработчика, который принял апдейт"""
+    async def probe(handler, event, data):
+        if "probe" in data:
+            data["probe"]["handler"] = data["handler"].callback.__name__
+        return await handler(event, data)
+
+    for router in routers:
+        router.message.middleware(probe)
+        router.callback_query.middleware(probe)
+
+
+def rate_session_id(requests: list, tg_id: int) -> int | None:
+    """id сессии из клавиатуры оценки среди ответов бота пользователю"""
+    for request in reversed(requests):
+        if not isinstance(request, SendMessage) or request.chat_id != tg_id:
+            continue
+        if not isinstance(request.reply_markup, InlineKeyboardMarkup):
+            continue
+
+        for row in request.reply_markup.inline_keyboard:
+            for button in row:
+                if button.callback_data and button.callback_data.startswith("rate_time_session"):
+                    return int(button.callback_data.split(":")[1])
+
+    return None
+
+
+class SimulatedUser:
+    """Пользователь, который шлет апдейты по одному и ждет ответа бота"""
+
+    def __init__(self, tg_id: int, days: int, rng: random.Random) -> None:
+        self.tg_id = tg_id
+        self.days = days
+        self.rng = rng
+        self.unrated: int | None = None
+
+    def next_update(self) -> dict:
+        rng = self.rng
+
+        if self.unrated is not None and rng.random() < 0.5:
+            session_id, self.unrated = self.unrated, None
+            return make_callback_update(self.tg_id, f"rate_time_session:{session_id}:{rng.randint(1, 5)}")
+
+        action = rng.choices(
+            ["switch", "stats", "history", "date_history", "date_statistics", "full_stats"],
+            weights=[5, 2, 2, 2, 2, 1]
+        )[0]
+
+        if action == "switch":
+            text = f"/{rng.choice(list(DEFAULT_STATES))} {rng.choice(TAGS)}".rstrip()
+            return make_message_update(self.tg_id, text)
+        if action == "stats":
+            return make_message_update(self.tg_id, "/stats")
+        if action == "history":
+            return make_message_update(self.tg_id, "/history")
+        if action == "full_stats":
+            return make_callback_update(self.tg_id, f"full_stats:{rng.choice(['week', 'month'])}")
+
+        day = date.get_now().date() - timedelta(days=rng.randint(1, self.days))
+        return make_callback_update(self.tg_id, f"{action}:{day}")
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def add(self, handler: str, elapsed: float, failed: bool) -> None:
+        self.latencies[handler].append(elapsed)
+        if failed:
+            self.errors[handler] += 1
+
+
+async def run_user(
+    dp: Dispatcher,
+    bot: Bot,
+    user: SimulatedUser,
+    actions: int,
+    recorder: Recorder
+) -> None:
+    requests = bot.session.requests
+
+    for _ in range(actions):
+        update = Update.model_validate(user.next_update(), context={"bot": bot})
+        probe = {}
+        sent_before = len(requests)
+
+        started = time.perf_counter()
+        failed = False
+        try:
+            await dp.feed_update(bot, update, probe=probe)
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - started
+
+        handler = probe.get("handler", "unhandled")
+        recorder.add(handler, elapsed, failed)
+
+        if handler == "change_state_cmd":
+            session_id = rate_session_id(requests[sent_before:], user.tg_id)
+            if session_id is not None:
+                user.unrated = session_id
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * q))]
+
+
+def report(recorder: Recorder, wall: float, api_calls: int) -> None:
+    total = sum(len(values) for values in recorder.latencies.values())
+
+    print(f"Апдейтов: {total} за {wall:.2f} с, {total / wall:.1f} апд/с, вызовов Bot API: {api_calls}")
+    print(f"\n{'обработчик':<24}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}"
+          f"{'p99, мс':>10}{'max, мс':>10}{'ошибок':>8}")
+
+    ordered = sorted(recorder.latencies.items(), key=lambda item: -len(item[1]))
+    for handler, values in ordered:
+        print(f"{handler:<24}{len(values):>8}"
+              f"{percentile(values, 0.50) * 1000:>10.2f}"
+              f"{percentile(values, 0.95) * 1000:>10.2f}"
+              f"{percentile(values, 0.99) * 1000:>10.2f}"
+              f"{max(values) * 1000:>10.2f}"
+              f"{recorder.errors.get(handler, 0):>8}")
+
+    every = [value for values in recorder.latencies.values() for value in values]
+    print(f"{'всего':<24}{len(every):>8}"
+          f"{statistics.median(every) * 1000:>10.2f}"
+          f"{percentile(every, 0.95) * 1000:>10.2f}"
+          f"{percentile(every, 0.99) * 1000:>10.2f}"
+          f"{max(every) * 1000:>10.2f}"
+          f"{sum(recorder.errors.values()):>8}")
+
+
+async def run() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--actions', type=int, default=40, help="апдейтов на пользователя")
+    parser.add_argument('--days', type=int, default=14, help="дней истории на пользователя")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING',
+                        help="уровень логов бота на время прогона (INFO пишет строку на каждую смену)")
+    args = parser.parse_args()
+
+    logging.getLogger('TimeTracker').setLevel(args.log_level)
+    random.seed(args.seed)
+
+    await db.init_db()
+    populate(args.users, args.days)
+    await db.open_pool()
+    await rebuild_derived()
+
+    bot = make_bot()
+    dp = main.build_dispatcher(MemoryStorage())
+    probe_middleware(dp.chain_tail)
+
+    recorder = Recorder()
+    users = [
+        SimulatedUser(tg_id, args.days, random.Random(args.seed * 100_003 + tg_id))
+        for tg_id in range(1, args.users + 1)
+    ]
+
+    try:
+        await dp.emit_startup(bot=bot)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_user(dp, bot, user, args.actions, recorder) for user in users))
+        wall = time.perf_counter() - started
+
+        await dp.emit_shutdown(bot=bot)
+    finally:
+        pool = db.pool_stats()
+        await db.close_pool()
+
+    report(recorder, wall, len(bot.session.requests))
+    print(f"\nпул: {pool}")
+    print(f"кэши: {db.cache_stats()}")
+
+    if recorder.errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
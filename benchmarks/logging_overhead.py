@@ -0,0 +1,138 @@
+"""
+Сколько времени event loop тратит на запись лога.
+
+Сравниваются:
+    - sync: RotatingFileHandler и консоль прямо на логгере (как было до очереди);
+    - queue: setup_logging - запись в очередь, диск в потоке QueueListener;
+    - queue+json: то же с JsonFormatter;
+    - queue+rate: то же с ограничением INFO-записей (--rate в секунду с места вызова).
+
+Для каждого варианта печатается время вызова logger.info на стороне
+вызывающего кода и число строк в файле после stop_logging(), которая
+должна дописать всю очередь. Консоль направляется в /dev/null.
+
+Запуск:
+    python -m benchmarks.logging_overhead --records 20000
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+sys.path.append(os.getcwd())
+
+from utils import bot_logging as bot_log  # noqa: E402
+
+LOG_FILE = "bench.log"
+
+
+def count_lines(path: Path) -> int:
+    if not path.exists():
+        return 0
+
+    with open(path, encoding="utf-8") as file:
+        return sum(1 for _ in file)
+
+
+def setup_sync(name: str) -> list[logging.Handler]:
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.handlers.clear()
+
+    file_handler = RotatingFileHandler(bot_log.LOG_DIR / LOG_FILE, maxBytes=2 ** 30, encoding="utf-8")
+    file_handler.setFormatter(bot_log.FORMATTER)
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(bot_log.FORMATTER)
+
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+    return [file_handler, console_handler]
+
+
+def emit(logger: logging.Logger, records: int) -> list[float]:
+    timings = []
+    for i in range(records):
+        started = time.perf_counter()
+        logger.info("Пользователь %s (%s) изменил состояние с %s (%s) на %s (%s)",
+                    "User", i, "work", "python", "chill", "")
+        timings.append(time.perf_counter() - started)
+
+    return timings
+
+
+def run_variant(variant: str, records: int, rate: float) -> tuple[list[float], float, int]:
+    bot_log.LOG_DIR = Path(tempfile.mkdtemp(prefix="tt_logs_"))
+    name = f"Bench.{variant}"
+
+    if variant == "sync":
+        handlers = setup_sync(name)
+    else:
+        bot_log.setup_logging(
+            name=name, log_file=LOG_FILE,
+            json_format=variant == "queue+json",
+            info_rate=rate if variant == "queue+rate" else 0
+        )
+
+    logger = logging.getLogger(name)
+    started = time.perf_counter()
+    timings = emit(logger, records)
+    loop_time = time.perf_counter() - started
+
+    if variant == "sync":
+        for handler in handlers:
+            handler.close()
+    else:
+        bot_log.stop_logging()
+
+    logger.handlers.clear()
+    return timings, loop_time, count_lines(bot_log.LOG_DIR / LOG_FILE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--rate', type=float, default=20)
+    args = parser.parse_args()
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    try:
+        results = {
+            variant: run_variant(variant, args.records, args.rate)
+            for variant in ("sync", "queue", "queue+json", "queue+rate")
+        }
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print(f"Записей: {args.records}")
+    print(f"{'вариант':<12}{'p50, мкс':>10}{'p99, мкс':>10}{'всего, мс':>11}{'строк':>8}")
+    for variant, (timings, loop_time, lines) in results.items():
+        timings.sort()
+        print(f"{variant:<12}{statistics.median(timings) * 1e6:>10.1f}"
+              f"{timings[int(len(timings) * 0.99)] * 1e6:>10.1f}"
+              f"{loop_time * 1000:>11.1f}{lines:>8}")
+
+    failures = [
+        f"{variant}: в файле {lines} строк из {args.records}"
+        for variant, (_, _, lines) in results.items()
+        if variant != "queue+rate" and lines != args.records
+    ]
+    sampled = results["queue+rate"][2]
+    if not 0 < sampled < args.records:
+        failures.append(f"queue+rate: в файле {sampled} строк, ограничение не сработало")
+
+    if failures:
+        print("\nОшибки:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+    print("\nOK: очередь дописана при остановке")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Проверка планов запросов database/core.py на пользователе с большой историей.
+
+Скрипт вызывает настоящие функции core.py, перехватывает выполненный SQL
+через trace callback соединений пула и прогоняет каждый запрос через
+EXPLAIN QUERY PLAN. Завершается с ошибкой, если какой-либо запрос
+сортирует результат во временном B-дереве или полностью сканирует time_sessions.
+
+Запуск:
+    python -m benchmarks.query_plans --sessions 100000
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_plans_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+from database import core as db  # noqa: E402
+from utils import date  # noqa: E402
+
+TG_ID = 1
+
+# Группировка строк одного окна (USE TEMP B-TREE FOR GROUP BY) допустима,
+# сортировка всей истории и полный скан - нет
+FORBIDDEN = ('USE TEMP B-TREE FOR ORDER BY', 'SCAN time_sessions', 'SCAN ts')
+
+
+def populate(sessions: int) -> None:
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("INSERT INTO users (tg_id, full_name) VALUES (?, ?)", (TG_ID, "Bench"))
+    # Соседи, чтобы индекс по user_id был избирательным
+    conn.executemany(
+        "INSERT INTO users (tg_id, full_name) VALUES (?, ?)",
+        [(tg_id, "Other") for tg_id in range(2, 12)]
+    )
+
+    states = [row[0] for row in conn.execute("SELECT id FROM states")]
+    start = datetime.now() - timedelta(minutes=20 * (sessions + 1))
+    rows = []
+    for user_id in range(1, 12):
+        count = sessions if user_id == 1 else sessions // 100
+        current = start
+        for i in range(count):
+            end = current + timedelta(minutes=20)
+            rows.append((
+                user_id, states[i % len(states)], date.to_epoch(current), date.to_epoch(end)
+            ))
+            current = end
+
+    conn.executemany("""
+        INSERT INTO time_sessions (user_id, state_id, start_time, end_time)
+        VALUES (?, ?, ?, ?)
+    """, rows)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=100_000)
+    args = parser.parse_args()
+
+    await db.init_db()
+    populate(args.sessions)
+
+    pool = await db.open_pool(1)
+    statements: list[str] = []
+    for conn in [pool._writer, *pool._all_readers]:
+        await conn.set_trace_callback(statements.append)
+
+    day_start, day_end = date.day_bounds(date.get_now() - timedelta(days=3))
+    calls = {
+        "switch_state": lambda: db.switch_state(tg_id=TG_ID, new_state="work"),
+        "get_current_state": lambda: db.get_current_state(tg_id=TG_ID),
+        "get_user_states(limit=10)": lambda: db.get_user_states(tg_id=TG_ID, limit=10),
+        "get_user_states(limit=2)": lambda: db.get_user_states(tg_id=TG_ID, limit=2),
+        "get_user_states_between(day)": lambda: db.get_user_states_between(
+            tg_id=TG_ID, start=day_start, end=day_end
+        ),
+        "get_user_states_page()": lambda: db.get_user_states_page(tg_id=TG_ID),
+        "get_user_states_page(before=day)": lambda: db.get_user_states_page(
+            tg_id=TG_ID, before=(date.to_epoch(day_start), 0)
+        ),
+        "get_user_states_page(after=oldest)": lambda: db.get_user_states_page(
+            tg_id=TG_ID, after=(0, 0)
+        ),
+        "get_state_totals_between(day)": lambda: db.get_state_totals_between(
+            tg_id=TG_ID, start=day_start, end=day_end
+        ),
+        "get_user_states_by_date": lambda: db.get_user_states_by_date(
+            tg_id=TG_ID, target_date=day_start
+        ),
+        "get_state_by_id": lambda: db.get_state_by_id(1, tg_id=TG_ID),
+        "get_state_transitions": lambda: db.get_state_transitions(tg_id=TG_ID, from_state="work"),
+        "count_session_month_days": lambda: db.count_session_month_days(tg_id=TG_ID, limit=8),
+    }
+
+    failed = False
+    try:
+        for name, call in calls.items():
+            statements.clear()
+            started = time.perf_counter()
+            await call()
+            elapsed = (time.perf_counter() - started) * 1000
+
+            print(f"\n== {name}: {elapsed:.2f} мс")
+            async with pool.reader() as conn:
+                for sql in statements:
+                    if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT')):
+                        continue
+
+                    cursor = await conn.execute(f"EXPLAIN QUERY PLAN {sql}")
+                    plan = [row[3] for row in await cursor.fetchall()]
+                    print(" ".join(sql.split())[:120])
+                    for line in plan:
+                        bad = any(line.startswith(marker) for marker in FORBIDDEN)
+                        failed |= bad
+                        print(f"    {'!!' if bad else '  '} {line}")
+    finally:
+        await db.close_pool()
+
+    if failed:
+        print("\nОбнаружена сортировка или полный скан time_sessions")
+        sys.exit(1)
+
+    print("\nOK: запросы идут по индексам без сортировки")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
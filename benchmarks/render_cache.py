@@ -0,0 +1,165 @@
+"""
+Листание прошедших дней в истории и статистике с кэшем отрисованных сообщений.
+
+Скрипт заполняет временную базу историей, несколько раз проходит
+кнопками ← / → по последним дням (как pagination_date_kb), печатает
+задержку первого и повторных проходов, долю попаданий и память кэша.
+Затем меняет оценку сессии через rate_state - в этом процессе и в
+отдельном процессе, как другой экземпляр бота на той же базе, - и
+проверяет, что следующий показ дня каждый раз отрисован заново.
+
+Запуск:
+    python -m benchmarks.render_cache --days 30 --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_render_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+from database import core as db  # noqa: E402
+from handlers import user_history, user_statistics  # noqa: E402
+from utils import date, render_cache  # noqa: E402
+
+TG_ID = 1
+
+
+class _User:
+    id = TG_ID
+
+
+class _Message:
+    """Сообщение бота: запоминает последний текст вместо запроса к API"""
+
+    text: str | None = None
+
+    async def edit_text(self, text: str, reply_markup=None) -> None:
+        self.text = text
+
+
+class FakeCallback:
+    """Минимум CallbackQuery, который нужен answer_or_edit"""
+
+    def __init__(self) -> None:
+        self.from_user = _User()
+        self.message = _Message()
+
+
+def populate(days: int) -> None:
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("INSERT INTO users (tg_id, full_name) VALUES (?, ?)", (TG_ID, "Bench"))
+    states = [row[0] for row in conn.execute("SELECT id FROM states")]
+
+    rows = []
+    current = datetime.combine(date.get_now().date() - timedelta(days=days), datetime.min.time())
+    today = datetime.combine(date.get_now().date(), datetime.min.time())
+    while current < today:
+        end = current + timedelta(seconds=random.randint(300, 5400))
+        rows.append((random.choice(states), date.to_epoch(current), date.to_epoch(end), random.randint(1, 5)))
+        current = end
+
+    conn.executemany("""
+        INSERT INTO time_sessions (user_id, state_id, start_time, end_time, mood)
+        VALUES (1, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+
+
+async def walk(days: list, callback: FakeCallback) -> list[float]:
+    timings = []
+    for day in days:
+        for send in (user_history.send_day_history, user_statistics.send_day_statistics):
+            started = time.perf_counter()
+            await send(callback, day)
+            timings.append(time.perf_counter() - started)
+
+    return timings
+
+
+def rate_elsewhere(session_id: int, mood: int) -> None:
+    """rate_state в отдельном процессе на той же базе"""
+    subprocess.run([
+        sys.executable, "-c",
+        "import asyncio; from database import core; "
+        f"asyncio.run(core.rate_state({session_id}, {mood}))"
+    ], check=True, env=os.environ, cwd=os.getcwd())
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    await db.init_db()
+    populate(args.days)
+    await db.open_pool(2)
+
+    callback = FakeCallback()
+    today = date.get_now().date()
+    # Назад до самого старого дня и обратно, как кнопками ← и →
+    back = [today - timedelta(days=offset) for offset in range(1, args.days + 1)]
+    days = back + back[::-1]
+
+    try:
+        cold = await walk(days, callback)
+        warm = []
+        for _ in range(args.rounds - 1):
+            warm += await walk(days, callback)
+
+        print(f"Дней: {args.days}, показов за проход: {len(cold)}")
+        for name, values in (("первый проход", cold), ("повторные", warm)):
+            print(f"{name:>14}: p50 {statistics.median(values) * 1000:6.3f} мс, "
+                  f"среднее {statistics.mean(values) * 1000:6.3f} мс")
+        print(f"кэш: {render_cache.stats()}")
+
+        # Правка сессии прошедшего дня должна сбросить его сообщения
+        day = back[0]
+        await user_history.send_day_history(callback, day)
+        before = callback.message.text
+
+        async with db._read() as conn:
+            cursor = await conn.execute("""
+                SELECT id, mood FROM time_sessions
+                WHERE user_id = 1 AND start_time >= ? ORDER BY start_time LIMIT 1
+            """, (date.to_epoch(date.day_bounds(day)[0]),))
+            session_id, mood = await cursor.fetchone()
+
+        await db.rate_state(session_id, mood % 5 + 1)
+        await user_history.send_day_history(callback, day)
+        after = callback.message.text
+
+        # Запись другого процесса: кэш этого процесса о ней не знает
+        rate_elsewhere(session_id, (mood + 1) % 5 + 1)
+        await user_history.send_day_history(callback, day)
+        after_elsewhere = callback.message.text
+    finally:
+        await db.close_pool()
+
+    failures = []
+    if before == after:
+        failures.append("после rate_state показано старое сообщение")
+    if after == after_elsewhere:
+        failures.append("после rate_state в другом процессе показано старое сообщение")
+
+    if failures:
+        print("\nОшибки:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+    print("\nOK: после записи, в том числе из другого процесса, день отрисован заново")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+"""
+Правки сессий: update_state_info, update_states_info, retag_sessions, rate_day.
+
+На сгенерированной истории (benchmarks.history) выполняются одиночные
+правки, пакет правок, замена тега у всех сессий и оценка целого дня.
+Печатается время каждой операции и количество SQL-запросов, затем
+проверяется:
+    - daily/monthly итоги и переходы совпадают с полной пересборкой
+      из time_sessions (инкрементальный пересчет ничего не потерял);
+    - чужая сессия не меняется ни одиночной, ни пакетной правкой;
+    - некорректные правки пропускаются;
+    - mood=None оставляет оценку, CLEAR_MOOD снимает ее.
+
+Запуск:
+    python -m benchmarks.session_edits --users 20 --days 120 --edits 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_edits_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+from benchmarks import history  # noqa: E402
+from data.messages import DEFAULT_STATES  # noqa: E402
+from database import core as db  # noqa: E402
+from utils import date  # noqa: E402
+from utils import metrics  # noqa: E402
+
+
+def sessions_of(user_id: int) -> list[int]:
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return [row[0] for row in conn.execute(
+            "SELECT id FROM time_sessions WHERE user_id = ? AND end_time IS NOT NULL", (user_id,)
+        )]
+    finally:
+        conn.close()
+
+
+def session(state_id: int) -> tuple:
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return conn.execute(
+            "SELECT state_id, tag_id, mood FROM time_sessions WHERE id = ?", (state_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+async def timed(name: str, call) -> object:
+    metrics.reset()
+    started = time.perf_counter()
+    result = await call
+    elapsed = time.perf_counter() - started
+    statements = int(sum(metrics.sql_statements._series.values()))
+    print(f"  {name:<38}{elapsed * 1000:>9.2f} мс{statements:>7} SQL  -> {result}")
+    return result
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--edits', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    states = list(DEFAULT_STATES)
+
+    await db.init_db()
+    info = await history.generate(DB_PATH, args.users, args.days, args.seed)
+    print(f"История: {info['sessions']} сессий")
+
+    await db.open_pool(2)
+    failures = []
+    try:
+        own = sessions_of(1)
+        foreign = sessions_of(2)
+
+        print("Операции (tg_id = users.id = 1):")
+        for kind, edit in (
+            ("состояние", {"state_name": rng.choice(states)}),
+            ("тег", {"tag": "  новый   тег "}),
+            ("оценка", {"mood": 4}),
+            ("все поля", {"state_name": rng.choice(states), "tag": "", "mood": db.CLEAR_MOOD}),
+        ):
+            await timed(f"update_state_info: {kind}", db.update_state_info(rng.choice(own), edit, tg_id=1))
+
+        edits = [
+            (rng.choice(own), rng.choice([
+                {"mood": rng.randint(1, 5)},
+                {"tag": rng.choice(history.TAG_WORDS)},
+                {"state_name": rng.choice(states)},
+            ]))
+            for _ in range(args.edits)
+        ]
+        await timed(f"update_states_info: {len(edits)} правок", db.update_states_info(edits, tg_id=1))
+        await timed("retag_sessions", db.retag_sessions(1, history.TAG_WORDS[0], "переименованный"))
+        await timed("retag_sessions: снять тег", db.retag_sessions(1, history.TAG_WORDS[1], None))
+        await timed("rate_day", db.rate_day(1, date.get_now() - timedelta(days=3), 2))
+
+        # Чужие сессии и некорректные правки
+        target = foreign[0]
+        before = session(target)
+        if await db.update_state_info(target, {"mood": 1, "tag": "чужой"}, tg_id=1):
+            failures.append("одиночная правка чужой сессии вернула True")
+        changed = await db.update_states_info([(target, {"state_name": states[0]}), (own[0], {"mood": 3})], tg_id=1)
+        if changed != 1:
+            failures.append(f"пакет с чужой сессией изменил {changed} сессий вместо 1")
+        if session(target) != before:
+            failures.append("чужая сессия изменена")
+
+        for bad in ({"mood": 7}, {"state_name": "нет такого"}, {}):
+            if await db.update_state_info(own[0], bad, tg_id=1):
+                failures.append(f"некорректная правка {bad} применена")
+
+        # mood=None не меняет оценку, CLEAR_MOOD снимает ее
+        await db.update_state_info(own[1], {"mood": 4}, tg_id=1)
+        await db.update_state_info(own[1], {"tag": "без оценки", "mood": None}, tg_id=1)
+        if session(own[1])[2] != 4:
+            failures.append(f"mood=None изменил оценку: {session(own[1])[2]}")
+        await db.update_state_info(own[1], {"mood": db.CLEAR_MOOD}, tg_id=1)
+        if session(own[1])[2] is not None:
+            failures.append("CLEAR_MOOD не снял оценку")
+    finally:
+        await db.close_pool()
+
+    failures += await history.check_derived(DB_PATH)
+
+    if failures:
+        print("\nОшибки:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+    print("\nOK: итоги и переходы совпадают с пересборкой, чужие сессии не изменены")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
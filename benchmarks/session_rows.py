@@ -0,0 +1,218 @@
+"""
+Стоимость строк сессий: dict(zip(columns, row)) с разбором времени в
+форматтере против SessionRow, разобранной один раз в row_factory.
+
+Скрипт заполняет временную базу днем из N сессий, читает его тем же
+запросом, что и get_user_states_between, и рендерит историю дня и список
+сессий для правки (как /history и choose_state_to_change) двумя путями.
+Проверяет, что текст совпадает, и печатает задержку, CPU,
+пик памяти (tracemalloc) и размер строк, которые живут до ответа.
+
+Запуск:
+    python -m benchmarks.session_rows --sessions 500 --runs 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_rows_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+from data import messages as msg  # noqa: E402
+from database import core as db  # noqa: E402
+from database import sql  # noqa: E402
+from database.pool import connect  # noqa: E402
+from database.rows import session_row  # noqa: E402
+from utils import date  # noqa: E402
+
+TG_ID = 1
+
+QUERY = f"""
+    SELECT {sql.SESSION_COLUMNS}
+    FROM time_sessions ts
+    JOIN states s ON ts.state_id = s.id
+    {sql.TAG_JOIN}
+    WHERE {sql.WINDOW_FILTER}
+    ORDER BY ts.start_time DESC
+"""
+
+
+def populate(sessions: int) -> tuple[datetime, datetime]:
+    """Вчерашний день из `sessions` закрытых сессий"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("INSERT INTO users (tg_id, full_name) VALUES (?, ?)", (TG_ID, "Bench"))
+    conn.executemany("INSERT INTO tags (user_id, name) VALUES (1, ?)", [("python",), ("book",)])
+    states = [row[0] for row in conn.execute("SELECT id FROM states")]
+
+    day_start, day_end = date.day_bounds(date.get_now() - timedelta(days=1))
+    step = date.DAY_SECONDS // sessions
+    rows = []
+    for i in range(sessions):
+        start = date.to_epoch(day_start) + i * step
+        rows.append((
+            random.choice(states), start, start + step,
+            random.choice((None, 1, 2)), random.choice((None, 1, 2, 3, 4, 5))
+        ))
+
+    conn.executemany("""
+        INSERT INTO time_sessions (user_id, state_id, start_time, end_time, tag_id, mood)
+        VALUES (1, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+
+    return day_start, day_end
+
+
+def legacy_format_states_history(states: list[dict]) -> str:
+    """format_states_history до SessionRow: время - секунды из базы"""
+    ret_str = ""
+
+    for state in states:
+        state_name = state["state_name"]
+        start_time = date.format_time_hhmm(state['start_time'])
+        if state['end_time']:
+            end_time = date.format_time_hhmm(state['end_time'])
+        else:
+            end_time = "now"
+
+        duration_seconds = date.calculate_duration_seconds(
+            start_time=state['start_time'],
+            end_time=state.get('end_time'),
+            duration_seconds=state.get("duration_seconds")
+        )
+        mood = state.get("mood")
+        tag = state.get("tag", "")
+
+        duration_str = date.format_time(duration_seconds)
+
+        mood_str = "| " + ("*" * mood if mood else "#")
+
+        tag_str = f" | 🏷️ {tag}" if tag else ""
+
+        ret_str += f"""<b>{state_name}</b> {tag_str}
+{start_time} - {end_time} | {duration_str} {mood_str}\n\n"""
+
+    return ret_str
+
+
+def legacy_render(rows: list[tuple], columns: list[str]) -> tuple[str, list[str]]:
+    states = [dict(zip(columns, row)) for row in rows]
+
+    buttons = []
+    for state in states:
+        start_time = date.to_datetime(state['start_time'])
+        start_time_str = date.format_time_hhmm(start_time)
+        end_time = date.format_time_hhmm(
+            date.to_datetime(state['end_time']) if state['end_time'] else date.get_now()
+        )
+        buttons.append(f"{start_time_str}-{end_time} | {state['state_name']}")
+
+    return legacy_format_states_history(states), buttons
+
+
+def render(states: list) -> tuple[str, list[str]]:
+    buttons = []
+    for state in states:
+        start_time = date.format_time_hhmm(state.start_time)
+        end_time = date.format_time_hhmm(state.end_time or date.get_now())
+        buttons.append(f"{start_time}-{end_time} | {state.state_name}")
+
+    return msg.format_states_history(states), buttons
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * q))]
+
+
+def peak_memory(call) -> int:
+    """Пик памяти Python за вызов, байт"""
+    tracemalloc.start()
+    try:
+        call()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def retained_size(rows: list) -> int:
+    """Размер строк вместе с собственными значениями (без общих строк-имен)"""
+    total = sys.getsizeof(rows)
+    for row in rows:
+        total += sys.getsizeof(row)
+        values = row.values() if isinstance(row, dict) else (getattr(row, name) for name in row.__slots__)
+        total += sum(sys.getsizeof(value) for value in values if not isinstance(value, str))
+
+    return total
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    await db.init_db()
+    day_start, day_end = populate(args.sessions)
+
+    conn = await connect(DB_PATH)
+    params = {"user_id": 1, "start": date.to_epoch(day_start), "end": date.to_epoch(day_end)}
+    try:
+        cursor = await conn.execute(QUERY, params)
+        raw = await cursor.fetchall()
+        columns = [description[0] for description in cursor.description]
+
+        cursor = await conn.execute(QUERY, params)
+        cursor.row_factory = session_row
+        typed = await cursor.fetchall()
+    finally:
+        await conn.close()
+
+    if legacy_render(raw, columns) != render(typed):
+        print("Тексты не совпали")
+        sys.exit(1)
+
+    def decode_typed() -> list:
+        # Как row_factory: одна SessionRow на кортеж
+        return [session_row(None, row) for row in raw]
+
+    paths = {
+        "dict": lambda: legacy_render(raw, columns),
+        "SessionRow": lambda: render(decode_typed()),
+    }
+
+    print(f"День: {len(raw)} сессий, прогонов: {args.runs}")
+    for name, call in paths.items():
+        times = []
+        cpu_started = time.process_time()
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - started)
+        cpu = (time.process_time() - cpu_started) / args.runs
+
+        print(
+            f"{name:>11}: p50 {statistics.median(times) * 1000:6.2f} мс, "
+            f"p95 {percentile(times, 0.95) * 1000:6.2f} мс, CPU {cpu * 1000:6.2f} мс, "
+            f"пик памяти {peak_memory(call) / 1024:7.1f} КиБ"
+        )
+
+    dict_rows = [dict(zip(columns, row)) for row in raw]
+    print(f"строки в памяти: dict {retained_size(dict_rows) / 1024:.1f} КиБ, "
+          f"SessionRow {retained_size(typed) / 1024:.1f} КиБ")
+
+    print("\nOK: тексты совпадают")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+Проверка журнала медленных запросов (database/tracing.py).
+
+На сгенерированной истории (benchmarks.history) выполняются обычные
+запросы бота и запрос с фильтром DATE(start_time), который не может
+использовать индекс - так выглядела фильтрация по дню до перехода на
+диапазоны времени. Скрипт печатает таблицу медленных запросов и проверяет:
+    - запрос с DATE() попал в таблицу с признаком полного сканирования;
+    - разные значения параметров сведены в одну строку таблицы;
+    - план снят один раз и указывает на вызывающую функцию.
+
+Запуск:
+    python -m benchmarks.slow_queries --users 50 --days 365 --threshold-ms 2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_slow_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--users', type=int, default=50)
+parser.add_argument('--days', type=int, default=365)
+parser.add_argument('--threshold-ms', type=float, default=2.0)
+args = parser.parse_args()
+
+# Порог читается config при импорте
+os.environ['SLOW_QUERY_MS'] = str(args.threshold_ms)
+
+from benchmarks import history  # noqa: E402
+from database import core as db  # noqa: E402
+from database import tracing  # noqa: E402
+from utils import date  # noqa: E402
+
+
+async def sessions_on_day_by_date(tg_id: int, day) -> int:
+    """Фильтр по DATE(start_time): индекс по start_time не используется"""
+    user_id = await db.get_user_id_by_tg_id(tg_id=tg_id)
+    async with db._read() as conn:
+        cursor = await conn.execute("""
+            SELECT COUNT(*) FROM time_sessions
+            WHERE user_id + 0 = ? AND DATE(start_time, 'unixepoch', 'localtime') = ?
+        """, (user_id, str(day)))
+        return (await cursor.fetchone())[0]
+
+
+async def main() -> None:
+    await db.init_db()
+    info = await history.generate(DB_PATH, args.users, args.days)
+    print(f"История: {info['sessions']} сессий, порог {args.threshold_ms:g} мс")
+
+    await db.open_pool(2)
+    today = date.get_now().date()
+    try:
+        for tg_id in range(1, args.users + 1):
+            await db.get_current_state(tg_id=tg_id)
+            await db.get_user_states_by_date(tg_id=tg_id, target_date=today - timedelta(days=tg_id % 30))
+            await db.get_user_tags(tg_id=tg_id)
+
+        for tg_id in (1, 2, 3):
+            await sessions_on_day_by_date(tg_id, today - timedelta(days=tg_id))
+    finally:
+        await db.close_pool()
+
+    print()
+    print(tracing.format_top())
+
+    regressed = [entry for entry in tracing.top(50) if "DATE(start_time" in entry.sql]
+    failures = []
+    if len(regressed) != 1:
+        failures.append(f"запрос с DATE() в таблице {len(regressed)} раз вместо 1")
+    else:
+        entry = regressed[0]
+        if entry.count != 3:
+            failures.append(f"запрос с DATE() учтен {entry.count} раз вместо 3")
+        if "scan" not in entry.flags:
+            failures.append(f"план без признака сканирования: {entry.plan}")
+        if not entry.caller.endswith("sessions_on_day_by_date"):
+            failures.append(f"вызывающая функция определена как {entry.caller}")
+
+    if failures:
+        print("\nОшибки:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+    print("\nOK: запрос без индекса найден и отмечен")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,241 @@
+"""
+Сравнение статистики дня: старая реализация на pandas против
+get_state_totals_between + utils.statistics.day_statistics.
+
+Скрипт заполняет временную базу историей пользователя (сессии не
+переходят через полночь, чтобы семантика обеих реализаций совпадала),
+проверяет, что для случайных дней обе возвращают один и тот же словарь,
+и печатает задержку и прирост RSS от импорта модулей статистики.
+pandas нужен только этому скрипту как эталон.
+
+Запуск:
+    python -m benchmarks.statistics_kernel --days 365 --checks 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_stats_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+from database import core as db  # noqa: E402
+from handlers import user_statistics  # noqa: E402
+from utils import date  # noqa: E402
+
+TG_ID = 1
+
+# ru_maxrss дочернего процесса наследует пик родителя, поэтому читаем VmRSS
+RSS_PROBE = """
+import sys, time
+sys.path.append({cwd!r})
+
+def rss():
+    with open('/proc/self/status') as status:
+        return next(int(line.split()[1]) for line in status if line.startswith('VmRSS'))
+
+before = rss()
+started = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - started
+print(rss() - before, elapsed)
+"""
+
+
+def populate(days: int) -> list[datetime.date]:
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("INSERT INTO users (tg_id, full_name) VALUES (?, ?)", (TG_ID, "Bench"))
+    states = [row[0] for row in conn.execute("SELECT id FROM states")]
+    conn.executemany(
+        "INSERT INTO tags (user_id, name) VALUES (1, ?)",
+        [("python",), ("math",), ("book",)]
+    )
+
+    rows = []
+    first_day = date.get_now().date() - timedelta(days=days)
+    for offset in range(days):
+        current = datetime.combine(first_day + timedelta(days=offset), datetime.min.time())
+        # Разные длительности внутри дня: у самой длинной и короткой сессии нет ничьих
+        for duration in random.sample(range(300, 5400), random.randint(5, 25)):
+            end = current + timedelta(seconds=duration)
+            rows.append((
+                random.choice(states), date.to_epoch(current), date.to_epoch(end),
+                random.randint(1, 3), random.randint(1, 5)
+            ))
+            current = end
+
+    conn.executemany("""
+        INSERT INTO time_sessions
+        (user_id, state_id, start_time, end_time, tag_id, mood)
+        VALUES (1, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+
+    return [first_day + timedelta(days=offset) for offset in range(days)]
+
+
+def pandas_states_statistics(user_data: list[dict], target_day: datetime.date) -> dict:
+    """states_statistics до перехода на агрегирование в SQL"""
+    import pandas as pd
+
+    # До перехода на целые секунды время хранилось строками
+    user_data = [
+        {
+            **row,
+            'start_time': date.to_string(date.to_datetime(row['start_time'])),
+            'end_time': date.to_string(date.to_datetime(row['end_time'])) if row['end_time'] else None,
+        }
+        for row in user_data
+    ]
+
+    df = pd.DataFrame(user_data)
+    df['start_time_dt'] = pd.to_datetime(df['start_time'])
+    df['start_date'] = df['start_time_dt'].dt.date
+    target_day_data = df[df['start_date'] == target_day].copy()
+
+    state_count = len(target_day_data)
+    current_state_data = target_day_data.iloc[0]
+    delta = date.to_datetime(current_state_data['end_time']) - date.to_datetime(current_state_data['start_time'])
+    delta_dict = {
+        'hours': delta.seconds // 3600,
+        'minutes': (delta.seconds // 60) % 60,
+        'seconds': delta.seconds % 60
+    }
+    chronology = ' → '.join(target_day_data['state_name'].iloc[::-1].tolist())
+
+    def calculate_duration(row):
+        return date.calculate_duration_seconds(
+            start_time=row['start_time'],
+            end_time=row.get('end_time') if pd.notna(row.get('end_time')) else None,
+            duration_seconds=int(row['duration_seconds']) if pd.notna(row['duration_seconds']) else None
+        )
+
+    target_day_data['duration'] = target_day_data.apply(calculate_duration, axis=1)
+    state_durations = target_day_data.groupby('state_name')['duration'].sum().to_dict()
+    total_time = target_day_data['duration'].sum()
+    states_in_percents = {
+        state: [duration, round((duration / total_time) * 100, 1) if total_time > 0 else 0]
+        for state, duration in state_durations.items()
+    }
+
+    no_sleep_data = target_day_data[target_day_data['state_name'] != 'sleep'].copy()
+    if not no_sleep_data.empty:
+        state_durations_no_sleep = no_sleep_data.groupby('state_name')['duration'].sum().to_dict()
+        longest_total_state = max(state_durations_no_sleep.items(), key=lambda x: x[1])
+        shortest_total_state = min(state_durations_no_sleep.items(), key=lambda x: x[1])
+
+        individual_sessions = no_sleep_data[['state_name', 'duration']].copy()
+        individual_sessions.columns = ['name', 'duration']
+        longest_session = individual_sessions.loc[individual_sessions['duration'].idxmax()].to_dict()
+        shortest_session = individual_sessions.loc[individual_sessions['duration'].idxmin()].to_dict()
+
+        productivity_time = no_sleep_data[
+            no_sleep_data['state_name'].isin(['work', 'study'])
+        ]['duration'].sum()
+        chill_time = no_sleep_data[no_sleep_data['state_name'] == 'chill']['duration'].sum()
+        productivity = int((productivity_time / (productivity_time + chill_time)) * 100) if chill_time > 0 else 0
+
+        average_session_time = date.format_time(int(individual_sessions['duration'].mean()))
+    else:
+        longest_total_state = ('—', 0)
+        shortest_total_state = ('—', 0)
+        longest_session = {'name': '—', 'duration': 0}
+        shortest_session = {'name': '—', 'duration': 0}
+        productivity = 0
+        average_session_time = "0с"
+
+    def formatted(name, duration):
+        return {'name': name, 'duration': date.format_time(duration) if duration > 0 else "—"}
+
+    return {
+        "target_date": target_day.strftime("%d/%m/%Y"),
+        "current_state_name": current_state_data['state_name'],
+        "current_state_tag": current_state_data['tag'],
+        "delta_time": delta_dict,
+        "state_count": state_count,
+        "chronology": chronology,
+        "states_in_precents": states_in_percents,
+        "productivity": productivity,
+        "longest_total": formatted(*longest_total_state),
+        "shortest_total": formatted(*shortest_total_state),
+        "longest_session": formatted(longest_session['name'], longest_session['duration']),
+        "shortest_session": formatted(shortest_session['name'], shortest_session['duration']),
+        "average_session": average_session_time,
+    }
+
+
+def import_cost(imports: str) -> tuple[int, float]:
+    """Прирост RSS (КиБ) и время импорта в чистом процессе (Linux)"""
+    output = subprocess.check_output(
+        [sys.executable, "-c", RSS_PROBE.format(cwd=os.getcwd(), imports=imports)],
+        stderr=subprocess.DEVNULL
+    )
+    rss, elapsed = output.split()
+    return int(rss), float(elapsed)
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * q))]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--checks', type=int, default=50)
+    args = parser.parse_args()
+
+    await db.init_db()
+    days = populate(args.days)
+    await db.open_pool(1)
+
+    pandas_times, kernel_times = [], []
+    mismatches = 0
+    try:
+        for target_day in random.sample(days, min(args.checks, len(days))):
+            started = time.perf_counter()
+            expected = pandas_states_statistics(
+                [row.as_dict() for row in await db.get_user_states(tg_id=TG_ID)], target_day
+            )
+            pandas_times.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            actual = await user_statistics.states_statistics(TG_ID, target_day)
+            kernel_times.append(time.perf_counter() - started)
+
+            if actual != expected:
+                mismatches += 1
+                print(f"Расхождение за {target_day}:\n  pandas: {expected}\n  kernel: {actual}")
+    finally:
+        await db.close_pool()
+
+    print(f"История: {args.days} дней, проверено дней: {len(kernel_times)}")
+    for name, values in (("pandas", pandas_times), ("kernel", kernel_times)):
+        print(
+            f"{name:>7}: p50 {statistics.median(values) * 1000:7.2f} мс, "
+            f"p95 {percentile(values, 0.95) * 1000:7.2f} мс"
+        )
+
+    handlers_rss, handlers_time = import_cost("import handlers.user_statistics")
+    pandas_rss, pandas_time = import_cost("import handlers.user_statistics\nimport pandas")
+    print(f"импорт handlers.user_statistics: +{handlers_rss / 1024:.1f} МиБ RSS, {handlers_time * 1000:.0f} мс")
+    print(f"          ... вместе с pandas: +{pandas_rss / 1024:.1f} МиБ RSS, {pandas_time * 1000:.0f} мс")
+
+    if mismatches:
+        print(f"\nРезультаты не совпали для {mismatches} дней")
+        sys.exit(1)
+
+    print("\nOK: результаты совпадают")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+"""
+Бот без сети для локальных прогонов: сессия записывает вызовы Bot API
+и отвечает правдоподобными объектами, а make_message_update / make_callback_update /
+make_document_update собирают апдейты в формате, в котором их присылает Telegram.
+
+Отправляемые документы сессия вычитывает целиком, как при загрузке
+(RecordingSession.documents), а скачивание файлов ботом отдает содержимое
+из RecordingSession.files по file_id.
+"""
+import itertools
+import time
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.enums import ParseMode
+from aiogram.methods import GetFile, GetMe, SendDocument, SendMessage, EditMessageText, TelegramMethod
+from aiogram.types import Chat, File, InputFile, Message, User
+
+BOT_TOKEN = "123456:stub-token"
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+class RecordingSession(BaseSession):
+    """Сессия Bot API, которая ничего не отправляет и запоминает вызовы"""
+
+    def __init__(self, record: bool = True) -> None:
+        super().__init__()
+        self.record = record
+        self.requests: list[TelegramMethod] = []
+        self.documents: list[tuple[str, bytes]] = []
+        self.files: dict[str, bytes] = {}
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None) -> Any:
+        if self.record:
+            self.requests.append(method)
+
+        if isinstance(method, GetMe):
+            return User(id=bot.id, is_bot=True, first_name="Stub", username="stub_bot")
+
+        if isinstance(method, (SendMessage, EditMessageText)):
+            chat_id = method.chat_id or 0
+            return Message(
+                message_id=method.message_id if isinstance(method, EditMessageText) else next(_message_ids),
+                date=int(time.time()),
+                chat=Chat(id=chat_id, type="private"),
+                text=method.text,
+            )
+
+        if isinstance(method, SendDocument):
+            if isinstance(method.document, InputFile):
+                content = b"".join([chunk async for chunk in method.document.read(bot)])
+                self.documents.append((method.document.filename, content))
+            return Message(
+                message_id=next(_message_ids),
+                date=int(time.time()),
+                chat=Chat(id=method.chat_id or 0, type="private"),
+            )
+
+        if isinstance(method, GetFile):
+            return File(
+                file_id=method.file_id, file_unique_id=method.file_id,
+                file_size=len(self.files[method.file_id]), file_path=method.file_id
+            )
+
+        return True
+
+    async def stream_content(self, url: str, *args, **kwargs):
+        # file_path в ответе GetFile - это file_id
+        yield self.files[url.rsplit("/", 1)[-1]]
+
+    async def close(self) -> None:
+        pass
+
+    def texts(self) -> list[str]:
+        return [request.text for request in self.requests if isinstance(request, (SendMessage, EditMessageText))]
+
+
+def make_bot(record: bool = True) -> Bot:
+    return Bot(
+        token=BOT_TOKEN,
+        session=RecordingSession(record=record),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+
+
+def _user(tg_id: int) -> dict:
+    return {"id": tg_id, "is_bot": False, "first_name": f"User {tg_id}", "username": f"user{tg_id}"}
+
+
+def make_message_update(tg_id: int, text: str) -> dict:
+    """Апдейт с текстовым сообщением; команда в начале текста размечается как bot_command"""
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": tg_id, "type": "private", "first_name": f"User {tg_id}"},
+        "from": _user(tg_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def make_callback_update(tg_id: int, data: str) -> dict:
+    """Нажатие inline-кнопки под сообщением бота"""
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(tg_id),
+            "chat_instance": str(tg_id),
+            "data": data,
+            "message": {
+                "message_id": next(_message_ids),
+                "date": int(time.time()),
+                "chat": {"id": tg_id, "type": "private", "first_name": f"User {tg_id}"},
+                "from": {"id": 123456, "is_bot": True, "first_name": "Stub"},
+                "text": "...",
+            },
+        },
+    }
+
+
+def make_document_update(tg_id: int, file_id: str, file_name: str, size: int, caption: str | None = None) -> dict:
+    """Сообщение с файлом; подпись-команда размечается как bot_command"""
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": tg_id, "type": "private", "first_name": f"User {tg_id}"},
+        "from": _user(tg_id),
+        "document": {
+            "file_id": file_id, "file_unique_id": file_id,
+            "file_name": file_name, "mime_type": "text/csv", "file_size": size,
+        },
+    }
+    if caption is not None:
+        message["caption"] = caption
+        if caption.startswith("/"):
+            message["caption_entities"] = [{"type": "bot_command", "offset": 0, "length": len(caption.split()[0])}]
+
+    return {"update_id": next(_update_ids), "message": message}
@@ -0,0 +1,163 @@
+"""
+Бенчмарк переключения состояния: старый путь (отдельные SELECT и UPDATE
+на нескольких соединениях) против switch_state() с UPDATE ... RETURNING
+в одной транзакции. Оба пути обновляют daily_state_totals и
+state_transitions. После прогрева пути чередуются --rounds раз,
+печатается медиана и число SQL-запросов на переключение.
+
+Запуск:
+    python -m benchmarks.switch_state --users 200 --sessions 2000 --switches 3000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_bench_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+from data.messages import DEFAULT_STATES  # noqa: E402
+from database import core as db  # noqa: E402
+from database import rollup, tags, transitions  # noqa: E402
+from utils import date  # noqa: E402
+from utils import metrics  # noqa: E402
+
+
+def populate(users: int, sessions: int) -> None:
+    """Заполнить базу историей: `sessions` закрытых сессий на пользователя"""
+    conn = sqlite3.connect(DB_PATH)
+    states = [row[0] for row in conn.execute("SELECT id FROM states")]
+
+    conn.executemany(
+        "INSERT INTO users (tg_id, username, full_name) VALUES (?, ?, ?)",
+        [(tg_id, f"user{tg_id}", f"User {tg_id}") for tg_id in range(1, users + 1)]
+    )
+
+    start = datetime.now() - timedelta(minutes=30 * sessions)
+    for user_id in range(1, users + 1):
+        rows = []
+        current = start
+        for _ in range(sessions):
+            duration = random.randint(60, 3600)
+            end = current + timedelta(seconds=duration)
+            rows.append((
+                user_id, random.choice(states), date.to_epoch(current),
+                date.to_epoch(end), random.randint(1, 5)
+            ))
+            current = end
+
+        conn.executemany("""
+            INSERT INTO time_sessions
+            (user_id, state_id, start_time, end_time, mood)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+
+    conn.commit()
+    conn.close()
+
+
+async def legacy_switch_state(tg_id: int, new_state: str, tag: str = "") -> dict:
+    """
+    Путь переключения до перехода на UPDATE ... RETURNING.
+
+    Производные таблицы обновляются так же, как в switch_state(): дни
+    закрытой сессии в daily_state_totals и переход в state_transitions,
+    иначе сравнение было бы в пользу старого пути.
+    """
+    user_id = await db.get_user_id_by_tg_id(tg_id=tg_id)
+    prev_state_data = await db.get_current_state(tg_id=tg_id)
+    state_id = await db.get_state_id_by_name(state_name=new_state)
+
+    async with db._write() as conn:
+        now = date.to_epoch(date.get_now())
+        cursor = await conn.execute("""
+            SELECT start_time, state_id FROM time_sessions
+            WHERE user_id = ? AND end_time IS NULL
+        """, (user_id,))
+        result = await cursor.fetchone()
+
+        if result:
+            await conn.execute("""
+                UPDATE time_sessions
+                SET end_time = ?
+                WHERE user_id = ? AND end_time IS NULL
+            """, (now, user_id))
+            await rollup.refresh_daily_totals(conn, user_id, result[0], now)
+        else:
+            cursor = await conn.execute("""
+                SELECT start_time, state_id FROM time_sessions
+                WHERE user_id = ?
+                ORDER BY start_time DESC, id DESC
+                LIMIT 1
+            """, (user_id,))
+            result = await cursor.fetchone()
+
+        await conn.execute("""
+            INSERT INTO time_sessions (user_id, state_id, start_time, tag_id) VALUES (?, ?, ?, ?)
+        """, (user_id, state_id, now, await tags.get_tag_id(conn, user_id, tag)))
+
+        if result:
+            await transitions.record_transition(conn, user_id, result[0], result[1], state_id)
+        await conn.commit()
+
+    return prev_state_data
+
+
+async def run(switch, users: int, switches: int) -> tuple[float, float]:
+    """Переключений в секунду и SQL-запросов на переключение"""
+    states = list(DEFAULT_STATES)
+    metrics.reset()
+    started = time.perf_counter()
+    for _ in range(switches):
+        await switch(tg_id=random.randint(1, users), new_state=random.choice(states), tag="bench")
+
+    elapsed = time.perf_counter() - started
+    return switches / elapsed, sum(metrics.sql_statements._series.values()) / switches
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--switches', type=int, default=3000)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    await db.init_db()
+    started = time.perf_counter()
+    populate(args.users, args.sessions)
+    print(f"База: {DB_PATH}, {args.users * args.sessions} сессий "
+          f"({time.perf_counter() - started:.1f}с на заполнение)")
+
+    await db.open_pool(args.pool_size)
+    try:
+        # Прогрев: у каждого пользователя появляется открытая сессия, кэши заполнены
+        for tg_id in range(1, args.users + 1):
+            await db.switch_state(tg_id=tg_id, new_state="other")
+
+        # Пути чередуются, чтобы рост таблицы и кэш страниц не давали преимущества одному из них
+        before, after = [], []
+        for _ in range(args.rounds):
+            before.append(await run(legacy_switch_state, args.users, args.switches))
+            after.append(await run(db.switch_state, args.users, args.switches))
+        before_sql, after_sql = before[-1][1], after[-1][1]
+        before = statistics.median(rate for rate, _ in before)
+        after = statistics.median(rate for rate, _ in after)
+    finally:
+        await db.close_pool()
+
+    print(f"до:    {before:8.1f} переключений/с, {before_sql:.1f} SQL на переключение")
+    print(f"после: {after:8.1f} переключений/с, {after_sql:.1f} SQL на переключение  (x{after / before:.2f})")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+"""
+Локальная проверка режима webhook без обращения к Telegram.
+
+Скрипт поднимает то же aiohttp-приложение, что и main.py в режиме webhook
+(utils.webhook.build_app с диспетчером из main.build_dispatcher), на
+временной базе и боте с записывающей сессией (benchmarks.stub_bot).
+Затем отправляет на него апдейты POST-запросами, как это делает Telegram,
+и останавливает сервер. Остановка дожидается обработки всех принятых
+апдейтов, после чего скрипт проверяет:
+    - запрос с неверным секретом отклонен с 401 и не обработан;
+    - ни один обработчик не завершился исключением;
+    - обработчики ответили на команды и записали сессии в базу.
+
+Апдейты по умолчанию - встроенный сценарий. Записанные апдейты можно
+передать JSON-файлом со списком объектов Update:
+    python -m benchmarks.webhook_replay
+    python -m benchmarks.webhook_replay --updates updates.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='tt_webhook_'), 'users_db.db')
+os.environ['USERS_DB_PATH'] = DB_PATH
+
+sys.path.append(os.getcwd())
+
+from aiohttp import ClientSession  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.types import ErrorEvent  # noqa: E402
+
+import main  # noqa: E402
+from benchmarks.stub_bot import make_bot, make_callback_update, make_message_update  # noqa: E402
+from data import messages as msg  # noqa: E402
+from database import core as db  # noqa: E402
+from utils import date, webhook  # noqa: E402
+
+TG_ID = 42
+SECRET = "replay-secret"
+PATH = "/webhook"
+
+
+def scenario() -> list[dict]:
+    yesterday = date.get_now().date() - timedelta(days=1)
+    return [
+        make_message_update(TG_ID, "/start"),
+        make_message_update(TG_ID, "/work python"),
+        make_message_update(TG_ID, "/chill"),
+        make_message_update(TG_ID, "/history"),
+        make_callback_update(TG_ID, f"date_history:{yesterday}"),
+        make_message_update(TG_ID, "/stats"),
+    ]
+
+
+async def replay(updates: list[dict]) -> tuple[list[int], int, list[str], list[str]]:
+    bot = make_bot()
+    dp = main.build_dispatcher(MemoryStorage())
+
+    errors = []
+
+    @dp.errors()
+    async def record_error(event: ErrorEvent) -> bool:
+        errors.append(f"апдейт {event.update.update_id}: {event.exception!r}")
+        return True
+    server = TestServer(webhook.build_app(dp, bot, SECRET, path=PATH))
+    await server.start_server()
+
+    statuses = []
+    try:
+        async with ClientSession() as http:
+            url = str(server.make_url(PATH))
+
+            forged = make_message_update(TG_ID + 1, "/start")
+            async with http.post(url, json=forged, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as response:
+                rejected = response.status
+
+            for update in updates:
+                async with http.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+                    statuses.append(response.status)
+
+                # Telegram присылает апдейты одного чата по очереди
+                await asyncio.sleep(0.05)
+    finally:
+        # Остановка ждет фоновые обработчики (DrainingRequestHandler.close)
+        await server.close()
+
+    return statuses, rejected, bot.session.texts(), errors
+
+
+async def run(updates_path: str | None) -> None:
+    await db.init_db()
+    await db.open_pool(2)
+
+    if updates_path:
+        with open(updates_path, encoding='utf-8') as file:
+            updates = json.load(file)
+    else:
+        updates = scenario()
+
+    try:
+        statuses, rejected, texts, errors = await replay(updates)
+    finally:
+        await db.close_pool()
+
+    print(f"Апдейтов: {len(updates)}, ответы сервера: {statuses}, с неверным секретом: {rejected}")
+    print(f"Вызовов Bot API с текстом: {len(texts)}")
+
+    failures = []
+    if rejected != 401:
+        failures.append(f"неверный секрет принят со статусом {rejected}")
+    if any(status != 200 for status in statuses):
+        failures.append("не все апдейты приняты")
+    failures += errors
+
+    conn = sqlite3.connect(DB_PATH)
+    forged_users = conn.execute("SELECT COUNT(*) FROM users WHERE tg_id = ?", (TG_ID + 1,)).fetchone()[0]
+    sessions = conn.execute("""
+        SELECT COUNT(*) FROM time_sessions ts JOIN users u ON ts.user_id = u.id WHERE u.tg_id = ?
+    """, (TG_ID,)).fetchone()[0]
+    conn.close()
+
+    if forged_users:
+        failures.append("апдейт с неверным секретом обработан")
+
+    if not updates_path:
+        expected = {
+            "/start": msg.COMMON['start_cmd'],
+            "/work, /chill": "Смена состояния успешна",
+            "/history": "<b>work</b>",
+            "date_history": msg.FAILURE['no_states_today'],
+            "/stats": "Статистика",
+        }
+        for name, fragment in expected.items():
+            if not any(fragment in text for text in texts):
+                failures.append(f"нет ответа на {name}")
+
+        if sessions != 2:
+            failures.append(f"в базе {sessions} сессий вместо 2")
+
+    if failures:
+        print("\nОшибки:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+    print("\nOK: апдейты обработаны до остановки сервера")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', help="JSON-файл со списком апдейтов")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.updates))
@@ -10,3 +10,46 @@ load_dotenv(env_file)
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 STATES_DB_PATH = os.getenv('STATES_DB_PATH')
 USERS_DB_PATH = os.getenv('USERS_DB_PATH')
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 4))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 15))
+RENDER_CACHE_BYTES = int(os.getenv('RENDER_CACHE_BYTES', 4 * 1024 * 1024))
+
+# Режим webhook включается, если задан WEBHOOK_URL - публичный адрес бота без пути
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Метрики Prometheus: файл перезаписывается раз в METRICS_INTERVAL секунд (пусто - не писать)
+METRICS_FILE = os.getenv('METRICS_FILE', '')
+METRICS_INTERVAL = int(os.getenv('METRICS_INTERVAL', 30))
+
+# Telegram ID администраторов через запятую (команда /metrics)
+ADMIN_IDS = {int(tg_id) for tg_id in os.getenv('ADMIN_IDS', '').split(',') if tg_id.strip()}
+
+# Запросы дольше SLOW_QUERY_MS миллисекунд пишутся в лог с планом (0 - не отслеживать),
+# таблица медленных запросов пишется в лог раз в SLOW_QUERY_DUMP_INTERVAL секунд (0 - не писать)
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 50))
+SLOW_QUERY_DUMP_INTERVAL = int(os.getenv('SLOW_QUERY_DUMP_INTERVAL', 3600))
+
+# Логи строками JSON и ограничение INFO-записей в секунду с одного места вызова (0 - без ограничения)
+LOG_JSON = os.getenv('LOG_JSON', '').lower() in ('1', 'true', 'yes')
+LOG_INFO_RATE = float(os.getenv('LOG_INFO_RATE', 20))
+
+# Групповой коммит: записи собираются в одну транзакцию WRITE_BATCH_WINDOW_MS миллисекунд
+# или до WRITE_BATCH_MAX операций. При 0 (по умолчанию) координатор не запускается и каждая
+# запись коммитится сама на писателе пула: при synchronous=NORMAL коммит дешев, и очередь
+# координатора только добавляет задержку (см. benchmarks.group_commit)
+WRITE_BATCH_WINDOW_MS = float(os.getenv('WRITE_BATCH_WINDOW_MS', 0))
+WRITE_BATCH_MAX = int(os.getenv('WRITE_BATCH_MAX', 64))
+
+# /export читает историю порциями по EXPORT_CHUNK_ROWS строк. /import принимает CSV
+# не больше IMPORT_MAX_BYTES (Bot API отдает ботам файлы до 20 МБ) и IMPORT_MAX_ROWS строк
+# и вставляет их пачками executemany по IMPORT_BATCH_ROWS
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 1000))
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', 20 * 1024 * 1024))
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', 100000))
+IMPORT_BATCH_ROWS = int(os.getenv('IMPORT_BATCH_ROWS', 5000))
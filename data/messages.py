@@ -1,43 +1,49 @@
+import html
+
 from utils import date
 from datetime import datetime, timedelta
+from itertools import groupby
+from database.rows import SessionRow
 
 
 def format_switch_state_message(
-    prev_state: str,
+    prev_state: str | None,
     new_state: str,
     prev_tag: str,
     new_tag: str,
     delta_time: str
 ) -> str:
+    # Первая смена у нового пользователя: предыдущего состояния нет
+    if prev_state is None:
+        was = "—"
+    else:
+        was = f"{DEFAULT_STATES[prev_state][1]} <code>{prev_state}</code> <code>{prev_tag if prev_tag else ''}</code>"
+
     return f"""✨ <b>Смена состояния успешна!</b>
 
-<b>Было:</b> {DEFAULT_STATES[prev_state][1]} <code>{prev_state}</code> <code>{prev_tag if prev_tag else ''}</code>
+<b>Было:</b> {was}
 <b>Стало:</b> {DEFAULT_STATES[new_state][1]} <code>{new_state}</code> <code>{new_tag if new_tag else ''}</code>
 
 🕐 <b>Интервал:</b> <i>{delta_time}</i>"""
 
 
-def old_format_states_history(states: list[dict]) -> str:
+def old_format_states_history(states: list[SessionRow]) -> str:
     if not states:
         return "📭 История состояний за сегодня пуста"
 
     ret_str = "📊 <b>История состояний сегодня:</b>\n\n"
 
     for i, state in enumerate(states):
-        state_name = state["state_name"]
-        start_time = date.format_time_hhmm(state['start_time'])
-        if state['end_time']:
-            end_time = date.format_time_hhmm(state['end_time'])
+        state_name = state.state_name
+        start_time = date.format_time_hhmm(state.start_time)
+        if state.end_time:
+            end_time = date.format_time_hhmm(state.end_time)
         else:
             end_time = "now"
 
-        duration_seconds = date.calculate_duration_seconds(
-            start_time=state['start_time'],
-            end_time=state.get('end_time'),
-            duration_seconds=state.get("duration_seconds")
-        )
-        mood = state.get("mood")
-        tag = state.get("tag", "")
+        duration_seconds = state.duration_seconds
+        mood = state.mood
+        tag = state.tag
 
         if duration_seconds:
             duration_str = date.format_time(duration_seconds)
@@ -60,27 +66,23 @@ def old_format_states_history(states: list[dict]) -> str:
     return ret_str
 
 
-def format_states_history(states: list[dict]) -> str:
+def format_states_history(states: list[SessionRow]) -> str:
     if not states:
         return "📭 История состояний за сегодня пуста"
     
     ret_str = ""
 
     for i, state in enumerate(states):
-        state_name = state["state_name"]
-        start_time = date.format_time_hhmm(state['start_time'])
-        if state['end_time']:
-            end_time = date.format_time_hhmm(state['end_time'])
+        state_name = state.state_name
+        start_time = date.format_time_hhmm(state.start_time)
+        if state.end_time:
+            end_time = date.format_time_hhmm(state.end_time)
         else:
             end_time = "now"
 
-        duration_seconds = date.calculate_duration_seconds(
-            start_time=state['start_time'],
-            end_time=state.get('end_time'),
-            duration_seconds=state.get("duration_seconds")
-        )
-        mood = state.get("mood")
-        tag = state.get("tag", "")
+        duration_seconds = state.duration_seconds
+        mood = state.mood
+        tag = state.tag
 
         duration_str = date.format_time(duration_seconds)
 
@@ -94,6 +96,17 @@ def format_states_history(states: list[dict]) -> str:
     return ret_str
 
 
+def format_history_page(states: list[SessionRow]) -> str:
+    """Страница истории по нескольким дням: заголовок на каждый день начала сессий"""
+    ret_str = ""
+
+    for day, day_states in groupby(states, key=lambda state: state.start_time.date()):
+        ret_str += f"📅 <b>{day.strftime('%d/%m/%Y')}</b>\n\n"
+        ret_str += format_states_history(list(day_states))
+
+    return ret_str
+
+
 def format_commands() -> str:
     ret = ""
     for en, ru in DEFAULT_STATES.items():
@@ -102,6 +115,30 @@ def format_commands() -> str:
     return ret
 
 
+def format_bar(percents: float) -> str:
+    bars_count = int(percents / 10)
+    return "█" * bars_count + "░" * (10 - bars_count)
+
+
+def format_states_ratio(states_in_precents: dict[str, list]) -> str:
+    ratio = ""
+    for state_name, state_duration in sorted(
+            states_in_precents.items(),
+            key=lambda state: state[1][0],
+            reverse=True
+    ):
+        formatted_duration = date.format_time(state_duration[0])
+        duration_percents = state_duration[1]
+
+        bar = format_bar(duration_percents)
+
+        ratio += (" " * 4 + f"· {DEFAULT_STATES[state_name][1]} "
+                            f"{state_name}: <b>{duration_percents}%</b> "
+                  f"({formatted_duration})\n" + " "*4 + f"{bar}\n")
+
+    return ratio
+
+
 def format_user_statistics(
     target_date: str,
     current_state_name: str,
@@ -129,21 +166,7 @@ def format_user_statistics(
     if seconds >= 1:
         duration += f"{seconds}с"
 
-    ratio = ""
-    for state_name, state_duration in sorted(
-            states_in_precents.items(),
-            key=lambda state: state[1][0],
-            reverse=True
-    ):
-        formatted_duration = date.format_time(state_duration[0])
-        duration_percents = state_duration[1]
-
-        bars_count = int(duration_percents / 10)
-        bar = "█" * bars_count + "░" * (10 - bars_count)
-
-        ratio += (" " * 4 + f"· {DEFAULT_STATES[state_name][1]} "
-                            f"{state_name}: <b>{duration_percents}%</b> "
-                  f"({formatted_duration})\n" + " "*4 + f"{bar}\n")
+    ratio = format_states_ratio(states_in_precents)
 
     return f"""📊 <b>Статистика состояний {target_date}:</b>
 
@@ -172,6 +195,36 @@ def format_user_statistics(
 """
 
 
+def format_full_statistics(
+    period_title: str,
+    first_day: str,
+    last_day: str,
+    total_time: str,
+    session_count: int,
+    average_mood: float | None,
+    productivity: int,
+    states_in_precents: dict[str, list],
+    trend: list[tuple[str, int]]
+) -> str:
+    ratio = format_states_ratio(states_in_precents)
+
+    trend_str = ""
+    for label, bucket_productivity in trend:
+        trend_str += " " * 4 + f"{label}: {format_bar(bucket_productivity)} {bucket_productivity}%\n"
+
+    return f"""📊 <b>Статистика за {period_title}</b> ({first_day} - {last_day})
+
+📈 <b>Активность:</b>
+    ⏱️ <b>Всего:</b> {total_time}
+    🔢 <b>Сессий:</b> {session_count}
+    ✨ <b>Средняя оценка:</b> {f'{average_mood}/5' if average_mood else '—'}
+
+📐 <b>Распределение:</b>
+{ratio}
+📊 <b>Продуктивность:</b> {productivity}%
+{trend_str}"""
+
+
 def format_fix_cmd(
     state_name: str,
     state_start_time: str,
@@ -185,10 +238,10 @@ def format_fix_cmd(
 """
 
 
-def format_state_info(state_info: dict) -> str:
-    start_time = date.format_time_hhmm(state_info['start_time'])
-    end_time = date.format_time_hhmm(state_info['end_time'])
-    duration = state_info['duration_seconds']
+def format_state_info(state_info: SessionRow) -> str:
+    start_time = date.format_time_hhmm(state_info.start_time)
+    end_time = date.format_time_hhmm(state_info.end_time or date.get_now())
+    duration = state_info.duration_seconds
 
     duration_dict = {
         "hours": duration//3600,
@@ -200,17 +253,29 @@ def format_state_info(state_info: dict) -> str:
     duration_str += f"{duration_dict['minutes']}м " if duration_dict['minutes'] else ""
     duration_str += f"{duration_dict['seconds']}с" if duration_dict['seconds'] else ""
 
-    ret = f"""📍 <b>Состояние</b> <code>{state_info['name']}</code>
+    ret = f"""📍 <b>Состояние</b> <code>{state_info.state_name}</code>
 
-📋 <b>Тег:</b> <code>{state_info['tag'] or 'отсутствует'}</code>
+📋 <b>Тег:</b> <code>{state_info.tag or 'отсутствует'}</code>
 🕐 <b>Время:</b> {start_time}-{end_time}
 ⏱️ <b>Длительность:</b> {duration_str}
-✨ <b>Оценка:</b> <code>{state_info['mood'] or '?'}/5</code>
+✨ <b>Оценка:</b> <code>{state_info.mood or '?'}/5</code>
     """
 
     return ret
 
 
+def format_import_errors(errors: list[str]) -> str:
+    lines = "\n".join(f"• {html.escape(error)}" for error in errors)
+    return f"❌ <b>Файл не импортирован:</b>\n\n{lines}"
+
+
+def format_import_result(imported: int, skipped: int, seconds: float) -> str:
+    skipped_str = f"\nПропущено незавершенных: <b>{skipped}</b>" if skipped else ""
+    return f"""✅ <b>История импортирована!</b>
+
+Сессий: <b>{imported}</b> за <i>{seconds:.2f} с</i> ({imported / seconds if seconds else imported:.0f} строк/с){skipped_str}"""
+
+
 def format_predict_next_state(next_state: list, predict_by: str) -> str:
     ret_str = f"✨ <b>Предсказываю следующее состояние...</b>\n"
     ret_str += f"\n⚙️ <b>Паттерн:</b> <i>{predict_by}</i>\n"
@@ -243,6 +308,8 @@ COMMON = {
 📜 <code>/history</code> - история состояний
 🏷️ <code>/my_tags</code> - ваши теги
 🛠 <code>/fix</code> <i>время состояние [тег]</i> - исправить забытое переключение
+📤 <code>/export</code> <i>[csv|json]</i> - выгрузить историю файлом
+📥 <code>/import</code> - загрузить историю из CSV
 
 <b>Пример <code>/fix</code>:</b>
 <code>/fix 1ч 10м study математика</code>
@@ -262,12 +329,18 @@ COMMON = {
     "choose_new_state": "ℹ️ Выберите новое состояние:",
     "enter_new_tag": "ℹ️ Введите новый тег:",
     "rate_state": "⭐ <b>Оцените состояние:</b>",
+    "send_import_file": """📥 <b>Отправьте CSV-файл с историей.</b>
+
+Столбцы: <code>state,tag,start_time,end_time,mood</code>
+Время - <code>ГГГГ-ММ-ДД ЧЧ:ММ:СС</code>, теги и оценки можно не указывать.
+Подойдет файл из <code>/export</code>.""",
 }
 
 SUCCESS = {
     'state_change': "✅ <b>Состояние было изменено!</b>",
     "state_tag_deleted": "✅ <b>Тег состояния был успешно удален!</b>",
-    'state_rated': "⭐ <b>Оценка сохранена!</b>"
+    'state_rated': "⭐ <b>Оценка сохранена!</b>",
+    'export': "📤 <b>История состояний</b>",
 }
 
 FAILURE = {
@@ -276,9 +349,16 @@ FAILURE = {
 Вы можете установить тег состоянию, написав его после названия состояния:
 <code>/состояние тег</code>""",
     'no_states_today': "❌ <b>У вас нет состояний сегодня.</b>",
+    'no_states_period': "❌ <b>У вас нет завершенных состояний за этот период.</b>",
     "wrong_args": "❌ <b>Команда была использована неправильно.</b>",
     "fix_wrong_time": "❌ <b>Время команды некорректное.</b>",
-    "few_days": "❌ <b>Вы пользуетесь ботом слишком мало. Эта функция не доступна.</b>"
+    "few_days": "❌ <b>Вы пользуетесь ботом слишком мало. Эта функция не доступна.</b>",
+    "export_format": "❌ <b>Формат выгрузки:</b> <code>/export csv</code> или <code>/export json</code>",
+    "nothing_to_export": "❌ <b>У вас пока нет истории для выгрузки.</b>",
+    "not_registered": "❌ <b>Сначала начните работу с ботом:</b> /start",
+    "import_too_large": "❌ <b>Файл слишком большой для импорта.</b>",
+    "import_empty": "❌ <b>В файле нет завершенных сессий.</b>",
+    "import_overlap": "❌ <b>Сессии из файла пересекаются с уже записанной историей.</b> Ничего не импортировано.",
 }
 
 REPLY_KB = {
@@ -1,62 +1,231 @@
 import aiosqlite
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator
 
 from aiogram.types import Message, CallbackQuery
 
-from config import USERS_DB_PATH
+from config import (
+    USERS_DB_PATH, DB_POOL_SIZE, USER_CACHE_SIZE, HISTORY_PAGE_SIZE,
+    WRITE_BATCH_WINDOW_MS, WRITE_BATCH_MAX, EXPORT_CHUNK_ROWS, IMPORT_BATCH_ROWS
+)
 from data.messages import DEFAULT_STATES
+from database import migrations, rollup, sql, tags, tracing, transitions
+from database.group_commit import WriteCoordinator, WriteOp
+from database.pool import ConnectionPool, connect
+from database.rows import SessionRow, session_row
 from utils import date
+from utils import bot_logging as bot_log
+from utils.cache import LRUCache
 
+logger = bot_log.get_logger(__name__)
 
-async def init_db() -> None:
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
-        await conn.execute('PRAGMA foreign_keys = ON')
-        await conn.execute('PRAGMA journal_mode=WAL')
-        await conn.execute('PRAGMA synchronous=NORMAL')
-        await conn.execute('PRAGMA busy_timeout=10000')
-
-        cursor = await conn.cursor()
-
-
-        await cursor.execute("""CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_id INTEGER UNIQUE NOT NULL,
-            username TEXT,
-            full_name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )""")
-
-        await cursor.execute("""CREATE TABLE IF NOT EXISTS states (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL
-        )""")
-
-        await cursor.execute("""CREATE TABLE IF NOT EXISTS time_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            state_id INTEGER NOT NULL,
-            start_time TIMESTAMP NOT NULL,
-            end_time TIMESTAMP,
-            tag TEXT,
-            duration_seconds INTEGER,
-            mood INTEGER CHECK (mood >= 1 AND mood <= 5),
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (state_id) REFERENCES states(id) ON DELETE CASCADE
-        )""")
-
-        await cursor.executemany(
-            "INSERT OR IGNORE INTO states (name) VALUES (?)",
-            [(state, ) for state in DEFAULT_STATES]
-        )
+_pool: ConnectionPool | None = None
+
+# Записи обработчиков фиксируются пачками, см. _submit()
+_writes: WriteCoordinator | None = None
+
+# Кэши идентификаторов: строки users и states практически не меняются.
+# Справочник состояний загружается целиком в init_db(),
+# пользователи (tg_id -> users.id) хранятся в ограниченном LRU.
+_state_ids: dict[str, int] = {}
+_state_cache_hits = 0
+_state_cache_misses = 0
+_user_ids = LRUCache(maxsize=USER_CACHE_SIZE)
+
+
+async def open_pool(size: int = DB_POOL_SIZE) -> ConnectionPool:
+    """Открыть общий пул соединений. Вызывается после init_db()"""
+    global _pool, _writes
+
+    if _pool is None or _pool.closed:
+        _pool = ConnectionPool(USERS_DB_PATH, size=size)
+        await _pool.open()
+        logger.info(f"Пул соединений открыт (читателей: {size})")
+
+        if WRITE_BATCH_WINDOW_MS > 0:
+            _writes = WriteCoordinator(_write, window=WRITE_BATCH_WINDOW_MS / 1000, max_batch=WRITE_BATCH_MAX)
+            _writes.start()
+
+    return _pool
+
+
+async def close_pool() -> None:
+    global _pool, _writes
+
+    if _writes is not None:
+        # Поставленные записи фиксируются до закрытия писателя
+        await _writes.close()
+        logger.info(f"Групповой коммит: {_writes.stats()}")
+        _writes = None
+
+    if _pool is None:
+        return
+
+    stats = _pool.stats()
+    await _pool.close()
+    _pool = None
+    logger.info(f"Пул соединений закрыт: {stats}")
+
+
+def pool_stats() -> dict | None:
+    return _pool.stats() if _pool is not None else None
+
+
+def write_stats() -> dict | None:
+    return _writes.stats() if _writes is not None else None
+
+
+def cache_stats() -> dict:
+    state_lookups = _state_cache_hits + _state_cache_misses
 
-        await cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_tg_id ON users (tg_id)")
-        await cursor.execute("CREATE INDEX IF NOT EXISTS idx_states_name ON states (name)")
-        await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON time_sessions (user_id)")
-        await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_state_id ON time_sessions (state_id)")
-        await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON time_sessions (start_time)")
-        await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_end_time ON time_sessions (end_time)")
+    return {
+        "users": _user_ids.stats(),
+        "states": {
+            "size": len(_state_ids),
+            "hits": _state_cache_hits,
+            "misses": _state_cache_misses,
+            "hit_ratio": round(_state_cache_hits / state_lookups, 4) if state_lookups else 0.0,
+        },
+    }
+
+
+async def data_version(user_id: int) -> int:
+    """
+    Версия данных пользователя (users.data_version), по ней utils.render_cache
+    отбрасывает устаревшие сообщения. Хранится в базе, поэтому записи
+    других экземпляров бота тоже ее увеличивают.
+    """
+    async with _read() as conn:
+        cursor = await conn.execute("SELECT data_version FROM users WHERE id = ?", (user_id,))
+        row = await cursor.fetchone()
+
+    return row[0] if row else 0
 
-        await conn.commit()
+
+async def _bump_data_version(conn: aiosqlite.Connection, user_id: int) -> None:
+    """Увеличить версию данных в транзакции записи"""
+    await conn.execute("UPDATE users SET data_version = data_version + 1 WHERE id = ?", (user_id,))
+
+
+async def _load_states(conn: aiosqlite.Connection) -> None:
+    cursor = await conn.execute("SELECT name, id FROM states")
+    _state_ids.clear()
+    _state_ids.update(await cursor.fetchall())
+
+
+@asynccontextmanager
+async def _read() -> AsyncIterator[aiosqlite.Connection]:
+    # Без открытого пула (скрипты, тесты) работаем на разовом соединении
+    if _pool is None:
+        conn = await connect(USERS_DB_PATH)
+        try:
+            yield tracing.traced(conn)
+        finally:
+            await conn.close()
+        return
+
+    async with _pool.reader() as conn:
+        yield tracing.traced(conn)
+
+
+@asynccontextmanager
+async def _write() -> AsyncIterator[aiosqlite.Connection]:
+    if _pool is None:
+        conn = await connect(USERS_DB_PATH)
+        try:
+            yield tracing.traced(conn)
+        finally:
+            await conn.close()
+        return
+
+    async with _pool.writer() as conn:
+        yield tracing.traced(conn)
+
+
+async def _submit(op: WriteOp) -> Any:
+    """
+    Выполнить запись op(conn) и зафиксировать ее.
+
+    op выполняет запросы на переданном соединении и не коммитит.
+    При открытом пуле операции конкурентных обработчиков собираются
+    в одну транзакцию (database/group_commit.py), результат op
+    возвращается после общего коммита. Без пула (скрипты) запись
+    выполняется на разовом соединении.
+    """
+    if _writes is None:
+        async with _write() as conn:
+            result = await op(conn)
+            await conn.commit()
+        return result
+
+    return await _writes.submit(op)
+
+
+async def _create_schema(conn: aiosqlite.Connection) -> None:
+    """Базовая схема (версия 0), дальше ее меняют migrations"""
+    cursor = await conn.cursor()
+
+    await cursor.execute("""CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tg_id INTEGER UNIQUE NOT NULL,
+        username TEXT,
+        full_name TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""")
+
+    await cursor.execute("""CREATE TABLE IF NOT EXISTS states (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL
+    )""")
+
+    await cursor.execute("""CREATE TABLE IF NOT EXISTS time_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        state_id INTEGER NOT NULL,
+        start_time TIMESTAMP NOT NULL,
+        end_time TIMESTAMP,
+        tag TEXT,
+        duration_seconds INTEGER,
+        mood INTEGER CHECK (mood >= 1 AND mood <= 5),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (state_id) REFERENCES states(id) ON DELETE CASCADE
+    )""")
+
+    await cursor.executemany(
+        "INSERT OR IGNORE INTO states (name) VALUES (?)",
+        [(state, ) for state in DEFAULT_STATES]
+    )
+
+    await cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_tg_id ON users (tg_id)")
+    await cursor.execute("CREATE INDEX IF NOT EXISTS idx_states_name ON states (name)")
+    await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_state_id ON time_sessions (state_id)")
+    await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON time_sessions (start_time)")
+    await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_end_time ON time_sessions (end_time)")
+
+    await conn.commit()
+
+
+async def init_db() -> None:
+    conn = await connect(USERS_DB_PATH)
+    try:
+        # На актуальной схеме DDL и миграции не нужны - это экономит время рестарта
+        if await migrations.get_version(conn) < migrations.SCHEMA_VERSION:
+            await _create_schema(conn)
+            await migrations.migrate(conn)
+
+        await _load_states(conn)
+
+        # Состояния, добавленные в DEFAULT_STATES после создания базы
+        if any(state not in _state_ids for state in DEFAULT_STATES):
+            await conn.executemany(
+                "INSERT OR IGNORE INTO states (name) VALUES (?)",
+                [(state, ) for state in DEFAULT_STATES]
+            )
+            await conn.commit()
+            await _load_states(conn)
+    finally:
+        await conn.close()
 
 
 async def is_user_in_database(
@@ -66,47 +235,53 @@ async def is_user_in_database(
     if message is not None:
         tg_id = message.from_user.id
 
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
-        async with conn.execute("SELECT 1 FROM users WHERE tg_id = ?", (tg_id,)) as cursor:
-            return await cursor.fetchone() is not None
+    return await get_user_id_by_tg_id(tg_id=tg_id) is not None
 
 
 async def get_state_id_by_name(state_name: str) -> int | None:
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
+    global _state_cache_hits, _state_cache_misses
+
+    state_id = _state_ids.get(state_name)
+    if state_id is not None:
+        _state_cache_hits += 1
+        return state_id
+
+    _state_cache_misses += 1
+
+    async with _read() as conn:
         cursor = await conn.execute("SELECT id FROM states WHERE name = ?", (state_name,))
         res = await cursor.fetchone()
 
-        return res[0] if res else None
+    if not res:
+        return None
+
+    _state_ids[state_name] = res[0]
+    return res[0]
 
 
 async def get_user_states(
     tg_obj: Message | CallbackQuery | None = None,
     tg_id: int | None = None,
     limit: int = -1
-) -> list[dict[str, str]] | None:
+) -> list[SessionRow] | None:
     if tg_obj is not None:
         tg_id = tg_obj.from_user.id
 
     user_id = await get_user_id_by_tg_id(tg_id=tg_id)
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
-        cursor = await conn.execute("""
-            SELECT ts.*, s.name as state_name
+    async with _read() as conn:
+        cursor = await conn.execute(f"""
+            SELECT {sql.SESSION_COLUMNS}
             FROM time_sessions ts
             JOIN states s ON ts.state_id = s.id
+            {sql.TAG_JOIN}
             WHERE ts.user_id = ?
             ORDER BY ts.start_time DESC
             LIMIT ?
         """, (user_id, limit))
+        cursor.row_factory = session_row
 
         states = await cursor.fetchall()
-        if not states:
-            return None
-
-        columns = [description[0] for description in cursor.description]
-
-        # 'id', 'user_id', 'state_id', 'start_time', 'end_time',
-        # 'tag', 'duration_seconds', 'mood', 'state_name'
-        return [dict(zip(columns, state)) for state in states]
+        return states or None
 
 
 async def get_user_states_by_date(
@@ -114,7 +289,7 @@ async def get_user_states_by_date(
     tg_id: int | None = None,
     target_date: datetime| None = None,
     limit: int = -1
-) -> list[dict[str, str]] | None:
+) -> list[SessionRow] | None:
     """
     Получить состояния пользователя с фильтрацией по дате на уровне SQL.
     
@@ -125,7 +300,7 @@ async def get_user_states_by_date(
         limit: Лимит результатов (-1 для всех)
     
     Returns:
-        Список словарей с состояниями или None
+        Список SessionRow или None
     """
     if tg_obj is not None:
         tg_id = tg_obj.from_user.id
@@ -134,22 +309,22 @@ async def get_user_states_by_date(
     if not user_id:
         return None
     
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
-        query = """
-            SELECT ts.*, s.name as state_name
+    async with _read() as conn:
+        query = f"""
+            SELECT {sql.SESSION_COLUMNS}
             FROM time_sessions ts
             JOIN states s ON ts.state_id = s.id
+            {sql.TAG_JOIN}
             WHERE ts.user_id = ?
         """
         params = [user_id]
         
         if target_date is not None:
-            # Фильтрация по дате на уровне SQL
-            # SQLite хранит даты в формате 'YYYY-MM-DD HH:MM:SS'
-            # Используем DATE() функцию для извлечения даты
-            date_str = target_date.strftime("%Y-%m-%d")
-            query += " AND DATE(ts.start_time) = ?"
-            params.append(date_str)
+            # Полуоткрытый диапазон по start_time вместо DATE(start_time) = ?,
+            # чтобы работал индекс idx_sessions_user_start
+            day_start, day_end = date.day_bounds(target_date)
+            query += " AND ts.start_time >= ? AND ts.start_time < ?"
+            params.extend((date.to_epoch(day_start), date.to_epoch(day_end)))
         
         query += " ORDER BY ts.start_time DESC"
         
@@ -158,63 +333,382 @@ async def get_user_states_by_date(
             params.append(limit)
         
         cursor = await conn.execute(query, tuple(params))
+        cursor.row_factory = session_row
+
         states = await cursor.fetchall()
-        
-        if not states:
+        return states or None
+
+
+async def get_user_states_between(
+    tg_obj: Message | CallbackQuery | None = None,
+    tg_id: int | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None
+) -> list[SessionRow] | None:
+    """
+    Получить все сессии пользователя, пересекающиеся с окном [start, end).
+
+    В отличие от get_user_states_by_date, сюда попадает и сессия, начавшаяся
+    до start и продолжавшаяся после него (например, сон через полночь).
+    Сессии пользователя не пересекаются, поэтому такая сессия может быть
+    только последней начатой до start - запрос читает диапазон индекса
+    idx_sessions_user_start от нее до end, без сортировки.
+
+    Args:
+        tg_obj: Telegram объект (Message или CallbackQuery)
+        tg_id: Telegram ID пользователя
+        start: Начало окна (включительно)
+        end: Конец окна (не включительно)
+
+    Returns:
+        Список SessionRow (новые первыми) или None
+    """
+    if tg_obj is not None:
+        tg_id = tg_obj.from_user.id
+
+    user_id = await get_user_id_by_tg_id(tg_id=tg_id)
+    if not user_id:
+        return None
+
+    async with _read() as conn:
+        cursor = await conn.execute(f"""
+            SELECT {sql.SESSION_COLUMNS}
+            FROM time_sessions ts
+            JOIN states s ON ts.state_id = s.id
+            {sql.TAG_JOIN}
+            WHERE {sql.WINDOW_FILTER}
+            ORDER BY ts.start_time DESC
+        """, {
+            "user_id": user_id,
+            "start": date.to_epoch(start),
+            "end": date.to_epoch(end),
+        })
+        cursor.row_factory = session_row
+
+        states = await cursor.fetchall()
+        return states or None
+
+
+async def get_user_states_page(
+    tg_obj: Message | CallbackQuery | None = None,
+    tg_id: int | None = None,
+    before: tuple[int, int] | None = None,
+    after: tuple[int, int] | None = None,
+    limit: int = HISTORY_PAGE_SIZE
+) -> tuple[list[SessionRow], bool]:
+    """
+    Страница истории пользователя по ключу (start_time, id).
+
+    Без курсора возвращает последние сессии, с before - сессии старше
+    курсора, с after - новее. Запрос читает limit + 1 строк из
+    idx_sessions_user_start начиная с курсора, поэтому время и память на
+    страницу не зависят от длины истории.
+
+    Args:
+        tg_obj: Telegram объект (Message или CallbackQuery)
+        tg_id: Telegram ID пользователя
+        before: Курсор SessionRow.cursor, листание к старым сессиям
+        after: Курсор SessionRow.cursor, листание к новым сессиям
+        limit: Размер страницы
+
+    Returns:
+        (сессии страницы новыми первыми, есть ли еще сессии в направлении листания)
+    """
+    if tg_obj is not None:
+        tg_id = tg_obj.from_user.id
+
+    user_id = await get_user_id_by_tg_id(tg_id=tg_id)
+    if not user_id:
+        return [], False
+
+    query = f"""
+        SELECT {sql.SESSION_COLUMNS}
+        FROM time_sessions ts
+        JOIN states s ON ts.state_id = s.id
+        {sql.TAG_JOIN}
+        WHERE ts.user_id = ?
+    """
+    params: tuple = (user_id,)
+
+    if after is not None:
+        query += " AND (ts.start_time, ts.id) > (?, ?) ORDER BY ts.start_time, ts.id"
+        params += tuple(after)
+    else:
+        if before is not None:
+            query += " AND (ts.start_time, ts.id) < (?, ?)"
+            params += tuple(before)
+        query += " ORDER BY ts.start_time DESC, ts.id DESC"
+
+    async with _read() as conn:
+        cursor = await conn.execute(query + " LIMIT ?", params + (limit + 1,))
+        cursor.row_factory = session_row
+
+        states = await cursor.fetchall()
+
+    has_more = len(states) > limit
+    states = states[:limit]
+    if after is not None:
+        states.reverse()
+
+    return states, has_more
+
+
+async def get_state_totals_between(
+    tg_obj: Message | CallbackQuery | None = None,
+    tg_id: int | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None
+) -> dict | None:
+    """
+    Агрегированная статистика по состояниям за окно [start, end), посчитанная в SQL.
+
+    Длительности сессий обрезаются по границам окна, открытая сессия
+    считается до текущего момента. Читаются только сессии окна.
+
+    Returns:
+        {
+            'totals': {state_name: {'total_seconds', 'session_count',
+                                    'longest_seconds', 'shortest_seconds'}},
+            'chronology': [state_name, ...] (от старых к новым),
+            'last_session': {'state_name', 'tag', 'duration_seconds'}
+        }
+        или None, если сессий в окне нет
+    """
+    if tg_obj is not None:
+        tg_id = tg_obj.from_user.id
+
+    user_id = await get_user_id_by_tg_id(tg_id=tg_id)
+    if not user_id:
+        return None
+
+    params = {
+        "user_id": user_id,
+        "start": date.to_epoch(start),
+        "end": date.to_epoch(end),
+        "now": date.to_epoch(date.get_now()),
+    }
+
+    async with _read() as conn:
+        cursor = await conn.execute(f"""
+            SELECT s.name, SUM(d.duration), COUNT(*), MAX(d.duration), MIN(d.duration)
+            FROM (
+                SELECT ts.state_id, {sql.CLIPPED_DURATION} AS duration
+                FROM time_sessions ts
+                WHERE {sql.WINDOW_FILTER}
+            ) d
+            JOIN states s ON d.state_id = s.id
+            GROUP BY d.state_id
+        """, params)
+        rows = await cursor.fetchall()
+
+        if not rows:
+            return None
+
+        totals = {
+            name: {
+                "total_seconds": total,
+                "session_count": count,
+                "longest_seconds": longest,
+                "shortest_seconds": shortest,
+            }
+            for name, total, count, longest, shortest in rows
+        }
+
+        cursor = await conn.execute(f"""
+            SELECT s.name
+            FROM time_sessions ts
+            JOIN states s ON ts.state_id = s.id
+            WHERE {sql.WINDOW_FILTER}
+            ORDER BY ts.start_time
+        """, params)
+        chronology = [row[0] for row in await cursor.fetchall()]
+
+        cursor = await conn.execute(f"""
+            SELECT s.name, tg.name, {sql.CLIPPED_DURATION}
+            FROM time_sessions ts
+            JOIN states s ON ts.state_id = s.id
+            {sql.TAG_JOIN}
+            WHERE {sql.WINDOW_FILTER}
+            ORDER BY ts.start_time DESC
+            LIMIT 1
+        """, params)
+        last_name, last_tag, last_duration = await cursor.fetchone()
+
+    return {
+        "totals": totals,
+        "chronology": chronology,
+        "last_session": {
+            "state_name": last_name,
+            "tag": last_tag,
+            "duration_seconds": last_duration,
+        },
+    }
+
+
+async def get_period_totals(
+    tg_obj: Message | CallbackQuery | None = None,
+    tg_id: int | None = None,
+    first_day: datetime.date = None,
+    last_day: datetime.date = None,
+    resolution: str = "day"
+) -> list[dict] | None:
+    """
+    Предагрегированные итоги по состояниям с разбивкой по дням или месяцам.
+
+    Args:
+        tg_obj: Telegram объект (Message или CallbackQuery)
+        tg_id: Telegram ID пользователя
+        first_day: Первый день диапазона
+        last_day: Последний день диапазона (включительно)
+        resolution: "day" - строки daily_state_totals, "month" - monthly_state_totals
+            (месяцы, в которые попадают first_day и last_day, берутся целиком)
+
+    Returns:
+        Список словарей 'period', 'state_name', 'total_seconds', 'session_count',
+        'mood_sum', 'mood_count' по возрастанию периода или None
+    """
+    if tg_obj is not None:
+        tg_id = tg_obj.from_user.id
+
+    user_id = await get_user_id_by_tg_id(tg_id=tg_id)
+    if not user_id:
+        return None
+
+    if resolution == "month":
+        table, column = "monthly_state_totals", "month"
+        first, last = first_day.strftime("%Y-%m"), last_day.strftime("%Y-%m")
+    else:
+        table, column = "daily_state_totals", "day"
+        first, last = first_day.isoformat(), last_day.isoformat()
+
+    async with _read() as conn:
+        cursor = await conn.execute(f"""
+            SELECT t.{column} AS period, s.name AS state_name, t.total_seconds,
+                t.session_count, t.mood_sum, t.mood_count
+            FROM {table} t
+            JOIN states s ON t.state_id = s.id
+            WHERE t.user_id = ? AND t.{column} BETWEEN ? AND ?
+            ORDER BY t.{column}
+        """, (user_id, first, last))
+        rows = await cursor.fetchall()
+
+        if not rows:
             return None
 
         columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, state)) for state in states]
+        return [dict(zip(columns, row)) for row in rows]
+
+
+async def get_state_transitions(
+    tg_obj: Message | CallbackQuery | None = None,
+    tg_id: int | None = None,
+    from_state: str = "other"
+) -> list[dict] | None:
+    """
+    Накопленные счетчики переходов пользователя из состояния from_state.
+
+    Returns:
+        Список словарей 'weekday', 'time_bin', 'state_name', 'count' или None
+    """
+    if tg_obj is not None:
+        tg_id = tg_obj.from_user.id
+
+    user_id = await get_user_id_by_tg_id(tg_id=tg_id)
+    from_state_id = await get_state_id_by_name(state_name=from_state)
+    if not user_id or not from_state_id:
+        return None
+
+    async with _read() as conn:
+        cursor = await conn.execute("""
+            SELECT t.weekday, t.time_bin, s.name AS state_name, t.count
+            FROM state_transitions t
+            JOIN states s ON t.to_state_id = s.id
+            WHERE t.user_id = ? AND t.from_state_id = ?
+        """, (user_id, from_state_id))
+        rows = await cursor.fetchall()
+
+        if not rows:
+            return None
+
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+
+async def count_session_month_days(
+    tg_obj: Message | CallbackQuery | None = None,
+    tg_id: int | None = None,
+    limit: int = 31
+) -> int:
+    """
+    Количество разных чисел месяца, в которые начинались сессии пользователя.
+
+    Подсчет останавливается на limit, поэтому для проверки порога
+    читается только начало истории.
+    """
+    if tg_obj is not None:
+        tg_id = tg_obj.from_user.id
+
+    user_id = await get_user_id_by_tg_id(tg_id=tg_id)
+    if not user_id:
+        return 0
+
+    async with _read() as conn:
+        cursor = await conn.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT DISTINCT strftime('%d', start_time, 'unixepoch')
+                FROM time_sessions
+                WHERE user_id = ?
+                LIMIT ?
+            )
+        """, (user_id, limit))
+        return (await cursor.fetchone())[0]
 
 
 async def get_current_state(
     message: Message | None = None,
     tg_id: int | None = None
-) -> dict[str, str] | None:
-    states = await get_user_states(
-        tg_obj=message,
-        tg_id=tg_id,
-        limit=1
-    )
+) -> SessionRow | None:
+    if message is not None:
+        tg_id = message.from_user.id
 
-    if states is None:
+    user_id = await get_user_id_by_tg_id(tg_id=tg_id)
+    if not user_id:
         return None
 
-    state = states[0]
+    # Поиск по частичному индексу idx_sessions_open, без сортировки истории
+    async with _read() as conn:
+        cursor = await conn.execute(f"""
+            SELECT {sql.SESSION_COLUMNS}
+            FROM time_sessions ts
+            JOIN states s ON ts.state_id = s.id
+            {sql.TAG_JOIN}
+            WHERE ts.user_id = ? AND ts.end_time IS NULL
+        """, (user_id,))
+        cursor.row_factory = session_row
 
-    if state['end_time'] is None:
-        return state
+        return await cursor.fetchone()
 
-    return None
 
+async def get_state_by_id(state_id: int, tg_id: int | None = None) -> SessionRow | None:
+    query = f"""
+        SELECT {sql.SESSION_COLUMNS}
+        FROM time_sessions ts
+        JOIN states s ON ts.state_id = s.id
+        {sql.TAG_JOIN}
+        WHERE ts.id = ?
+    """
+    params = (state_id,)
 
-async def get_state_by_id(state_id: int, tg_id: int | None = None) -> dict | None:
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
-        query = """
-            SELECT u.tg_id, s.name, ts.tag, ts.start_time, 
-            ts.end_time, ts.duration_seconds, ts.mood
-            FROM time_sessions ts
-            JOIN users u ON ts.user_id = u.id
-            JOIN states s ON ts.state_id = s.id 
-            WHERE ts.id = ?
-        """
-        params = (state_id,)
-        
-        if tg_id is not None:
-            query += " AND u.tg_id = ?"
-            params = (state_id, tg_id)
-        
-        cursor = await conn.execute(query, params)
-        res = await cursor.fetchone()
+    if tg_id is not None:
+        # Принадлежность проверяется по users.id из кэша, без JOIN users
+        query += " AND ts.user_id = ?"
+        params = (state_id, await get_user_id_by_tg_id(tg_id=tg_id))
 
-        if not res:
-            return None
+    async with _read() as conn:
+        cursor = await conn.execute(query, params)
+        cursor.row_factory = session_row
 
-        columns = [description[0] for description in cursor.description]
-        
-        # tg_id, name(state_name), tag, 
-        # start_time, end_time, duration_seconds, mood
-        return dict(zip(columns, res))
+        return await cursor.fetchone()
 
 
 async def get_user_id_by_tg_id(
@@ -224,27 +718,54 @@ async def get_user_id_by_tg_id(
     if message is not None:
         tg_id = message.from_user.id
 
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
+    user_id = _user_ids.get(tg_id)
+    if user_id is not None:
+        return user_id
+
+    async with _read() as conn:
         cursor = await conn.execute('SELECT id FROM users WHERE tg_id = ?', (tg_id,))
         res = await cursor.fetchone()
 
-        return res[0] if res else None
+    # Отсутствие пользователя не кэшируем: он может появиться после /start
+    if not res:
+        return None
+
+    _user_ids.put(tg_id, res[0])
+    return res[0]
 
 
 async def get_user_tags(
     message: Message | None = None,
-    tg_id: int | None = None
-) -> list[str] | None:
+    tg_id: int | None = None,
+    limit: int = 20
+) -> list[tuple[str, int]] | None:
+    """
+    Самые частые теги пользователя.
+
+    Сессии группируются по индексу idx_sessions_user_tag, в Python
+    передаются только limit строк.
+
+    Returns:
+        Список (тег, количество сессий) по убыванию количества или None
+    """
     if message is not None:
         tg_id = message.from_user.id
 
     user_id = await get_user_id_by_tg_id(tg_id=tg_id)
 
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
-        cursor = await conn.execute("SELECT tag FROM time_sessions WHERE user_id = ?", (user_id, ))
+    async with _read() as conn:
+        cursor = await conn.execute("""
+            SELECT tg.name, COUNT(*) AS sessions
+            FROM time_sessions ts
+            JOIN tags tg ON ts.tag_id = tg.id
+            WHERE ts.user_id = ? AND ts.tag_id IS NOT NULL
+            GROUP BY ts.tag_id
+            ORDER BY sessions DESC
+            LIMIT ?
+        """, (user_id, limit))
         tags = await cursor.fetchall()
 
-        return [tag[0] for tag in tags if tag[0]]
+        return tags or None
 
 
 async def add_user_to_database(
@@ -258,39 +779,71 @@ async def add_user_to_database(
         username = message.from_user.username or ""
         fullname = message.from_user.full_name
 
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
+    async def write(conn: aiosqlite.Connection) -> int:
         await conn.execute(
             "INSERT OR IGNORE INTO users (tg_id, username, full_name) VALUES (?, ?, ?)",
             (tg_id, username, fullname)
         )
+        cursor = await conn.execute('SELECT id FROM users WHERE tg_id = ?', (tg_id,))
+        return (await cursor.fetchone())[0]
+
+    _user_ids.put(tg_id, await _submit(write))
 
-        await conn.commit()
 
+async def end_session(
+    user_id: int,
+    conn: aiosqlite.Connection,
+    end_time: datetime | None = None
+) -> dict | None:
+    """
+    Закрыть открытую сессию пользователя одним UPDATE ... RETURNING.
+
+    Длительность - вычисляемый столбец, дни закрытой сессии пересчитываются
+    в daily_state_totals. Запросы выполняются на переданном соединении
+    и не коммитятся - это делает вызывающий код.
+
+    Returns:
+        Закрытая сессия ('id', 'state_id', 'start_time', 'end_time', 'tag', 'state_name') или None
+    """
+    end_time = date.to_epoch(end_time or date.get_now())
 
-async def end_session(user_id: int, conn) -> None:
     cursor = await conn.execute("""
-        SELECT start_time FROM time_sessions 
-        WHERE user_id = ? AND end_time IS NULL
-    """, (user_id,))
-    result = await cursor.fetchone()
+        UPDATE time_sessions
+        SET end_time = :end_time
+        WHERE user_id = :user_id AND end_time IS NULL
+        RETURNING id, state_id, start_time, end_time,
+            (SELECT name FROM tags WHERE tags.id = tag_id) AS tag,
+            (SELECT name FROM states WHERE states.id = state_id) AS state_name
+    """, {"end_time": end_time, "user_id": user_id})
+    closed = await cursor.fetchall()
+
+    if not closed:
+        return None
 
-    if not result:
-        return
+    columns = [description[0] for description in cursor.description]
 
-    start_time_str = result[0]
-    end_time = date.get_now()
+    # Открытая сессия должна быть одна, но на всякий случай берем последнюю
+    session = dict(zip(columns, max(closed, key=lambda row: row[2])))
+    await rollup.refresh_daily_totals(conn, user_id, session['start_time'], end_time)
+
+    return session
 
-    duration_seconds = date.calculate_duration_seconds(
-        start_time=start_time_str,
-        end_time=end_time,
-        duration_seconds=None
-    )
 
-    await conn.execute("""
-        UPDATE time_sessions 
-        SET end_time = ?, duration_seconds = ?
-        WHERE user_id = ? AND end_time IS NULL
-    """, (date.to_string(end_time), duration_seconds, user_id))
+async def _last_session(conn: aiosqlite.Connection, user_id: int) -> tuple[int, int] | None:
+    """
+    (start_time, state_id) последней сессии пользователя.
+
+    Нужна, когда открытой сессии нет (например, после /import): переход
+    в новую сессию считается из последней закрытой, как при пересборке
+    переходов.
+    """
+    cursor = await conn.execute("""
+        SELECT start_time, state_id FROM time_sessions
+        WHERE user_id = ?
+        ORDER BY start_time DESC, id DESC
+        LIMIT 1
+    """, (user_id,))
+    return await cursor.fetchone()
 
 
 async def switch_state(
@@ -302,56 +855,60 @@ async def switch_state(
     if message is not None:
         tg_id = message.from_user.id
 
+    # Оба идентификатора берутся из кэша, без обращения к базе
     user_id: int = await get_user_id_by_tg_id(tg_id=tg_id)
-    #if not user_id:
-    #    return False
-
-    prev_state_data = await get_current_state(tg_id=tg_id)
-    prev_state_name = prev_state_data.get('state_name', '') if prev_state_data else None
-    prev_state_start_time = prev_state_data.get('start_time', 0) if prev_state_data else None
-    prev_state_tag = prev_state_data.get('tag', '') if prev_state_data else None
-    prev_state_time_session_id = prev_state_data.get('id', '') if prev_state_data else None
-
     state_id = await get_state_id_by_name(state_name=new_state)
-    #if not state_id:
-    #    return False
-
-    ret_dict = {
-        "previous_state": prev_state_name,
-        "start_time": prev_state_start_time,
-        "new_state": new_state,
-        "prev_tag": prev_state_tag,
-        "new_tag": tag,
-        "time_session_id": prev_state_time_session_id,
-    }
 
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
-        await end_session(user_id, conn)
+    # Закрытие прошлой сессии и начало новой - одна операция записи
+    async def write(conn: aiosqlite.Connection) -> dict | None:
+        now = date.get_now()
+        prev_state_data = await end_session(user_id, conn, end_time=now)
 
-        current_time = date.to_string(date.get_now())
+        if prev_state_data:
+            previous = (prev_state_data['start_time'], prev_state_data['state_id'])
+        else:
+            previous = await _last_session(conn, user_id)
 
         await conn.execute("""
-            INSERT INTO time_sessions (user_id, state_id, start_time, tag) VALUES (?, ?, ?, ?)
-        """, (user_id, state_id, current_time, tag))
+            INSERT INTO time_sessions (user_id, state_id, start_time, tag_id) VALUES (?, ?, ?, ?)
+        """, (user_id, state_id, date.to_epoch(now), await tags.get_tag_id(conn, user_id, tag)))
+
+        if previous:
+            await transitions.record_transition(conn, user_id, *previous, state_id)
+        await _bump_data_version(conn, user_id)
 
-        await conn.commit()
+        return prev_state_data
 
-        return ret_dict
+    prev_state_data = await _submit(write)
+
+    return {
+        "previous_state": prev_state_data['state_name'] if prev_state_data else None,
+        "start_time": prev_state_data['start_time'] if prev_state_data else None,
+        "new_state": new_state,
+        "prev_tag": prev_state_data['tag'] if prev_state_data else None,
+        "new_tag": tag,
+        "time_session_id": prev_state_data['id'] if prev_state_data else None,
+    }
 
 
 async def rate_state(time_session_id: int, mood: int) -> None:
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
-        await conn.execute("""
+    async def write(conn: aiosqlite.Connection) -> None:
+        cursor = await conn.execute("""
             UPDATE time_sessions SET mood = ? 
             WHERE id = ?
+            RETURNING user_id, start_time, end_time
         """, (mood, time_session_id))
+        session = await cursor.fetchone()
 
-        await conn.commit()
+        if session:
+            await rollup.refresh_daily_totals(conn, *session)
+            await _bump_data_version(conn, session[0])
+
+    await _submit(write)
 
 
 async def fix_states(
     first_state_end_time: datetime,
-    first_state_duration_seconds: int,
     new_state: str,
     new_tag: str,
     message: Message | None = None,
@@ -368,51 +925,405 @@ async def fix_states(
     if not state_id:
         return False
 
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
-        await conn.execute("""
+    first_state_end_time = date.to_epoch(first_state_end_time)
+
+    async def write(conn: aiosqlite.Connection) -> None:
+        cursor = await conn.execute("""
             UPDATE time_sessions 
-            SET end_time = ?, duration_seconds = ?
+            SET end_time = ?
             WHERE user_id = ? AND end_time IS NULL
-        """, (first_state_end_time, first_state_duration_seconds, user_id))
+            RETURNING start_time
+        """, (first_state_end_time, user_id))
+        closed = await cursor.fetchall()
+
+        for (start_time,) in closed:
+            await rollup.refresh_daily_totals(conn, user_id, start_time, first_state_end_time)
+
+        # Новая сессия становится следующей для закрытой, а без открытой -
+        # для последней закрытой
+        starts = [start_time for (start_time,) in closed]
+        if not starts:
+            previous = await _last_session(conn, user_id)
+            if previous:
+                starts.append(previous[0])
+        first_start = min(starts + [first_state_end_time])
+        await transitions.apply_window(conn, user_id, first_start, first_state_end_time, -1)
 
         await conn.execute("""
-            INSERT INTO time_sessions (user_id, state_id, start_time, tag) 
+            INSERT INTO time_sessions (user_id, state_id, start_time, tag_id) 
             VALUES (?, ?, ?, ?)
-        """, (user_id, state_id, first_state_end_time, new_tag))
+        """, (user_id, state_id, first_state_end_time, await tags.get_tag_id(conn, user_id, new_tag)))
+
+        await transitions.apply_window(conn, user_id, first_start, first_state_end_time, 1)
+        await _bump_data_version(conn, user_id)
 
-        await conn.commit()
+    await _submit(write)
 
     return True
 
 
+# Сколько id сессий подставляется в один UPDATE правки
+EDIT_BATCH = 500
+
+# Значение mood в правке, которое снимает оценку: None оставляет ее без изменений
+CLEAR_MOOD = object()
+
+# SET-часть правки по полям подготовленной правки (см. _prepare_edit)
+_EDIT_COLUMNS = {
+    "state_id": "state_id = ?",
+    "tag": "tag_id = (SELECT id FROM tags WHERE user_id = time_sessions.user_id AND name = ?)",
+    "mood": "mood = ?",
+}
+
+
+async def _prepare_edit(info: dict) -> dict | None:
+    """Правка info с id состояния и нормализованным тегом или None, если правка некорректна"""
+    edit = {}
+
+    if info.get('state_name'):
+        state_id = await get_state_id_by_name(state_name=info['state_name'])
+        if state_id is None:
+            return None
+        edit["state_id"] = state_id
+
+    if 'tag' in info:
+        edit["tag"] = tags.normalize(info['tag'])
+
+    mood = info.get('mood')
+    if mood is CLEAR_MOOD:
+        edit["mood"] = None
+    elif mood is not None:
+        if not 1 <= mood <= 5:
+            return None
+        edit["mood"] = mood
+
+    return edit or None
+
+
+async def _edit_sessions(
+    conn: aiosqlite.Connection,
+    ids: list[int],
+    edit: dict,
+    tg_id: int | None
+) -> list[tuple]:
+    """
+    Применить одну правку к сессиям ids одним UPDATE.
+
+    Принадлежность сессий пользователю tg_id проверяется подзапросом
+    в условии самих запросов. Переходы между состояниями пересчитываются
+    в окне затронутых сессий; итоги дней пересчитывает вызывающий код.
+    Возвращает (id, user_id, start_time, end_time) измененных сессий.
+    """
+    where = f"id IN ({', '.join('?' * len(ids))})"
+    where_params = tuple(ids)
+    if tg_id is not None:
+        where += " AND user_id = (SELECT id FROM users WHERE tg_id = ?)"
+        where_params += (tg_id,)
+
+    if edit.get("tag") is not None:
+        await conn.execute(f"""
+            INSERT INTO tags (user_id, name)
+            SELECT DISTINCT user_id, ? FROM time_sessions WHERE {where}
+            ON CONFLICT (user_id, name) DO NOTHING
+        """, (edit["tag"], *where_params))
+
+    windows = []
+    if "state_id" in edit:
+        # Смена состояния меняет переходы в правленую сессию и из нее:
+        # окно сессии - от начала предыдущей сессии до ее начала
+        cursor = await conn.execute(f"""
+            SELECT user_id, COALESCE((
+                SELECT MAX(p.start_time) FROM time_sessions p
+                WHERE p.user_id = ts.user_id AND p.start_time < ts.start_time
+            ), start_time), start_time
+            FROM time_sessions ts WHERE {where}
+        """, where_params)
+        windows = _merge_spans(await cursor.fetchall(), gap=0)
+
+        for window in windows:
+            await transitions.apply_window(conn, *window, -1)
+
+    columns = [column for column in _EDIT_COLUMNS if column in edit]
+    cursor = await conn.execute(f"""
+        UPDATE time_sessions SET {", ".join(_EDIT_COLUMNS[column] for column in columns)}
+        WHERE {where}
+        RETURNING id, user_id, start_time, end_time
+    """, (*(edit[column] for column in columns), *where_params))
+    changed = await cursor.fetchall()
+
+    for window in windows:
+        await transitions.apply_window(conn, *window, 1)
+
+    return changed
+
+
+def _merge_spans(spans: list[tuple], gap: int) -> list[list[int]]:
+    """
+    Отрезки (user_id, start, end) -> объединение отрезков каждого пользователя,
+    между которыми не больше gap секунд.
+    """
+    merged = []
+    for user_id, start, end in sorted(spans):
+        if merged and merged[-1][0] == user_id and start <= merged[-1][2] + gap:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([user_id, start, end])
+
+    return merged
+
+
+async def _apply_edits(
+    conn: aiosqlite.Connection,
+    groups: list[tuple[dict, list[int]]],
+    tg_id: int | None
+) -> list[tuple]:
+    """Применить правки [(правка, id сессий), ...] в транзакции вызывающего кода"""
+    changed = []
+    rollup_changed = []
+
+    for edit, ids in groups:
+        for i in range(0, len(ids), EDIT_BATCH):
+            rows = await _edit_sessions(conn, ids[i:i + EDIT_BATCH], edit, tg_id)
+            changed += rows
+            # Тег в итоги дней не входит
+            if "state_id" in edit or "mood" in edit:
+                rollup_changed += rows
+
+    # Сессии одного пользователя в соседних днях пересчитываются одним отрезком,
+    # открытые сессии в итоги не входят
+    closed = [(user_id, start, end) for _, user_id, start, end in rollup_changed if end is not None]
+    for span in _merge_spans(closed, gap=date.DAY_SECONDS):
+        await rollup.refresh_daily_totals(conn, *span)
+
+    for user_id in {row[1] for row in changed}:
+        await _bump_data_version(conn, user_id)
+
+    return changed
+
+
+def _edit_result(changed: list[tuple]) -> int:
+    return len({row[0] for row in changed})
+
+
+async def update_states_info(edits: list[tuple[int, dict]], tg_id: int | None = None) -> int:
+    """
+    Применить правки сессий [(id сессии, info), ...] в одной транзакции.
+
+    info - словарь с ключами state_name, tag и mood (None не меняет оценку,
+    CLEAR_MOOD снимает ее).
+    Правки одной сессии объединяются, более поздние ключи заменяют ранние.
+    Сессии с одинаковой правкой меняются одним UPDATE (до EDIT_BATCH id
+    в запросе). При tg_id меняются только сессии этого пользователя.
+    Некорректные правки (неизвестное состояние, оценка вне 1-5, пустой info)
+    пропускаются. Возвращает количество измененных сессий.
+    """
+    merged: dict[int, dict] = {}
+    for state_id, info in edits:
+        edit = await _prepare_edit(info)
+        if edit is not None:
+            merged.setdefault(state_id, {}).update(edit)
+
+    groups: dict[tuple, tuple[dict, list[int]]] = {}
+    for state_id, edit in merged.items():
+        groups.setdefault(tuple(sorted(edit.items())), (edit, []))[1].append(state_id)
+
+    if not groups:
+        return 0
+
+    async def write(conn: aiosqlite.Connection) -> list[tuple]:
+        return await _apply_edits(conn, list(groups.values()), tg_id)
+
+    return _edit_result(await _submit(write))
+
+
 async def update_state_info(state_id: int, info: dict, tg_id: int | None = None) -> bool:
-    # Проверка существования и принадлежности состояния
-    state = await get_state_by_id(state_id, tg_id)
-    if not state:
-        return False
-    
-    # Валидация mood
-    if 'mood' in info and (info['mood'] is not None and (info['mood'] < 1 or info['mood'] > 5)):
-        return False
-    
-    async with aiosqlite.connect(USERS_DB_PATH) as conn:
-        if info.get('state_name'):
-            await conn.execute("""
-                UPDATE time_sessions
-                SET state_id = (SELECT id FROM states WHERE name = ?)
-                WHERE id = ?
-            """, (info['state_name'], state_id))
-
-        if 'tag' in info:
-            await conn.execute("""
-                UPDATE time_sessions SET tag = ? WHERE id = ?
-            """, (info['tag'], state_id))
-        
-        if info.get('mood'):
-            await conn.execute("""
-                UPDATE time_sessions SET mood = ? WHERE id = ?
-            """, (info['mood'], state_id))
+    """
+    Изменить состояние, тег и/или оценку сессии (см. update_states_info).
+
+    Все измененные столбцы меняются одним UPDATE, принадлежность сессии
+    пользователю tg_id проверяется в нем же. False - сессия не найдена,
+    чужая или правка некорректна.
+    """
+    return await update_states_info([(state_id, info)], tg_id) == 1
+
+
+async def retag_sessions(tg_id: int, tag: str | None, new_tag: str | None) -> int:
+    """
+    Заменить тег tag на new_tag у всех сессий пользователя в одной транзакции.
+
+    Пустой tag выбирает сессии без тега, пустой new_tag снимает тег.
+    Возвращает количество измененных сессий.
+    """
+    tag = tags.normalize(tag)
+    edit = {"tag": tags.normalize(new_tag)}
+
+    async def write(conn: aiosqlite.Connection) -> list[tuple]:
+        if tag is None:
+            tag_filter, params = "tag_id IS NULL", (tg_id,)
+        else:
+            tag_filter = "tag_id = (SELECT id FROM tags WHERE user_id = ts.user_id AND name = ?)"
+            params = (tg_id, tag)
+
+        cursor = await conn.execute(f"""
+            SELECT id FROM time_sessions ts
+            WHERE user_id = (SELECT id FROM users WHERE tg_id = ?) AND {tag_filter}
+        """, params)
+        ids = [row[0] for row in await cursor.fetchall()]
+
+        return await _apply_edits(conn, [(edit, ids)], tg_id) if ids else []
+
+    return _edit_result(await _submit(write))
 
-        await conn.commit()
-    return True
 
+async def rate_day(tg_id: int, day: datetime, mood: int | None) -> int:
+    """
+    Поставить оценку mood всем сессиям пользователя, начавшимся в день day,
+    в одной транзакции. Возвращает количество измененных сессий.
+    """
+    edit = await _prepare_edit({"mood": mood})
+    if edit is None:
+        return 0
+
+    day_start, day_end = date.day_bounds(day)
+
+    async def write(conn: aiosqlite.Connection) -> list[tuple]:
+        cursor = await conn.execute("""
+            SELECT id FROM time_sessions
+            WHERE user_id = (SELECT id FROM users WHERE tg_id = ?)
+            AND start_time >= ? AND start_time < ?
+        """, (tg_id, date.to_epoch(day_start), date.to_epoch(day_end)))
+        ids = [row[0] for row in await cursor.fetchall()]
+
+        return await _apply_edits(conn, [(edit, ids)], tg_id) if ids else []
+
+    return _edit_result(await _submit(write))
+
+
+async def iter_user_sessions(tg_id: int, chunk_rows: int = EXPORT_CHUNK_ROWS) -> AsyncIterator[list[tuple]]:
+    """
+    Вся история пользователя для выгрузки порциями по chunk_rows строк
+    в порядке (start_time, id).
+
+    Строка - (state_name, tag, start_time, end_time, mood), время в секундах
+    как в базе. Каждая порция - отдельный запрос по ключу (start_time, id)
+    из idx_sessions_user_start: пока порция отправляется, соединение
+    читателя возвращено в пул, а в памяти не больше одной порции.
+    """
+    user_id = await get_user_id_by_tg_id(tg_id=tg_id)
+    if not user_id:
+        return
+
+    after = (-2 ** 62, 0)
+    while True:
+        async with _read() as conn:
+            cursor = await conn.execute(f"""
+                SELECT s.name, tg.name, ts.start_time, ts.end_time, ts.mood, ts.id
+                FROM time_sessions ts
+                JOIN states s ON ts.state_id = s.id
+                {sql.TAG_JOIN}
+                WHERE ts.user_id = ? AND (ts.start_time, ts.id) > (?, ?)
+                ORDER BY ts.start_time, ts.id
+                LIMIT ?
+            """, (user_id, *after, chunk_rows))
+            rows = await cursor.fetchall()
+
+        if not rows:
+            return
+
+        after = (rows[-1][2], rows[-1][5])
+        yield [row[:5] for row in rows]
+
+        if len(rows) < chunk_rows:
+            return
+
+
+async def import_sessions(
+    tg_id: int,
+    sessions: list[tuple],
+    batch_rows: int = IMPORT_BATCH_ROWS
+) -> int:
+    """
+    Добавить пользователю закрытые сессии одной транзакцией.
+
+    sessions - проверенные строки (state_name, tag, start_time, end_time, mood)
+    по возрастанию start_time, не пересекающиеся между собой, время в секундах
+    (utils.history_file.parse_csv). Сессии вставляются пачками executemany
+    по batch_rows строк. Если после вставки сессии пользователя
+    пересекаются (импорт накрывает уже записанную историю или текущую
+    сессию), транзакция откатывается с ValueError. Итоги дней
+    пересчитываются в диапазоне импорта, переходы пользователя -
+    пересобираются. Возвращает количество добавленных сессий.
+    """
+    user_id = await get_user_id_by_tg_id(tg_id=tg_id)
+    if not user_id or not sessions:
+        return 0
+
+    state_ids = {}
+    for state_name in {session[0] for session in sessions}:
+        state_ids[state_name] = await get_state_id_by_name(state_name=state_name)
+        if state_ids[state_name] is None:
+            raise ValueError(f"Неизвестное состояние {state_name}")
+
+    sessions = [
+        (state_name, tags.normalize(tag), start_time, end_time, mood)
+        for state_name, tag, start_time, end_time, mood in sessions
+    ]
+    first_start = sessions[0][2]
+    last_end = max(session[3] for session in sessions)
+
+    async def write(conn: aiosqlite.Connection) -> int:
+        tag_names = sorted({session[1] for session in sessions if session[1] is not None})
+        if tag_names:
+            await conn.executemany("""
+                INSERT INTO tags (user_id, name) VALUES (?, ?)
+                ON CONFLICT (user_id, name) DO NOTHING
+            """, [(user_id, name) for name in tag_names])
+
+        cursor = await conn.execute("SELECT name, id FROM tags WHERE user_id = ?", (user_id,))
+        tag_ids = dict(await cursor.fetchall())
+
+        for i in range(0, len(sessions), batch_rows):
+            await conn.executemany("""
+                INSERT INTO time_sessions (user_id, state_id, start_time, end_time, tag_id, mood)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [
+                (user_id, state_ids[state_name], start_time, end_time, tag_ids.get(tag), mood)
+                for state_name, tag, start_time, end_time, mood in sessions[i:i + batch_rows]
+            ])
+
+        # Соседние по времени сессии пользователя, включая сессию перед импортом
+        # и открытую (она длится до сейчас), не должны пересекаться
+        cursor = await conn.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT COALESCE(end_time, :now) AS end_time,
+                    LEAD(start_time) OVER (ORDER BY start_time, id) AS next_start
+                FROM time_sessions
+                WHERE user_id = :user_id AND start_time <= :last_end
+                AND start_time >= COALESCE((
+                    SELECT MAX(start_time) FROM time_sessions
+                    WHERE user_id = :user_id AND start_time < :first_start
+                ), :first_start)
+            )
+            WHERE end_time > next_start
+        """, {
+            "user_id": user_id,
+            "first_start": first_start,
+            "last_end": last_end,
+            "now": date.to_epoch(date.get_now()),
+        })
+        (overlaps,) = await cursor.fetchone()
+        if overlaps:
+            raise ValueError(f"Импорт пересекается с историей пользователя: {overlaps} пересечений")
+
+        spans = [(user_id, start_time, end_time) for _, _, start_time, end_time, _ in sessions]
+        for span in _merge_spans(spans, gap=date.DAY_SECONDS):
+            await rollup.refresh_daily_totals(conn, *span)
+
+        # Вставка может задеть переходы по всей истории: пересборка одного
+        # пользователя линейна, в отличие от окна apply_window на годы назад
+        await transitions.rebuild_users_transitions(conn, user_id, user_id)
+        await _bump_data_version(conn, user_id)
+
+        return len(sessions)
+
+    return await _submit(write)
@@ -0,0 +1,249 @@
+"""
+Групповая фиксация записей.
+
+Обработчики не коммитят каждую запись отдельно: операция записи
+(корутина op(conn), которая выполняет запросы без commit) ставится
+в очередь, а координатор раз в `window` секунд или по набору
+`max_batch` операций выполняет их подряд на соединении-писателе в одной
+транзакции и коммитит ее один раз. Вызывающий код получает результат
+своей операции только после общего коммита, поэтому сразу после
+await записанное видно читателям.
+
+Каждая операция пачки выполняется в своей точке сохранения (SAVEPOINT):
+исключение откатывает только эту операцию и передается ее вызывающему
+коду, остальные операции пачки фиксируются. Ошибка самого COMMIT
+передается всем операциям пачки.
+
+Операция выполняется в контексте (contextvars) вызывающего кода, поэтому
+метрики SQL и поля логов относятся к обработчику, который ее поставил.
+
+Непредвиденная ошибка координатора (не операции и не COMMIT) передается
+операциям своей пачки и пишется в лог, следующие пачки выполняются как
+обычно. Если задача координатора все же завершилась (отмена), ожидающие
+операции получают ошибку, а новые не принимаются.
+"""
+import asyncio
+import contextvars
+import time
+from contextlib import AbstractAsyncContextManager
+from typing import Any, Awaitable, Callable
+
+import aiosqlite
+
+from utils import bot_logging as bot_log
+from utils import metrics
+
+logger = bot_log.get_logger(__name__)
+
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+class _Write:
+    __slots__ = ("op", "future", "context", "submitted")
+
+    def __init__(self, op: WriteOp, future: asyncio.Future) -> None:
+        self.op = op
+        self.future = future
+        self.context = contextvars.copy_context()
+        self.submitted = time.perf_counter()
+
+
+class WriteCoordinator:
+    """Очередь операций записи с фиксацией пачками
+
+    Args:
+        writer: фабрика контекста соединения-писателя (core._write)
+        window: сколько секунд собирать пачку после первой операции
+            (0 - без ожидания: в пачку попадает то, что накопилось за время прошлого коммита)
+        max_batch: максимальное число операций в одной транзакции
+    """
+
+    def __init__(
+        self,
+        writer: Callable[[], AbstractAsyncContextManager[aiosqlite.Connection]],
+        window: float = 0.0,
+        max_batch: int = 64
+    ) -> None:
+        if max_batch < 1:
+            raise ValueError("Размер пачки должен быть не меньше 1")
+
+        self.writer = writer
+        self.window = window
+        self.max_batch = max_batch
+
+        self._queue: asyncio.Queue[_Write | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+        self._batches = 0
+        self._writes = 0
+        self._failed = 0
+        self._largest_batch = 0
+        self._commit_total = 0.0
+        self._commit_max = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, op: WriteOp) -> Any:
+        """Поставить операцию в очередь и дождаться ее результата после коммита"""
+        if self._closing or self._task is None or self._task.done():
+            raise RuntimeError("Координатор записи не запущен")
+
+        write = _Write(op, asyncio.get_running_loop().create_future())
+        self._queue.put_nowait(write)
+
+        return await write.future
+
+    async def close(self) -> None:
+        """Перестать принимать операции и зафиксировать уже поставленные"""
+        if self._task is None:
+            return
+
+        if not self._closing:
+            self._closing = True
+            self._queue.put_nowait(None)
+
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            # Отменена задача координатора, а не вызывающий код
+            if not self._task.cancelled():
+                raise
+        except Exception:
+            # Ожидавшие операции уже получили ошибку в _run
+            logger.exception("Координатор записи завершился с ошибкой")
+
+    async def _collect(self, batch: list[_Write]) -> bool:
+        """Собрать пачку операций в batch. Возвращает признак остановки"""
+        first = await self._queue.get()
+        if first is None:
+            return True
+
+        batch.append(first)
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                write = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    write = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            if write is None:
+                return True
+            batch.append(write)
+
+        return False
+
+    async def _run(self) -> None:
+        batch: list[_Write] = []
+        try:
+            while True:
+                # Пачка заполняется на месте: при отмене во время сбора
+                # уже взятые из очереди операции получат ошибку в finally
+                batch = []
+                stop = await self._collect(batch)
+                if batch:
+                    try:
+                        await self._flush(batch)
+                    except Exception as e:
+                        logger.exception("Ошибка координатора записи, пачка из %s операций", len(batch))
+                        self._fail(batch, e)
+                if stop:
+                    return
+        finally:
+            # Задача завершается: новые операции не принимаются, ожидающие получают ошибку
+            self._closing = True
+            error = RuntimeError("Координатор записи остановлен")
+            self._fail(batch, error)
+            while not self._queue.empty():
+                write = self._queue.get_nowait()
+                if write is not None:
+                    self._fail([write], error)
+
+    def _fail(self, batch: list[_Write], error: BaseException) -> None:
+        for write in batch:
+            if not write.future.done():
+                self._failed += 1
+                write.future.set_exception(error)
+
+    @staticmethod
+    async def _run_savepoint(conn: aiosqlite.Connection, write: _Write) -> tuple[bool, Any]:
+        """Выполнить операцию в точке сохранения: ошибка откатывает только ее"""
+        await conn.execute("SAVEPOINT group_write")
+        try:
+            result = await asyncio.create_task(write.op(conn), context=write.context)
+        except Exception as e:
+            await conn.execute("ROLLBACK TO group_write")
+            await conn.execute("RELEASE group_write")
+            return False, e
+
+        await conn.execute("RELEASE group_write")
+        return True, result
+
+    async def _flush(self, batch: list[_Write]) -> None:
+        outcomes: list[tuple[bool, Any]] = []
+
+        try:
+            async with self.writer() as conn:
+                await conn.execute("BEGIN IMMEDIATE")
+
+                if len(batch) == 1:
+                    # Точка сохранения не нужна: ошибка единственной операции откатывает всю транзакцию
+                    write = batch[0]
+                    outcomes.append((True, await asyncio.create_task(write.op(conn), context=write.context)))
+                else:
+                    for write in batch:
+                        outcomes.append(await self._run_savepoint(conn, write))
+
+                started = time.perf_counter()
+                await conn.commit()
+                commit_elapsed = time.perf_counter() - started
+        except Exception as e:
+            # Транзакция откатана целиком (ConnectionPool.writer): не записана ни одна операция
+            self._fail(batch, e)
+            return
+
+        # Сначала результаты: учет ниже не должен задерживать или терять их
+        resolved = time.perf_counter()
+        for write, (ok, value) in zip(batch, outcomes):
+            if write.future.done():
+                # Вызывающий код отменен, но его запись уже зафиксирована
+                continue
+            if ok:
+                write.future.set_result(value)
+            else:
+                self._failed += 1
+                write.future.set_exception(value)
+
+        try:
+            self._batches += 1
+            self._writes += len(batch)
+            self._largest_batch = max(self._largest_batch, len(batch))
+            self._commit_total += commit_elapsed
+            self._commit_max = max(self._commit_max, commit_elapsed)
+
+            metrics.write_batch_size.observe(len(batch))
+            metrics.write_commit_seconds.observe(commit_elapsed)
+            for write in batch:
+                metrics.write_wait_seconds.observe(resolved - write.submitted)
+        except Exception:
+            logger.exception("Ошибка учета пачки записей")
+
+    def stats(self) -> dict:
+        return {
+            "batches": self._batches,
+            "writes": self._writes,
+            "failed": self._failed,
+            "avg_batch": round(self._writes / self._batches, 2) if self._batches else 0.0,
+            "max_batch": self._largest_batch,
+            "commit_avg_ms": self._commit_total / self._batches * 1000 if self._batches else 0.0,
+            "commit_max_ms": self._commit_max * 1000,
+            "queued": self._queue.qsize(),
+        }
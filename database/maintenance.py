@@ -0,0 +1,83 @@
+"""
+Служебные команды для базы пользователей.
+
+Запуск:
+    python -m database.maintenance daily-totals [--batch-users 500]
+    python -m database.maintenance transitions [--batch-users 500]
+    python -m database.maintenance epoch-backfill [--batch-rows 5000]
+
+epoch-backfill - подготовка к миграции 6 на базе, которую обслуживает
+бот предыдущей версии: переносит time_sessions в целочисленную копию
+без долгой блокировки записи. Схему при этом не мигрирует.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.getcwd())
+
+from config import USERS_DB_PATH  # noqa: E402
+from database import core as db  # noqa: E402
+from database import rollup, timestamps, transitions  # noqa: E402
+from database.pool import connect  # noqa: E402
+
+
+async def rebuild_daily_totals(args: argparse.Namespace) -> None:
+    conn = await connect(USERS_DB_PATH)
+    try:
+        started = time.perf_counter()
+        rows = await rollup.rebuild_daily_totals(conn, batch_users=args.batch_users)
+        print(f"daily_state_totals: {rows} строк за {time.perf_counter() - started:.1f}с")
+    finally:
+        await conn.close()
+
+
+async def rebuild_transitions(args: argparse.Namespace) -> None:
+    conn = await connect(USERS_DB_PATH)
+    try:
+        started = time.perf_counter()
+        rows = await transitions.rebuild_transitions(conn, batch_users=args.batch_users)
+        print(f"state_transitions: {rows} строк за {time.perf_counter() - started:.1f}с")
+    finally:
+        await conn.close()
+
+
+async def epoch_backfill(args: argparse.Namespace) -> None:
+    conn = await connect(USERS_DB_PATH)
+    try:
+        started = time.perf_counter()
+        rows = await timestamps.backfill(conn, batch_rows=args.batch_rows)
+        print(f"time_sessions_v2: {rows} строк за {time.perf_counter() - started:.1f}с")
+    finally:
+        await conn.close()
+
+
+COMMANDS = {
+    "daily-totals": rebuild_daily_totals,
+    "transitions": rebuild_transitions,
+    "epoch-backfill": epoch_backfill,
+}
+
+# Команды, которые готовят базу к миграции и не должны ее запускать
+PRE_MIGRATION_COMMANDS = {"epoch-backfill"}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Обслуживание базы TimeTracker")
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("--batch-users", type=int, default=500,
+                        help="пользователей в одной транзакции пересборки")
+    parser.add_argument("--batch-rows", type=int, default=5000,
+                        help="строк time_sessions в одной транзакции переноса")
+    args = parser.parse_args()
+
+    # Схема должна быть актуальной до пересборки производных таблиц
+    if args.command not in PRE_MIGRATION_COMMANDS:
+        await db.init_db()
+    await COMMANDS[args.command](args)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+"""
+Версионированные миграции схемы users_db.
+
+Номер последней примененной миграции хранится в PRAGMA user_version.
+Каждая миграция выполняется в своей транзакции вместе с обновлением версии.
+"""
+from typing import Awaitable, Callable
+
+import aiosqlite
+
+from database import rollup, tags, timestamps, transitions
+from utils import bot_logging as bot_log
+
+logger = bot_log.get_logger(__name__)
+
+Migration = Callable[[aiosqlite.Connection], Awaitable[None]]
+
+
+async def _open_session_indexes(conn: aiosqlite.Connection) -> None:
+    # Уникальный частичный индекс не создастся, если у пользователя
+    # несколько открытых сессий. Закрываем все, кроме последней,
+    # временем начала следующей сессии.
+    await conn.execute("""
+        UPDATE time_sessions AS ts
+        SET end_time = COALESCE((
+            SELECT MIN(n.start_time) FROM time_sessions n
+            WHERE n.user_id = ts.user_id AND n.start_time > ts.start_time
+        ), ts.start_time)
+        WHERE ts.end_time IS NULL AND EXISTS (
+            SELECT 1 FROM time_sessions o
+            WHERE o.user_id = ts.user_id AND o.end_time IS NULL
+            AND (o.start_time > ts.start_time OR (o.start_time = ts.start_time AND o.id > ts.id))
+        )
+    """)
+    await conn.execute("""
+        UPDATE time_sessions
+        SET duration_seconds = strftime('%s', end_time) - strftime('%s', start_time)
+        WHERE end_time IS NOT NULL AND duration_seconds IS NULL
+    """)
+
+    await conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_open
+        ON time_sessions (user_id) WHERE end_time IS NULL
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_start
+        ON time_sessions (user_id, start_time DESC)
+    """)
+    # Покрывается idx_sessions_user_start
+    await conn.execute("DROP INDEX IF EXISTS idx_sessions_user_id")
+
+
+# Производные таблицы миграций 2-4 заполняются в _epoch_timestamps:
+# код пересборки работает с целочисленным временем, а база, проходящая
+# эти миграции, в том же migrate() дойдет и до миграции 6.
+async def _daily_state_totals(conn: aiosqlite.Connection) -> None:
+    await conn.execute(rollup.CREATE_DAILY_TOTALS)
+
+
+async def _monthly_state_totals(conn: aiosqlite.Connection) -> None:
+    await conn.execute(rollup.CREATE_MONTHLY_TOTALS)
+
+
+async def _state_transitions(conn: aiosqlite.Connection) -> None:
+    await conn.execute(transitions.CREATE_STATE_TRANSITIONS)
+
+
+async def _tags_dictionary(conn: aiosqlite.Connection) -> None:
+    await conn.execute(tags.CREATE_TAGS)
+    await conn.execute("ALTER TABLE time_sessions ADD COLUMN tag_id INTEGER REFERENCES tags(id)")
+
+    await conn.create_function("normalize_tag", 1, tags.normalize, deterministic=True)
+    await conn.execute("""
+        INSERT OR IGNORE INTO tags (user_id, name)
+        SELECT DISTINCT user_id, normalize_tag(tag) FROM time_sessions
+        WHERE normalize_tag(tag) IS NOT NULL
+    """)
+    await conn.execute("""
+        UPDATE time_sessions
+        SET tag_id = (
+            SELECT id FROM tags
+            WHERE tags.user_id = time_sessions.user_id AND tags.name = normalize_tag(time_sessions.tag)
+        )
+        WHERE normalize_tag(tag) IS NOT NULL
+    """)
+
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_tag
+        ON time_sessions (user_id, tag_id)
+    """)
+    await conn.execute("ALTER TABLE time_sessions DROP COLUMN tag")
+
+
+async def _epoch_timestamps(conn: aiosqlite.Connection) -> None:
+    await timestamps.swap(conn)
+
+    rebuilds = {
+        "daily_state_totals": rollup.rebuild_users_daily_totals,
+        "monthly_state_totals": rollup.rebuild_users_monthly_totals,
+        "state_transitions": transitions.rebuild_users_transitions,
+    }
+    for table, rebuild in rebuilds.items():
+        cursor = await conn.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+        if not (await cursor.fetchone())[0]:
+            await rebuild(conn, 0, 2 ** 62)
+
+
+async def _history_seek_index(conn: aiosqlite.Connection) -> None:
+    # Постраничная история идет по ключу (start_time, id). Без id в индексе
+    # SQLite досортировывает страницу во временном B-дереве; по возрастающему
+    # индексу запросы с ORDER BY start_time DESC читают его в обратном порядке
+    await conn.execute("DROP INDEX IF EXISTS idx_sessions_user_start")
+    await conn.execute("""
+        CREATE INDEX idx_sessions_user_start
+        ON time_sessions (user_id, start_time, id)
+    """)
+
+
+async def _user_data_version(conn: aiosqlite.Connection) -> None:
+    # Версия данных для кэша отрисованных сообщений хранится в базе, чтобы
+    # записи любого экземпляра бота сбрасывали кэш всех экземпляров
+    await conn.execute("ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0")
+
+
+MIGRATIONS: list[Migration] = [
+    _open_session_indexes,
+    _daily_state_totals,
+    _monthly_state_totals,
+    _state_transitions,
+    _tags_dictionary,
+    _epoch_timestamps,
+    _history_seek_index,
+    _user_data_version,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def get_version(conn: aiosqlite.Connection) -> int:
+    cursor = await conn.execute("PRAGMA user_version")
+    return (await cursor.fetchone())[0]
+
+
+async def migrate(conn: aiosqlite.Connection) -> int:
+    """Применить недостающие миграции. Возвращает итоговую версию схемы"""
+    version = await get_version(conn)
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info(f"Применение миграции {number}: {migration.__name__}")
+
+        await conn.execute("BEGIN")
+        try:
+            await migration(conn)
+            await conn.execute(f"PRAGMA user_version = {number}")
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+        version = number
+
+    return version
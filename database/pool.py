@@ -0,0 +1,148 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import aiosqlite
+
+
+PRAGMAS = (
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=10000',
+)
+
+
+async def connect(path: str) -> aiosqlite.Connection:
+    """Открыть соединение и применить к нему PRAGMA (один раз на соединение)"""
+    conn = await aiosqlite.connect(path)
+    for pragma in PRAGMAS:
+        await conn.execute(pragma)
+
+    return conn
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений с SQLite.
+
+    Одно соединение выделено под запись (SQLite всё равно допускает
+    только одного писателя), остальные `size` соединений - для чтения.
+    В WAL режиме читатели не блокируются писателем.
+
+    Args:
+        path: путь к файлу базы
+        size: количество соединений для чтения
+    """
+
+    def __init__(self, path: str, size: int = 4) -> None:
+        if size < 1:
+            raise ValueError("Размер пула должен быть не меньше 1")
+
+        self.path = path
+        self.size = size
+
+        self._readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._all_readers: list[aiosqlite.Connection] = []
+        self._writer: aiosqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+        self._closed = True
+
+        self._reads = 0
+        self._writes = 0
+        self._readers_in_use = 0
+        self._writer_in_use = False
+        self._read_wait_total = 0.0
+        self._read_wait_max = 0.0
+        self._write_wait_total = 0.0
+        self._write_wait_max = 0.0
+
+    async def open(self) -> None:
+        if not self._closed:
+            return
+
+        self._writer = await connect(self.path)
+        for _ in range(self.size):
+            conn = await connect(self.path)
+            self._all_readers.append(conn)
+            self._readers.put_nowait(conn)
+
+        self._closed = False
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+
+        self._closed = True
+
+        # Дожидаемся завершения текущей записи, чтобы не оборвать транзакцию
+        async with self._write_lock:
+            await self._writer.close()
+            self._writer = None
+
+        for conn in self._all_readers:
+            await conn.close()
+
+        self._all_readers.clear()
+        self._readers = asyncio.Queue()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+
+        started = time.perf_counter()
+        conn = await self._readers.get()
+        waited = time.perf_counter() - started
+
+        self._reads += 1
+        self._read_wait_total += waited
+        self._read_wait_max = max(self._read_wait_max, waited)
+        self._readers_in_use += 1
+
+        try:
+            yield conn
+        finally:
+            self._readers_in_use -= 1
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+
+        started = time.perf_counter()
+        async with self._write_lock:
+            waited = time.perf_counter() - started
+
+            self._writes += 1
+            self._write_wait_total += waited
+            self._write_wait_max = max(self._write_wait_max, waited)
+            self._writer_in_use = True
+
+            try:
+                yield self._writer
+            except BaseException:
+                # Не оставляем открытую транзакцию на общем соединении
+                if self._writer.in_transaction:
+                    await self._writer.rollback()
+                raise
+            finally:
+                self._writer_in_use = False
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "readers_in_use": self._readers_in_use,
+            "writer_in_use": self._writer_in_use,
+            "reads": self._reads,
+            "writes": self._writes,
+            "read_wait_avg_ms": self._read_wait_total / self._reads * 1000 if self._reads else 0.0,
+            "read_wait_max_ms": self._read_wait_max * 1000,
+            "write_wait_avg_ms": self._write_wait_total / self._writes * 1000 if self._writes else 0.0,
+            "write_wait_max_ms": self._write_wait_max * 1000,
+        }
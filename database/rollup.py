@@ -0,0 +1,207 @@
+"""
+Поддержка таблиц предагрегированных итогов по состояниям.
+
+Строка daily_state_totals - сумма закрытых сессий пользователя в одном
+состоянии за один день. Сессия, пересекающая полночь, делится между днями.
+monthly_state_totals собирается из посуточных итогов. При любом изменении
+сессии пересчитываются только затронутые ею дни и месяцы.
+"""
+from datetime import datetime
+
+import aiosqlite
+
+from database import sql
+from utils import date
+
+
+# Закрытые сессии, разбитые по дням (рекурсивно добавляем следующий день,
+# пока сессия не закончилась), и их агрегирование в строки daily_state_totals.
+# Границы дней - целые секунды, кратные суткам (см. utils.date.EPOCH).
+# {sessions_filter} ограничивает исходные сессии (алиас ts).
+_INSERT_DAILY_TOTALS = f"""
+    WITH RECURSIVE segments(user_id, state_id, day_start, start_time, end_time, mood) AS (
+        SELECT ts.user_id, ts.state_id, ts.start_time - ts.start_time % {date.DAY_SECONDS},
+            ts.start_time, ts.end_time, ts.mood
+        FROM time_sessions ts
+        WHERE ts.end_time IS NOT NULL AND {{sessions_filter}}
+
+        UNION ALL
+
+        SELECT user_id, state_id, day_start + {date.DAY_SECONDS}, start_time, end_time, mood
+        FROM segments
+        WHERE day_start + {date.DAY_SECONDS} < end_time
+    )
+    INSERT INTO daily_state_totals
+        (user_id, day, state_id, total_seconds, session_count, mood_sum, mood_count)
+    SELECT user_id, date(day_start, 'unixepoch'), state_id,
+        SUM(MIN(end_time, day_start + {date.DAY_SECONDS}) - MAX(start_time, day_start)),
+        COUNT(*),
+        COALESCE(SUM(mood), 0),
+        COUNT(mood)
+    FROM segments
+    WHERE day_start BETWEEN :first_day_start AND :last_day_start
+    GROUP BY user_id, day_start, state_id
+"""
+
+CREATE_DAILY_TOTALS = """
+    CREATE TABLE IF NOT EXISTS daily_state_totals (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        state_id INTEGER NOT NULL,
+        total_seconds INTEGER NOT NULL DEFAULT 0,
+        session_count INTEGER NOT NULL DEFAULT 0,
+        mood_sum INTEGER NOT NULL DEFAULT 0,
+        mood_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, state_id),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (state_id) REFERENCES states(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+"""
+
+
+CREATE_MONTHLY_TOTALS = """
+    CREATE TABLE IF NOT EXISTS monthly_state_totals (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        state_id INTEGER NOT NULL,
+        total_seconds INTEGER NOT NULL DEFAULT 0,
+        session_count INTEGER NOT NULL DEFAULT 0,
+        mood_sum INTEGER NOT NULL DEFAULT 0,
+        mood_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, state_id),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (state_id) REFERENCES states(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+"""
+
+# Месячные итоги собираются из посуточных, а не из сырых сессий
+_INSERT_MONTHLY_TOTALS = """
+    INSERT INTO monthly_state_totals
+        (user_id, month, state_id, total_seconds, session_count, mood_sum, mood_count)
+    SELECT user_id, substr(day, 1, 7), state_id,
+        SUM(total_seconds), SUM(session_count), SUM(mood_sum), SUM(mood_count)
+    FROM daily_state_totals
+    WHERE user_id BETWEEN :first_user_id AND :last_user_id
+    AND day BETWEEN :first_month || '-01' AND :last_month || '-31'
+    GROUP BY user_id, substr(day, 1, 7), state_id
+"""
+
+
+async def _refresh_monthly_totals(
+    conn: aiosqlite.Connection,
+    first_user_id: int,
+    last_user_id: int,
+    first_month: str,
+    last_month: str
+) -> None:
+    await conn.execute("""
+        DELETE FROM monthly_state_totals
+        WHERE user_id BETWEEN ? AND ? AND month BETWEEN ? AND ?
+    """, (first_user_id, last_user_id, first_month, last_month))
+
+    await conn.execute(_INSERT_MONTHLY_TOTALS, {
+        "first_user_id": first_user_id,
+        "last_user_id": last_user_id,
+        "first_month": first_month,
+        "last_month": last_month,
+    })
+
+
+async def refresh_daily_totals(
+    conn: aiosqlite.Connection,
+    user_id: int,
+    start_time: datetime | int,
+    end_time: datetime | int | None
+) -> None:
+    """
+    Пересчитать итоги пользователя за дни, которые задевает сессия [start_time, end_time],
+    и месячные итоги этих дней.
+
+    Выполняется на переданном соединении в транзакции вызывающего кода.
+    Открытые сессии (end_time is None) в итоги не входят.
+    """
+    if end_time is None:
+        return
+
+    start_time = date.to_datetime(start_time)
+    end_time = date.to_datetime(end_time)
+
+    range_start, _ = date.day_bounds(start_time)
+    last_day_start, range_end = date.day_bounds(end_time)
+    first_day = range_start.date().isoformat()
+    last_day = end_time.date().isoformat()
+
+    await conn.execute("""
+        DELETE FROM daily_state_totals
+        WHERE user_id = ? AND day BETWEEN ? AND ?
+    """, (user_id, first_day, last_day))
+
+    await conn.execute(
+        _INSERT_DAILY_TOTALS.format(sessions_filter=sql.WINDOW_FILTER),
+        {
+            "user_id": user_id,
+            "start": date.to_epoch(range_start),
+            "end": date.to_epoch(range_end),
+            "first_day_start": date.to_epoch(range_start),
+            "last_day_start": date.to_epoch(last_day_start),
+        }
+    )
+
+    await _refresh_monthly_totals(conn, user_id, user_id, first_day[:7], last_day[:7])
+
+
+async def rebuild_users_daily_totals(
+    conn: aiosqlite.Connection,
+    first_user_id: int,
+    last_user_id: int
+) -> None:
+    """Полностью пересобрать посуточные итоги пользователей с id в [first_user_id, last_user_id]"""
+    await conn.execute("""
+        DELETE FROM daily_state_totals WHERE user_id BETWEEN ? AND ?
+    """, (first_user_id, last_user_id))
+
+    await conn.execute(
+        _INSERT_DAILY_TOTALS.format(
+            sessions_filter="ts.user_id BETWEEN :first_user_id AND :last_user_id"
+        ),
+        {
+            "first_user_id": first_user_id,
+            "last_user_id": last_user_id,
+            "first_day_start": -2 ** 62,
+            "last_day_start": 2 ** 62,
+        }
+    )
+
+
+async def rebuild_users_monthly_totals(
+    conn: aiosqlite.Connection,
+    first_user_id: int,
+    last_user_id: int
+) -> None:
+    """Пересобрать месячные итоги пользователей с id в [first_user_id, last_user_id] из посуточных"""
+    await _refresh_monthly_totals(conn, first_user_id, last_user_id, "0000-01", "9999-12")
+
+
+async def rebuild_daily_totals(conn: aiosqlite.Connection, batch_users: int = 500) -> int:
+    """
+    Пересобрать daily_state_totals и monthly_state_totals из time_sessions пачками пользователей.
+
+    Каждая пачка - отдельная короткая транзакция, поэтому пересборку можно
+    запускать на работающей базе. Возвращает количество строк итогов.
+    """
+    cursor = await conn.execute("SELECT COALESCE(MAX(id), 0) FROM users")
+    max_user_id = (await cursor.fetchone())[0]
+
+    for first_user_id in range(1, max_user_id + 1, batch_users):
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            last_user_id = first_user_id + batch_users - 1
+            await rebuild_users_daily_totals(conn, first_user_id, last_user_id)
+            await rebuild_users_monthly_totals(conn, first_user_id, last_user_id)
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+    cursor = await conn.execute("SELECT COUNT(*) FROM daily_state_totals")
+    return (await cursor.fetchone())[0]
@@ -0,0 +1,77 @@
+"""
+Типизированные строки time_sessions.
+
+Строка разбирается один раз на границе базы: время приходит как datetime,
+длительность - уже итоговая (у открытой сессии - до момента чтения).
+Обработчики и форматтеры больше не разбирают время и не пересчитывают
+длительность сами.
+"""
+import sqlite3
+from datetime import datetime
+
+from utils import date
+
+
+class SessionRow:
+    """Сессия пользователя в порядке столбцов sql.SESSION_COLUMNS"""
+
+    __slots__ = (
+        "id", "user_id", "state_id", "start_time", "end_time",
+        "tag", "duration_seconds", "mood", "state_name",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        user_id: int,
+        state_id: int,
+        start_time: datetime,
+        end_time: datetime | None,
+        tag: str | None,
+        duration_seconds: int,
+        mood: int | None,
+        state_name: str
+    ) -> None:
+        self.id = id
+        self.user_id = user_id
+        self.state_id = state_id
+        self.start_time = start_time
+        self.end_time = end_time
+        self.tag = tag
+        self.duration_seconds = duration_seconds
+        self.mood = mood
+        self.state_name = state_name
+
+    @property
+    def is_open(self) -> bool:
+        return self.end_time is None
+
+    @property
+    def cursor(self) -> tuple[int, int]:
+        """Ключ постраничной истории (start_time, id), см. core.get_user_states_page"""
+        return date.to_epoch(self.start_time), self.id
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return (
+            f"SessionRow(id={self.id}, state_name={self.state_name!r}, "
+            f"start_time={self.start_time}, end_time={self.end_time}, "
+            f"duration_seconds={self.duration_seconds})"
+        )
+
+
+def session_row(cursor: sqlite3.Cursor, row: tuple) -> SessionRow:
+    """row_factory для запросов, выбирающих sql.SESSION_COLUMNS"""
+    id, user_id, state_id, start_time, end_time, tag, duration_seconds, mood, state_name = row
+
+    if end_time is None:
+        duration_seconds = date.to_epoch(date.get_now()) - start_time
+    else:
+        end_time = date.from_epoch(end_time)
+
+    return SessionRow(
+        id, user_id, state_id, date.from_epoch(start_time), end_time,
+        tag, duration_seconds, mood, state_name
+    )
@@ -0,0 +1,32 @@
+"""
+Общие фрагменты SQL для запросов к time_sessions (алиас ts).
+
+start_time/end_time и параметры :start, :end, :now - целые секунды (utils.date.to_epoch).
+"""
+
+# Столбцы сессии с именами состояния и тега; требует JOIN states s и TAG_JOIN.
+# Порядок столбцов - порядок полей rows.SessionRow
+SESSION_COLUMNS = """
+    ts.id, ts.user_id, ts.state_id, ts.start_time, ts.end_time,
+    tg.name AS tag, ts.duration_seconds, ts.mood, s.name AS state_name
+"""
+
+TAG_JOIN = "LEFT JOIN tags tg ON ts.tag_id = tg.id"
+
+# Сессии пользователя, пересекающиеся с окном [:start, :end).
+# Сессии не пересекаются между собой, поэтому начаться раньше окна
+# может только последняя сессия до :start (см. get_user_states_between).
+WINDOW_FILTER = """
+    ts.user_id = :user_id
+    AND ts.start_time < :end
+    AND ts.start_time >= COALESCE((
+        SELECT MAX(prev.start_time) FROM time_sessions prev
+        WHERE prev.user_id = :user_id AND prev.start_time < :start
+    ), :start)
+    AND (ts.end_time IS NULL OR ts.end_time > :start)
+"""
+
+# Длительность сессии внутри окна; открытая сессия длится до :now
+CLIPPED_DURATION = """
+    MIN(COALESCE(ts.end_time, :now), :end) - MAX(ts.start_time, :start)
+"""
@@ -0,0 +1,44 @@
+"""
+Справочник тегов пользователей.
+
+Текст тега хранится один раз в tags, сессии ссылаются на него через
+time_sessions.tag_id. Пустой тег - это tag_id IS NULL.
+"""
+import aiosqlite
+
+
+CREATE_TAGS = """
+    CREATE TABLE IF NOT EXISTS tags (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        UNIQUE (user_id, name),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+"""
+
+
+def normalize(tag: str | None) -> str | None:
+    """Текст тега без лишних пробелов или None для пустого тега"""
+    if not tag:
+        return None
+
+    return " ".join(tag.split()) or None
+
+
+async def get_tag_id(conn: aiosqlite.Connection, user_id: int, tag: str | None) -> int | None:
+    """
+    id тега пользователя, тег создается при первом использовании.
+
+    Выполняется на переданном соединении в транзакции вызывающего кода.
+    """
+    name = normalize(tag)
+    if name is None:
+        return None
+
+    cursor = await conn.execute("""
+        INSERT INTO tags (user_id, name) VALUES (?, ?)
+        ON CONFLICT (user_id, name) DO UPDATE SET name = excluded.name
+        RETURNING id
+    """, (user_id, name))
+    return (await cursor.fetchone())[0]
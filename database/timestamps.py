@@ -0,0 +1,159 @@
+"""
+Перевод time_sessions с TEXT-времени ('YYYY-MM-DD HH:MM:SS') на целые секунды.
+
+Схема переезжает через копию time_sessions_v2:
+    1. prepare() создает копию и триггеры, которые зеркалируют в нее
+       каждую запись в time_sessions;
+    2. backfill() переносит существующие строки короткими транзакциями -
+       это можно делать на работающем боте старой версии
+       (python -m database.maintenance epoch-backfill);
+    3. swap() в миграции заменяет time_sessions копией. Если backfill()
+       не запускался, миграция переносит все строки сама.
+
+duration_seconds в новой таблице - вычисляемый столбец end_time - start_time.
+"""
+import asyncio
+
+import aiosqlite
+
+
+CREATE_SESSIONS_V2 = """
+    CREATE TABLE IF NOT EXISTS time_sessions_v2 (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        state_id INTEGER NOT NULL,
+        start_time INTEGER NOT NULL,
+        end_time INTEGER,
+        tag_id INTEGER REFERENCES tags(id),
+        mood INTEGER CHECK (mood >= 1 AND mood <= 5),
+        duration_seconds INTEGER GENERATED ALWAYS AS (end_time - start_time) VIRTUAL,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (state_id) REFERENCES states(id) ON DELETE CASCADE
+    )
+"""
+
+# Строка time_sessions в формате копии; {row} - NEW или алиас таблицы
+_V2_ROW = """
+    {row}.id, {row}.user_id, {row}.state_id,
+    CAST(strftime('%s', {row}.start_time) AS INTEGER),
+    CAST(strftime('%s', {row}.end_time) AS INTEGER),
+    {row}.tag_id, {row}.mood
+"""
+
+_INSERT_V2 = """
+    INSERT OR REPLACE INTO time_sessions_v2
+        (id, user_id, state_id, start_time, end_time, tag_id, mood)
+"""
+
+_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS time_sessions_v2_insert AFTER INSERT ON time_sessions
+    BEGIN
+        {_INSERT_V2} VALUES ({_V2_ROW.format(row="NEW")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS time_sessions_v2_update AFTER UPDATE ON time_sessions
+    BEGIN
+        DELETE FROM time_sessions_v2 WHERE id = OLD.id AND OLD.id != NEW.id;
+        {_INSERT_V2} VALUES ({_V2_ROW.format(row="NEW")});
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS time_sessions_v2_delete AFTER DELETE ON time_sessions
+    BEGIN
+        DELETE FROM time_sessions_v2 WHERE id = OLD.id;
+    END
+    """,
+)
+
+_COPY_RANGE = f"""
+    {_INSERT_V2}
+    SELECT {_V2_ROW.format(row="ts")}
+    FROM time_sessions ts
+    WHERE ts.id > ? AND ts.id <= ?
+"""
+
+# Индексы time_sessions после замены (см. миграции 1 и 5).
+# Глобальные индексы по start_time/end_time не переносятся: запросы
+# всегда ограничены пользователем и идут по idx_sessions_user_start.
+_INDEXES = (
+    "CREATE INDEX idx_sessions_state_id ON time_sessions (state_id)",
+    "CREATE UNIQUE INDEX idx_sessions_open ON time_sessions (user_id) WHERE end_time IS NULL",
+    "CREATE INDEX idx_sessions_user_start ON time_sessions (user_id, start_time DESC)",
+    "CREATE INDEX idx_sessions_user_tag ON time_sessions (user_id, tag_id)",
+)
+
+
+async def prepare(conn: aiosqlite.Connection) -> None:
+    """Создать копию и триггеры зеркалирования (идемпотентно)"""
+    await conn.execute(CREATE_SESSIONS_V2)
+    for trigger in _TRIGGERS:
+        await conn.execute(trigger)
+
+
+async def backfill(
+    conn: aiosqlite.Connection,
+    batch_rows: int = 5000,
+    pause: float = 0.05
+) -> int:
+    """
+    Перенести существующие строки в копию пачками по id.
+
+    Каждая пачка - отдельная транзакция BEGIN IMMEDIATE, между пачками
+    соединение отдает блокировку записи на pause секунд. Строки, изменившиеся
+    после prepare(), уже поддерживаются триггерами. Возвращает число строк копии.
+    """
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        await prepare(conn)
+        await conn.commit()
+    except Exception:
+        await conn.rollback()
+        raise
+
+    cursor = await conn.execute("SELECT COALESCE(MAX(id), 0) FROM time_sessions")
+    max_id = (await cursor.fetchone())[0]
+
+    for first_id in range(0, max_id, batch_rows):
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            await conn.execute(_COPY_RANGE, (first_id, first_id + batch_rows))
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+        await asyncio.sleep(pause)
+
+    cursor = await conn.execute("SELECT COUNT(*) FROM time_sessions_v2")
+    return (await cursor.fetchone())[0]
+
+
+async def swap(conn: aiosqlite.Connection) -> None:
+    """
+    Заменить time_sessions копией. Выполняется в транзакции миграции.
+
+    Строки, которых еще нет в копии, переносятся здесь же; после
+    backfill() это только строки, не тронутые триггерами.
+    """
+    await prepare(conn)
+    await conn.execute(f"""
+        {_INSERT_V2}
+        SELECT {_V2_ROW.format(row="ts")}
+        FROM time_sessions ts
+        WHERE NOT EXISTS (SELECT 1 FROM time_sessions_v2 v WHERE v.id = ts.id)
+    """)
+
+    cursor = await conn.execute("""
+        SELECT (SELECT COUNT(*) FROM time_sessions), (SELECT COUNT(*) FROM time_sessions_v2)
+    """)
+    old_rows, new_rows = await cursor.fetchone()
+    if old_rows != new_rows:
+        raise RuntimeError(f"time_sessions_v2 не совпадает с time_sessions: {new_rows} != {old_rows}")
+
+    # Триггеры удаляются вместе с таблицей
+    await conn.execute("DROP TABLE time_sessions")
+    await conn.execute("ALTER TABLE time_sessions_v2 RENAME TO time_sessions")
+    for index in _INDEXES:
+        await conn.execute(index)
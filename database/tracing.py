@@ -0,0 +1,296 @@
+"""
+Трассировка запросов соединений core.
+
+traced() оборачивает соединение aiosqlite из _read()/_write(): каждый
+запрос считается в utils.metrics, а запросы дольше SLOW_QUERY_MS
+(execute и выборка строк курсора вместе) попадают в журнал медленных
+запросов:
+    - в лог пишется нормализованный SQL, типы параметров и функция,
+      из которой выполнен запрос;
+    - для каждого различного текста SQL один раз снимается
+      EXPLAIN QUERY PLAN, полные сканирования и временные B-деревья
+      отмечаются в таблице;
+    - top() возвращает самые медленные запросы с момента запуска
+      (по суммарному времени медленных выполнений), таблицу читают
+      команда /slow_queries и периодический дамп в лог.
+"""
+import asyncio
+import re
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable
+
+import aiosqlite
+
+from config import SLOW_QUERY_MS
+from utils import metrics
+from utils import bot_logging as bot_log
+
+logger = bot_log.get_logger(__name__)
+
+# Различных текстов SQL в журнале; самые давние вытесняются
+MAX_ENTRIES = 200
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def normalize(sql: str) -> str:
+    """SQL без переносов и литералов: одинаковые запросы с разными значениями совпадают"""
+    sql = _WHITESPACE_RE.sub(" ", sql).strip()
+    sql = _LITERAL_RE.sub("?", sql)
+    return _PLACEHOLDER_LIST_RE.sub("(?, ...)", sql)
+
+
+def param_shape(parameters: Any) -> str:
+    """Типы параметров без значений: в лог не попадают данные пользователей"""
+    if parameters is None:
+        return "()"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {type(value).__name__}" for name, value in parameters.items()) + "}"
+
+    return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+
+
+def _caller() -> str:
+    """Первая функция вне этого модуля в цепочке await, например database.core.get_user_states"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module != __name__ and not module.startswith("aiosqlite"):
+            return f"{module}.{frame.f_code.co_qualname}"
+        frame = frame.f_back
+
+    return "unknown"
+
+
+class SlowQuery:
+    """Медленные выполнения одного текста SQL"""
+
+    __slots__ = ("sql", "shape", "caller", "plan", "count", "total", "max", "last_seen")
+
+    def __init__(self, sql: str, shape: str, caller: str) -> None:
+        self.sql = sql
+        self.shape = shape
+        self.caller = caller
+        self.plan: list[str] | None = None
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_seen = 0.0
+
+    @property
+    def flags(self) -> list[str]:
+        """Признаки плохого плана: полное сканирование таблицы и сортировка без индекса"""
+        if not self.plan:
+            return []
+
+        flags = []
+        # SCAN - проход по всей таблице или индексу, в отличие от SEARCH по ключу
+        if any(step.startswith("SCAN ") and step != "SCAN CONSTANT ROW" for step in self.plan):
+            flags.append("scan")
+        if any("TEMP B-TREE" in step for step in self.plan):
+            flags.append("temp b-tree")
+
+        return flags
+
+    def as_dict(self) -> dict:
+        return {
+            "sql": self.sql,
+            "shape": self.shape,
+            "caller": self.caller,
+            "plan": self.plan,
+            "flags": self.flags,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+        }
+
+
+_slow: OrderedDict[str, SlowQuery] = OrderedDict()
+
+
+def _entry(sql: str, parameters: Any) -> SlowQuery:
+    normalized = normalize(sql)
+    entry = _slow.get(normalized)
+    if entry is None:
+        entry = _slow[normalized] = SlowQuery(normalized, param_shape(parameters), _caller())
+        while len(_slow) > MAX_ENTRIES:
+            _slow.popitem(last=False)
+    else:
+        _slow.move_to_end(normalized)
+
+    return entry
+
+
+async def _explain(conn: aiosqlite.Connection, sql: str, parameters: Any) -> list[str]:
+    try:
+        cursor = await conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+        return [row[3] for row in await cursor.fetchall()]
+    except Exception as e:
+        return [f"EXPLAIN не выполнен: {e}"]
+
+
+class _Statement:
+    """Время одного запроса: execute и выборка строк его курсора"""
+
+    __slots__ = ("sql", "parameters", "elapsed", "entry")
+
+    def __init__(self, sql: str, parameters: Any) -> None:
+        self.sql = sql
+        self.parameters = parameters
+        self.elapsed = 0.0
+        self.entry: SlowQuery | None = None
+
+    async def add(self, conn: aiosqlite.Connection, elapsed: float) -> None:
+        self.elapsed += elapsed
+
+        if self.entry is not None:
+            # Медленный запрос продолжают выбирать: время дописывается к уже учтенному
+            self.entry.total += elapsed
+            self.entry.max = max(self.entry.max, self.elapsed)
+            return
+
+        if SLOW_QUERY_MS <= 0 or self.elapsed * 1000 < SLOW_QUERY_MS:
+            return
+
+        entry = self.entry = _entry(self.sql, self.parameters)
+        entry.count += 1
+        entry.total += self.elapsed
+        entry.max = max(entry.max, self.elapsed)
+        entry.last_seen = time.time()
+        metrics.slow_queries.inc(caller=entry.caller)
+
+        message = (f"Медленный запрос {self.elapsed * 1000:.1f} мс в {entry.caller}: "
+                   f"{entry.sql} {param_shape(self.parameters)}")
+
+        if entry.plan is None:
+            entry.plan = await _explain(conn, self.sql, self.parameters)
+            message += "\n    план: " + "\n          ".join(entry.plan)
+
+        logger.warning(message)
+
+
+class _TracedCursor:
+    """Курсор aiosqlite, выборка строк которого добавляется ко времени запроса"""
+
+    __slots__ = ("_cursor", "_conn", "_statement")
+
+    def __init__(self, cursor, conn: aiosqlite.Connection, statement: _Statement) -> None:
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_statement", statement)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._cursor, name, value)
+
+    async def _timed(self, call: Awaitable) -> Any:
+        started = time.perf_counter()
+        try:
+            return await call
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.record_sql(elapsed, statements=0)
+            await self._statement.add(self._conn, elapsed)
+
+    def fetchone(self) -> Awaitable:
+        return self._timed(self._cursor.fetchone())
+
+    def fetchall(self) -> Awaitable:
+        return self._timed(self._cursor.fetchall())
+
+    def fetchmany(self, size: int | None = None) -> Awaitable:
+        return self._timed(self._cursor.fetchmany(size))
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+
+class _TracedConnection:
+    """Соединение aiosqlite, которое считает запросы, их время и ловит медленные"""
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn: aiosqlite.Connection) -> None:
+        object.__setattr__(self, "_conn", conn)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._conn, name, value)
+
+    async def _timed(self, call: Awaitable, statement: _Statement | None = None) -> Any:
+        started = time.perf_counter()
+        try:
+            return await call
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.record_sql(elapsed)
+            if statement is not None:
+                await statement.add(self._conn, elapsed)
+
+    async def execute(self, sql: str, parameters=None) -> _TracedCursor:
+        statement = _Statement(sql, parameters)
+        cursor = await self._timed(self._conn.execute(sql, parameters), statement)
+        return _TracedCursor(cursor, self._conn, statement)
+
+    async def executemany(self, sql: str, parameters) -> _TracedCursor:
+        parameters = list(parameters)
+        # План снимается по первому набору параметров
+        statement = _Statement(sql, parameters[0] if parameters else None)
+        cursor = await self._timed(self._conn.executemany(sql, parameters), statement)
+        return _TracedCursor(cursor, self._conn, statement)
+
+    def commit(self) -> Awaitable:
+        return self._timed(self._conn.commit())
+
+    def rollback(self) -> Awaitable:
+        return self._timed(self._conn.rollback())
+
+
+def traced(conn: aiosqlite.Connection) -> _TracedConnection:
+    return _TracedConnection(conn)
+
+
+def top(n: int = 10) -> list[SlowQuery]:
+    """Самые медленные запросы по суммарному времени медленных выполнений"""
+    return sorted(_slow.values(), key=lambda entry: entry.total, reverse=True)[:n]
+
+
+def format_top(n: int = 10) -> str:
+    entries = top(n)
+    if not entries:
+        return f"Запросов дольше {SLOW_QUERY_MS:g} мс не было"
+
+    lines = [f"Запросы дольше {SLOW_QUERY_MS:g} мс (всего различных: {len(_slow)}):"]
+    for i, entry in enumerate(entries, 1):
+        flags = f" [{', '.join(entry.flags)}]" if entry.flags else ""
+        lines.append(
+            f"{i}. {entry.caller}{flags}\n"
+            f"   {entry.count} раз, всего {entry.total * 1000:.1f} мс, "
+            f"макс {entry.max * 1000:.1f} мс, параметры {entry.shape}\n"
+            f"   {entry.sql[:300]}"
+        )
+        if entry.plan:
+            lines.append("   план: " + "; ".join(entry.plan))
+
+    return "\n".join(lines)
+
+
+async def dump_periodically(interval: float, n: int = 10) -> None:
+    """Писать таблицу медленных запросов в лог раз в interval секунд до отмены задачи"""
+    while True:
+        await asyncio.sleep(interval)
+        if _slow:
+            logger.info(format_top(n))
+
+
+def reset() -> None:
+    _slow.clear()
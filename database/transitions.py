@@ -0,0 +1,178 @@
+"""
+Накопленные счетчики переходов между состояниями для /predict.
+
+Переход - пара соседних (по start_time, id) сессий пользователя с разными
+состояниями. Он учитывается в ячейке (день недели, 4-часовой интервал)
+времени начала первой сессии пары. День недели хранится как в
+datetime.weekday(): понедельник - 0.
+
+Счетчики обновляются инкрементально: при переключении состояния добавляется
+один переход, а при правке сессий пары в окне затронутых сессий вычитаются
+до изменения и добавляются заново после него.
+"""
+from datetime import datetime
+
+import aiosqlite
+
+from utils import date
+
+
+TIME_BIN_HOURS = 4
+
+CREATE_STATE_TRANSITIONS = """
+    CREATE TABLE IF NOT EXISTS state_transitions (
+        user_id INTEGER NOT NULL,
+        from_state_id INTEGER NOT NULL,
+        weekday INTEGER NOT NULL,
+        time_bin INTEGER NOT NULL,
+        to_state_id INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, from_state_id, weekday, time_bin, to_state_id),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (from_state_id) REFERENCES states(id) ON DELETE CASCADE,
+        FOREIGN KEY (to_state_id) REFERENCES states(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+"""
+
+# Ячейка перехода по времени начала исходной сессии (EPOCH - четверг, weekday 3)
+_WEEKDAY = f"(start_time / {date.DAY_SECONDS} + 3) % 7"
+_TIME_BIN = f"start_time % {date.DAY_SECONDS} / {TIME_BIN_HOURS * 3600}"
+
+_UPSERT = """
+    ON CONFLICT (user_id, from_state_id, weekday, time_bin, to_state_id)
+    DO UPDATE SET count = count + excluded.count
+"""
+
+# Переходы из сессий пользователя, начавшихся в [:first_start, :last_start].
+# Следующая сессия ищется по индексу idx_sessions_user_start.
+_APPLY_WINDOW = f"""
+    INSERT INTO state_transitions
+        (user_id, from_state_id, weekday, time_bin, to_state_id, count)
+    SELECT :user_id, from_state_id, {_WEEKDAY}, {_TIME_BIN}, to_state_id, :sign * COUNT(*)
+    FROM (
+        SELECT ts.start_time, ts.state_id AS from_state_id, (
+            SELECT n.state_id FROM time_sessions n
+            WHERE n.user_id = ts.user_id
+            AND (n.start_time > ts.start_time OR (n.start_time = ts.start_time AND n.id > ts.id))
+            ORDER BY n.start_time, n.id
+            LIMIT 1
+        ) AS to_state_id
+        FROM time_sessions ts
+        WHERE ts.user_id = :user_id AND ts.start_time BETWEEN :first_start AND :last_start
+    )
+    WHERE to_state_id IS NOT NULL AND to_state_id != from_state_id
+    GROUP BY 2, 3, 4, 5
+    {_UPSERT}
+"""
+
+_REBUILD_USERS = f"""
+    INSERT INTO state_transitions
+        (user_id, from_state_id, weekday, time_bin, to_state_id, count)
+    SELECT user_id, from_state_id, {_WEEKDAY}, {_TIME_BIN}, to_state_id, COUNT(*)
+    FROM (
+        SELECT user_id, start_time, state_id AS from_state_id,
+            LEAD(state_id) OVER (PARTITION BY user_id ORDER BY start_time, id) AS to_state_id
+        FROM time_sessions
+        WHERE user_id BETWEEN :first_user_id AND :last_user_id
+    )
+    WHERE to_state_id IS NOT NULL AND to_state_id != from_state_id
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+
+async def record_transition(
+    conn: aiosqlite.Connection,
+    user_id: int,
+    start_time: datetime | int,
+    from_state_id: int,
+    to_state_id: int
+) -> None:
+    """
+    Учесть переход из только что закрытой последней сессии в новую.
+
+    Выполняется на переданном соединении в транзакции вызывающего кода.
+    """
+    if from_state_id == to_state_id:
+        return
+
+    start_time = date.to_datetime(start_time)
+
+    await conn.execute(f"""
+        INSERT INTO state_transitions
+            (user_id, from_state_id, weekday, time_bin, to_state_id, count)
+        VALUES (?, ?, ?, ?, ?, 1)
+        {_UPSERT}
+    """, (
+        user_id, from_state_id, start_time.weekday(),
+        start_time.hour // TIME_BIN_HOURS, to_state_id
+    ))
+
+
+async def apply_window(
+    conn: aiosqlite.Connection,
+    user_id: int,
+    first_start: datetime | int,
+    last_start: datetime | int,
+    sign: int
+) -> None:
+    """
+    Добавить (sign=1) или вычесть (sign=-1) переходы из сессий пользователя,
+    начавшихся в [first_start, last_start].
+
+    Правка сессий оборачивается вызовами с sign=-1 до изменения и sign=1
+    после него. Окно должно покрывать начала всех сессий, у которых меняется
+    состояние или следующая сессия.
+    """
+    if isinstance(first_start, datetime):
+        first_start = date.to_epoch(first_start)
+    if isinstance(last_start, datetime):
+        last_start = date.to_epoch(last_start)
+
+    await conn.execute(_APPLY_WINDOW, {
+        "user_id": user_id,
+        "first_start": first_start,
+        "last_start": last_start,
+        "sign": sign,
+    })
+
+    if sign < 0:
+        await conn.execute("""
+            DELETE FROM state_transitions WHERE user_id = ? AND count <= 0
+        """, (user_id,))
+
+
+async def rebuild_users_transitions(
+    conn: aiosqlite.Connection,
+    first_user_id: int,
+    last_user_id: int
+) -> None:
+    """Полностью пересобрать переходы пользователей с id в [first_user_id, last_user_id]"""
+    await conn.execute("""
+        DELETE FROM state_transitions WHERE user_id BETWEEN ? AND ?
+    """, (first_user_id, last_user_id))
+
+    await conn.execute(_REBUILD_USERS, {
+        "first_user_id": first_user_id,
+        "last_user_id": last_user_id,
+    })
+
+
+async def rebuild_transitions(conn: aiosqlite.Connection, batch_users: int = 500) -> int:
+    """
+    Пересобрать state_transitions из time_sessions пачками пользователей,
+    каждая пачка - отдельная транзакция. Возвращает количество строк.
+    """
+    cursor = await conn.execute("SELECT COALESCE(MAX(id), 0) FROM users")
+    max_user_id = (await cursor.fetchone())[0]
+
+    for first_user_id in range(1, max_user_id + 1, batch_users):
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            await rebuild_users_transitions(conn, first_user_id, first_user_id + batch_users - 1)
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+    cursor = await conn.execute("SELECT COUNT(*) FROM state_transitions")
+    return (await cursor.fetchone())[0]
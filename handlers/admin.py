@@ -0,0 +1,38 @@
+from aiogram import Router, F
+from aiogram.types import Message, BufferedInputFile
+from aiogram.filters import Command
+
+from config import ADMIN_IDS
+
+from utils import metrics
+from utils import bot_logging as bot_log
+
+from database import tracing
+
+router = Router()
+logger = bot_log.get_logger(__name__)
+
+# Остальным пользователям команды администратора не видны: апдейт не обрабатывается
+router.message.filter(F.from_user.id.in_(ADMIN_IDS))
+
+
+@router.message(Command("metrics"))
+async def metrics_cmd(message: Message) -> None:
+    # Текст метрик длиннее лимита сообщения, поэтому отправляется файлом
+    await message.answer_document(
+        BufferedInputFile(metrics.render().encode(), filename="metrics.prom")
+    )
+    logger.info(f"Администратор {message.from_user.id} запросил метрики")
+
+
+@router.message(Command("slow_queries"))
+async def slow_queries_cmd(message: Message) -> None:
+    report = tracing.format_top()
+
+    if len(report) > 4000:
+        await message.answer_document(
+            BufferedInputFile(report.encode(), filename="slow_queries.txt")
+        )
+        return
+
+    await message.answer(report, parse_mode=None)
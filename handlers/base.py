@@ -5,8 +5,7 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 
-from datetime import datetime, timedelta
-from collections import Counter
+from datetime import timedelta
 
 from data import messages as msg
 import keyboards.reply as reply_kb
@@ -53,23 +52,15 @@ async def help_cmd(message: Message):
 
 @router.message(Command("my_tags"))
 async def user_tags(message: Message) -> None:
-    tags = await db.get_user_tags(message=message)
+    tags = await db.get_user_tags(message=message, limit=20)
 
-    if tags is None or len(tags) == 0:
+    if not tags:
         await message.answer(msg.FAILURE['have_not_tags'])
         return
 
-    cnt = Counter(tags)
-    sorted_count = sorted(cnt.items(), key=lambda item: item[1], reverse=True)
-
-    text = f"<b>Топ {min(len(cnt.keys()), 20)} ваших самых часто повторяющихся тегов:</b>\n\n"
-    num = 0
-    for tag, count in sorted_count:
-        if num == 20:
-            break
-
+    text = f"<b>Топ {len(tags)} ваших самых часто повторяющихся тегов:</b>\n\n"
+    for num, (tag, count) in enumerate(tags):
         text += f"{num+1}.  <code>{tag}</code> - {count}\n"
-        num += 1
 
     await message.answer(text)
 
@@ -118,7 +109,7 @@ async def fix_cmd(message: Message, command: CommandObject, state: FSMContext) -
         return
 
     current_state = states[0]
-    state_start_time = date.to_datetime(current_state['start_time'])
+    state_start_time = current_state.start_time
 
     if time_parts.get('start_time', ''):
         offset = timedelta(seconds=59)
@@ -153,7 +144,6 @@ async def fix_cmd(message: Message, command: CommandObject, state: FSMContext) -
     fix_state = await db.fix_states(
         message=message,
         first_state_end_time=first_state_end_time,
-        first_state_duration_seconds=first_state_duration_seconds,
         new_state=new_state,
         new_tag=new_tag
     )
@@ -164,16 +154,14 @@ async def fix_cmd(message: Message, command: CommandObject, state: FSMContext) -
 
     await message.answer(
         msg.format_fix_cmd(
-            state_name=current_state['state_name'],
-            state_start_time=date.format_without_date(
-                date.to_datetime(current_state['start_time'])
-            ),
+            state_name=current_state.state_name,
+            state_start_time=date.format_without_date(state_start_time),
             new_state=new_state,
             prev_state_end_time=date.format_without_date(first_state_end_time)
         )
     )
 
-    await send_rate_message(message, int(current_state['id']))
+    await send_rate_message(message, current_state.id)
 
 
 async def send_rate_message(message: Message, time_session_id: int) -> None:
@@ -211,7 +199,7 @@ async def change_state_cmd(message: Message, state: FSMContext):
     if start_time is None:
         delta_time_str = "None"
     else:
-        delta_time = date.get_now() - datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S')
+        delta_time = date.get_now() - date.to_datetime(start_time)
         hours = delta_time.seconds // 3600
         minutes = (delta_time.seconds // 60) % 60
         seconds = delta_time.seconds % 60
@@ -237,8 +225,10 @@ async def change_state_cmd(message: Message, state: FSMContext):
         if prev_state is not None:
             await send_rate_message(message, time_session_id)
 
-        logger.info(f"Пользователь {message.from_user.full_name} ({message.from_user.id}) "
-                    f"изменил состояние с {prev_state} ({prev_tag}) на {new_state} ({new_tag})")
+        # Аргументы подставляются, только если запись не отброшена ограничением частоты
+        logger.info("Пользователь %s (%s) изменил состояние с %s (%s) на %s (%s)",
+                    message.from_user.full_name, message.from_user.id,
+                    prev_state, prev_tag, new_state, new_tag)
     else:
         await message.answer(msg.FAILURE['state_change'])
 
@@ -274,7 +264,3 @@ async def rate_time_session(callback_query: CallbackQuery):
 async def states_message(message: Message) -> None:
     await message.answer(msg.COMMON['states_message'])
 
-
-@router.callback_query(F.data == "view_full_stats")
-async def view_full_stats(callback: CallbackQuery):
-    await callback.answer()
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+from aiogram import Router, F, Bot
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+
+from config import IMPORT_MAX_BYTES, IMPORT_MAX_ROWS
+from data import messages as msg
+
+from utils import date, history_file
+from utils import bot_logging as bot_log
+from utils.states import ImportSessions
+
+from database import core as db
+
+router = Router()
+logger = bot_log.get_logger(__name__)
+
+
+@router.message(Command("export"))
+async def export_cmd(message: Message, command: CommandObject) -> None:
+    file_format = (command.args or "csv").strip().lower()
+    if file_format not in history_file.FORMATS:
+        await message.answer(msg.FAILURE['export_format'])
+        return
+
+    if not await db.get_user_states(message, limit=1):
+        await message.answer(msg.FAILURE['nothing_to_export'])
+        return
+
+    # Файл строится порциями из базы во время отправки
+    file = history_file.SessionsFile(
+        db.iter_user_sessions(message.from_user.id),
+        file_format=file_format,
+        filename=f"timetracker_{date.get_now():%Y-%m-%d}.{file_format}"
+    )
+    await message.answer_document(file, caption=msg.SUCCESS['export'])
+
+    logger.info("Пользователь %s выгрузил %s сессий (%s) за %.2f с",
+                message.from_user.id, file.rows, file_format, file.elapsed)
+
+
+async def import_document(message: Message, bot: Bot) -> None:
+    if not await db.is_user_in_database(message):
+        await message.answer(msg.FAILURE['not_registered'])
+        return
+
+    if (message.document.file_size or 0) > IMPORT_MAX_BYTES:
+        await message.answer(msg.FAILURE['import_too_large'])
+        return
+
+    data = (await bot.download(message.document)).getvalue()
+    # Разбор большого файла не должен останавливать обработку остальных апдейтов
+    sessions, errors, skipped = await asyncio.to_thread(
+        history_file.parse_csv, data, date.get_now(), IMPORT_MAX_ROWS
+    )
+
+    if errors:
+        await message.answer(msg.format_import_errors(errors))
+        return
+    if not sessions:
+        await message.answer(msg.FAILURE['import_empty'])
+        return
+
+    started = time.perf_counter()
+    try:
+        imported = await db.import_sessions(message.from_user.id, sessions)
+    except ValueError as e:
+        logger.warning("Импорт пользователя %s отклонен: %s", message.from_user.id, e)
+        await message.answer(msg.FAILURE['import_overlap'])
+        return
+    elapsed = time.perf_counter() - started
+
+    await message.answer(msg.format_import_result(imported, skipped, elapsed))
+    logger.info("Пользователь %s импортировал %s сессий за %.2f с (%.0f строк/с)",
+                message.from_user.id, imported, elapsed, imported / elapsed if elapsed else imported)
+
+
+@router.message(Command("import"), F.document)
+async def import_with_file_cmd(message: Message, state: FSMContext, bot: Bot) -> None:
+    # Файл отправлен с подписью /import
+    await state.clear()
+    await import_document(message, bot)
+
+
+@router.message(Command("import"))
+async def import_cmd(message: Message, state: FSMContext) -> None:
+    await state.set_state(ImportSessions.file)
+    await message.answer(msg.COMMON['send_import_file'])
+
+
+@router.message(ImportSessions.file, F.document)
+async def import_file(message: Message, state: FSMContext, bot: Bot) -> None:
+    await state.clear()
+    await import_document(message, bot)
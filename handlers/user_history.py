@@ -12,6 +12,7 @@ import keyboards.inline as inline_kb
 
 from utils import date
 from utils import bot_logging as bot_log
+from utils import render_cache
 from utils.base_utils import answer_or_edit
 from utils.states import ChangeStateTag
 
@@ -33,20 +34,78 @@ async def send_day_history(
     tg_obj: Message | CallbackQuery,
     target_day: datetime.date
 ) -> None:
-    states = await db.get_user_states_by_date(tg_obj=tg_obj, target_date=target_day)
+    # Прошедшие дни меняются только при записи, их отдаем из кэша
+    cache_key = None
+    if target_day < date.get_now().date():
+        user_id = await db.get_user_id_by_tg_id(tg_id=tg_obj.from_user.id)
+        cache_key = render_cache.key(user_id, target_day, "history", await db.data_version(user_id))
+
+        cached = render_cache.get(cache_key)
+        if cached is not None:
+            await answer_or_edit(tg_obj, *cached)
+            return
+
+    day_start, day_end = date.day_bounds(target_day)
+    states = await db.get_user_states_between(tg_obj=tg_obj, start=day_start, end=day_end)
 
     keyboard_builder = inline_kb.pagination_date_kb("date_history", target_day)
+
+    if not states:
+        text = msg.FAILURE['no_states_today']
+    else:
+        text = msg.format_states_history(states=states)
+
+        # Переход к постраничной ленте: сессии старше самой ранней за день
+        keyboard_builder.row(
+            InlineKeyboardButton(
+                text="⏪ Лента истории",
+                callback_data=inline_kb.history_page_callback("older", states[-1].cursor)
+            )
+        )
+
     keyboard = keyboard_builder.as_markup()
 
+    # Длительность открытой сессии растет и без записей
+    if cache_key is not None and not any(state.is_open for state in states or ()):
+        render_cache.put(cache_key, text, keyboard)
+
+    await answer_or_edit(tg_obj, text, keyboard=keyboard)
+
+
+async def send_history_page(
+    callback: CallbackQuery,
+    before: tuple[int, int] | None = None,
+    after: tuple[int, int] | None = None
+) -> bool:
+    states, has_more = await db.get_user_states_page(tg_obj=callback, before=before, after=after)
+
     if not states:
-        await answer_or_edit(tg_obj, msg.FAILURE['no_states_today'], keyboard=keyboard)
-        return
+        return False
 
-    await answer_or_edit(
-        tg_obj,
-        msg.format_states_history(states=states),
-        keyboard=keyboard
-    )
+    # Курсор взят из показанной сессии, поэтому в обратную сторону страница есть
+    has_older = has_more if after is None else True
+    has_newer = has_more if after is not None else before is not None
+
+    keyboard = inline_kb.history_page_kb(states, has_older=has_older, has_newer=has_newer)
+    await answer_or_edit(callback, msg.format_history_page(states), keyboard=keyboard.as_markup())
+    return True
+
+
+@router.callback_query(F.data.startswith("history_page"))
+async def history_page(callback: CallbackQuery) -> None:
+    try:
+        _, direction, start_time, session_id = callback.data.split(":")
+        cursor = (int(start_time), int(session_id))
+
+        if direction == "older":
+            sent = await send_history_page(callback, before=cursor)
+        else:
+            sent = await send_history_page(callback, after=cursor)
+
+        await callback.answer(None if sent else "Дальше состояний нет")
+    except ValueError as e:
+        logger.error(f"Ошибка парсинга callback_data: {callback.data}, {e}")
+        await callback.answer("Ошибка обработки запроса")
 
 
 @router.callback_query(F.data.startswith("date_history"))
@@ -75,7 +134,8 @@ async def choose_state_to_change(
     callback: CallbackQuery, 
     day: datetime.date
 ) -> None:
-    states = await db.get_user_states_by_date(tg_obj=callback, target_date=day)
+    day_start, day_end = date.day_bounds(day)
+    states = await db.get_user_states_between(tg_obj=callback, start=day_start, end=day_end)
 
     if not states:
         await callback.answer("Нет состояний за этот день")
@@ -83,16 +143,13 @@ async def choose_state_to_change(
 
     builder = InlineKeyboardBuilder()
     for state in states:
-        start_time = date.to_datetime(state['start_time'])
-        start_time_str = date.format_time_hhmm(start_time)
-        end_time = date.format_time_hhmm(
-            date.to_datetime(state['end_time']) if state['end_time'] else date.get_now()
-        )
+        start_time = date.format_time_hhmm(state.start_time)
+        end_time = date.format_time_hhmm(state.end_time or date.get_now())
 
         builder.row(
             InlineKeyboardButton(
-                text=f"{start_time_str}-{end_time} | {state['state_name']}",
-                callback_data=f"choose_state:{state['id']}"
+                text=f"{start_time}-{end_time} | {state.state_name}",
+                callback_data=f"choose_state:{state.id}"
             )
         )
     
@@ -140,22 +197,10 @@ async def state_info(callback: CallbackQuery, state: FSMContext) -> None:
             await callback.answer("Состояние не найдено")
             return
         
-        state_info['start_time'] = date.to_datetime(state_info['start_time'])
-        if state_info['end_time']:
-            state_info['end_time'] = date.to_datetime(state_info['end_time'])
-        else:
-            state_info['end_time'] = date.get_now()
-
-        state_info['duration_seconds'] = date.calculate_duration_seconds(
-            start_time=state_info['start_time'],
-            end_time=state_info['end_time'],
-            duration_seconds=state_info.get('duration_seconds')
-        )
-        
         text = msg.format_state_info(state_info)
         
         # Получаем день для кнопки "Назад"
-        day = state_info['start_time'].date()
+        day = state_info.start_time.date()
 
         builder = InlineKeyboardBuilder()
         builder.add(
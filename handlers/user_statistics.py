@@ -1,10 +1,8 @@
-import pandas as pd
-
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.filters import Command
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from data import messages as msg
 
@@ -12,10 +10,12 @@ import keyboards.inline as inline_kb
 
 from utils import date
 from utils import bot_logging as bot_log
+from utils import render_cache
 from utils.base_utils import answer_or_edit
 from utils import statistics as ustats
 
 from database import core as db
+from database import transitions
 
 router = Router()
 logger = bot_log.get_logger(__name__)
@@ -45,6 +45,17 @@ async def send_day_statistics(
     tg_obj: Message | CallbackQuery,
     target_date: datetime.date
 ):
+    # Итоги прошедшего дня обрезаны его концом и меняются только при записи
+    cache_key = None
+    if target_date < date.get_now().date():
+        user_id = await db.get_user_id_by_tg_id(tg_id=tg_obj.from_user.id)
+        cache_key = render_cache.key(user_id, target_date, "statistics", await db.data_version(user_id))
+
+        cached = render_cache.get(cache_key)
+        if cached is not None:
+            await answer_or_edit(tg_obj, *cached)
+            return
+
     data = await states_statistics(tg_obj.from_user.id, target_date)
 
     answer = data['message'] if 'status' in data \
@@ -57,222 +68,222 @@ async def send_day_statistics(
             callback_data="view_full_stats"
         )
     )
+    keyboard = keyboard.as_markup()
+
+    if cache_key is not None:
+        render_cache.put(cache_key, answer, keyboard)
 
-    await answer_or_edit(tg_obj, answer, keyboard=keyboard.as_markup())
+    await answer_or_edit(tg_obj, answer, keyboard=keyboard)
 
 
 async def states_statistics(user_id: int, target_day: datetime.date) -> dict:
     """
-    Calculate statistics for user states on a target day using pandas.
+    Calculate statistics for user states on a target day.
+
+    Per-state totals are aggregated in SQL over the day window only,
+    so the cost does not depend on the length of the user's history.
     """
-    user_data = await db.get_user_states(tg_id=user_id)
+    day_start, day_end = date.day_bounds(target_day)
+    day_data = await db.get_state_totals_between(tg_id=user_id, start=day_start, end=day_end)
 
-    if not user_data:
+    if not day_data:
         return {"status": "bad", "message": msg.FAILURE['no_states_today']}
 
-    # Convert to DataFrame
-    df = pd.DataFrame(user_data)
-    
-    # Convert start_time to datetime and filter by target day
-    df['start_time_dt'] = pd.to_datetime(df['start_time'])
-    df['start_date'] = df['start_time_dt'].dt.date
-    target_day_data = df[df['start_date'] == target_day].copy()
+    return ustats.day_statistics(day_data, target_day)
 
-    if target_day_data.empty:
-        return {"status": "bad", "message": "📊 Нет завершенных состояний"}
 
-    state_count = len(target_day_data)
+TREND_WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+TREND_MONTHS = ['янв', 'фев', 'мар', 'апр', 'май', 'июн', 'июл', 'авг', 'сен', 'окт', 'ноя', 'дек']
 
-    # Get current state data (first row, which is the most recent)
-    current_state_data = target_day_data.iloc[0]
-    start_time = date.to_datetime(current_state_data['start_time'])
-    
-    end_time_val = current_state_data['end_time']
-    if pd.notna(end_time_val) and end_time_val:
-        end_time = date.to_datetime(end_time_val)
-    elif start_time.date() == date.get_now().date():
-        end_time = date.get_now()
+FULL_STATS_TITLES = {
+    'week': 'неделю',
+    'month': 'месяц',
+    'year': 'год',
+    'all': 'всё время',
+}
+
+
+@router.callback_query(F.data == "view_full_stats")
+@router.callback_query(F.data.startswith("full_stats"))
+async def view_full_stats(callback: CallbackQuery):
+    parts = callback.data.split(":")
+    period = parts[1] if len(parts) > 1 else 'week'
+
+    if period not in FULL_STATS_TITLES:
+        logger.error(f"Неверный формат callback_data: {callback.data}")
+        await callback.answer("Ошибка: неверный формат данных")
+        return
+
+    data = await range_statistics(callback.from_user.id, period)
+
+    answer = data['message'] if 'status' in data \
+        else msg.format_full_statistics(**data)
+
+    keyboard = inline_kb.full_stats_kb(period, date.get_now().date())
+
+    await answer_or_edit(callback, answer, keyboard=keyboard.as_markup())
+    await callback.answer()
+
+
+def trend_label(period: str, period_key: str, first_day: datetime.date) -> str:
+    """Label of the trend bucket that a totals row belongs to"""
+    if period == 'year':
+        return TREND_MONTHS[int(period_key[5:7]) - 1]
+    if period == 'all':
+        return period_key[:4]
+
+    day = datetime.strptime(period_key, "%Y-%m-%d").date()
+    if period == 'week':
+        return TREND_WEEKDAYS[day.weekday()]
+
+    # Month trend goes by weeks, labeled with the first day of the week inside the month
+    return max(day - timedelta(days=day.weekday()), first_day).strftime("%d.%m")
+
+
+def open_session_rows(session, first_day: datetime.date, resolution: str) -> list[dict]:
+    """
+    Totals rows for the open session up to now, split by days like
+    database/rollup.py does for closed sessions, so a session started
+    days ago does not all land in today's bucket.
+    """
+    range_start = date.to_epoch(date.day_bounds(first_day)[0])
+    start_time = max(date.to_epoch(session.start_time), range_start)
+    now = date.to_epoch(date.get_now())
+
+    rows = []
+    day_start = start_time - start_time % date.DAY_SECONDS
+    while day_start < now:
+        day = date.from_epoch(day_start).date()
+        rows.append({
+            'period': day.isoformat() if resolution == 'day' else day.strftime("%Y-%m"),
+            'state_name': session.state_name,
+            'total_seconds': min(now, day_start + date.DAY_SECONDS) - max(start_time, day_start),
+            'session_count': 1,
+            'mood_sum': 0,
+            'mood_count': 0,
+        })
+        day_start += date.DAY_SECONDS
+
+    return rows
+
+
+async def range_statistics(user_id: int, period: str) -> dict:
+    """
+    Calculate week/month/year/all-time statistics from pre-aggregated totals.
+
+    Week and month are read from daily totals, year and all-time from
+    monthly totals, so even an all-time view reads at most one row
+    per state and month instead of raw sessions.
+    """
+    today = date.get_now().date()
+
+    if period == 'week':
+        first_day = today - timedelta(days=today.weekday())
+    elif period == 'month':
+        first_day = today.replace(day=1)
+    elif period == 'year':
+        first_day = today.replace(month=1, day=1)
     else:
-        end_time = datetime.combine(
-            target_day,
-            datetime.max.time()
-        )
+        first_day = datetime(1970, 1, 1).date()
 
-    delta = end_time - start_time
-    delta_dict = {
-        'hours': delta.seconds // 3600,
-        'minutes': (delta.seconds // 60) % 60,
-        'seconds': delta.seconds % 60
-    }
+    resolution = 'day' if period in ('week', 'month') else 'month'
 
-    # Create chronology (reverse order for display)
-    chronology = ' → '.join(target_day_data['state_name'].iloc[::-1].tolist())
+    rows = await db.get_period_totals(
+        tg_id=user_id,
+        first_day=first_day,
+        last_day=today,
+        resolution=resolution
+    ) or []
 
-    # Calculate durations
-    def calculate_duration(row):
-        return date.calculate_duration_seconds(
-            start_time=row['start_time'],
-            end_time=row.get('end_time') if pd.notna(row.get('end_time')) else None,
-            duration_seconds=int(row['duration_seconds']) if pd.notna(row['duration_seconds']) else None
-        )
-    
-    target_day_data['duration'] = target_day_data.apply(calculate_duration, axis=1)
+    # The open session is not in the totals yet, count it up to now
+    current_state = await db.get_current_state(tg_id=user_id)
+    if current_state:
+        rows += open_session_rows(current_state, first_day, resolution)
+
+    if not rows:
+        return {"status": "bad", "message": msg.FAILURE['no_states_period']}
+
+    state_durations = {}
+    trend_durations = {}
+    session_count = mood_sum = mood_count = 0
+    for row in rows:
+        state_name = row['state_name']
+        state_durations[state_name] = state_durations.get(state_name, 0) + row['total_seconds']
 
-    # All states statistics (including sleep)
-    state_durations = target_day_data.groupby('state_name')['duration'].sum().to_dict()
-    total_time = target_day_data['duration'].sum()
+        bucket = trend_durations.setdefault(trend_label(period, row['period'], first_day), {})
+        bucket[state_name] = bucket.get(state_name, 0) + row['total_seconds']
 
-    if not state_durations:
-        return {"status": "bad", "message": "📊 Нет завершенных состояний"}
+        session_count += row['session_count']
+        mood_sum += row['mood_sum']
+        mood_count += row['mood_count']
 
-    # Calculate percentages for all states
+    total_time = sum(state_durations.values())
     states_in_percents = {
         state: [duration, round((duration / total_time) * 100, 1) if total_time > 0 else 0]
         for state, duration in state_durations.items()
     }
 
-    # Filter out sleep for special statistics
-    no_sleep_data = target_day_data[target_day_data['state_name'] != 'sleep'].copy()
-    
-    if not no_sleep_data.empty:
-        # State totals (without sleep)
-        state_durations_no_sleep = no_sleep_data.groupby('state_name')['duration'].sum().to_dict()
-        # Longest and shortest total states
-        longest_total_state = max(state_durations_no_sleep.items(), key=lambda x: x[1])
-        shortest_total_state = min(state_durations_no_sleep.items(), key=lambda x: x[1])
-
-        # Individual sessions (without sleep)
-        individual_sessions = no_sleep_data[['state_name', 'duration']].copy()
-        individual_sessions.columns = ['name', 'duration']
-        
-        longest_session = individual_sessions.loc[individual_sessions['duration'].idxmax()].to_dict()
-        shortest_session = individual_sessions.loc[individual_sessions['duration'].idxmin()].to_dict()
-
-        # Productivity calculation: (study + work) / chill
-        productive_states = ['work', 'study']
-        productivity_time = no_sleep_data[
-            no_sleep_data['state_name'].isin(productive_states)
-        ]['duration'].sum()
-        chill_time = no_sleep_data[
-            no_sleep_data['state_name'] == 'chill'
-        ]['duration'].sum()
-        productivity = int((productivity_time / (productivity_time + chill_time)) * 100) if chill_time > 0 else 0
-
-        # Average session time
-        average_session_time = date.format_time(
-            int(individual_sessions['duration'].mean())
-        )
-    else:
-        # If only sleep or no non-sleep states
-        longest_total_state = ('—', 0)
-        shortest_total_state = ('—', 0)
-        longest_session = {'name': '—', 'duration': 0}
-        shortest_session = {'name': '—', 'duration': 0}
-        productivity = 0
-        average_session_time = "0с"
+    if period == 'all':
+        first_day = datetime.strptime(rows[0]['period'], "%Y-%m").date()
 
     return {
-        "target_date": target_day.strftime("%d/%m/%Y"),
-        "current_state_name": current_state_data['state_name'],
-        "current_state_tag": current_state_data['tag'],
-        "delta_time": delta_dict,
-        "state_count": state_count,
-        "chronology": chronology,
-        "states_in_precents": states_in_percents,  # All states including sleep
-        "productivity": productivity,  # Without sleep
-        "longest_total": {
-            'name': longest_total_state[0],
-            'duration': date.format_time(longest_total_state[1]) if longest_total_state[1] > 0 else "—"
-        },  # Without sleep
-        "shortest_total": {
-            'name': shortest_total_state[0],
-            'duration': date.format_time(shortest_total_state[1]) if shortest_total_state[1] > 0 else "—"
-        },  # Without sleep
-        "longest_session": {
-            'name': longest_session['name'],
-            'duration': date.format_time(longest_session['duration']) if longest_session['duration'] > 0 else "—"
-        },  # Without sleep
-        "shortest_session": {
-            'name': shortest_session['name'],
-            'duration': date.format_time(shortest_session['duration']) if shortest_session['duration'] > 0 else "—"
-        },  # Without sleep
-        "average_session": average_session_time  # Without sleep
+        "period_title": FULL_STATS_TITLES[period],
+        "first_day": first_day.strftime("%d/%m/%Y"),
+        "last_day": today.strftime("%d/%m/%Y"),
+        "total_time": date.format_time(total_time),
+        "session_count": session_count,
+        "average_mood": round(mood_sum / mood_count, 1) if mood_count else None,
+        "productivity": ustats.calculate_productivity(state_durations),
+        "states_in_precents": states_in_percents,
+        "trend": [
+            (label, ustats.calculate_productivity(durations))
+            for label, durations in trend_durations.items()
+        ],
     }
 
 
 @router.message(Command("predict"))
 async def predict_user_next_state(message: Message) -> None:
-    states: list = await db.get_user_states(tg_obj=message)
-    
-    month_days = set(
-        [date.to_datetime(state['start_time']).date().day for state in states]
-    )
-    
-    if len(month_days) <= 7:
+    states: list = await db.get_user_states(tg_obj=message, limit=1)
+
+    if not states or await db.count_session_month_days(tg_obj=message, limit=8) <= 7:
         await message.answer(msg.FAILURE['few_days'])
         return
 
-    all_sessions = states.copy()
-    
-    now_str = date.get_now().strftime("%Y-%m-%d %H:%M:%S")
-    for session in all_sessions:
-        if session['end_time'] is None:
-            session['end_time'] = now_str
-    
-    df = pd.DataFrame(all_sessions)
-    df['start_time'] = pd.to_datetime(df['start_time'])
-    df['end_time'] = pd.to_datetime(df['end_time'])
-    df = df.sort_values('start_time')
-    
-    df['prev_state'] = df['state_name'].shift(1)
-    df = df[df['state_name'] != df['prev_state']].copy()
-    
-    df['next_state'] = df['state_name'].shift(-1)
-    df = df.dropna(subset=['next_state'])
-    
-    df['weekday'] = df['start_time'].dt.weekday
-    df['time_bin'] = df['start_time'].dt.hour // 4
-    
-    current_session = all_sessions[0]  
-    current_state = current_session['state_name']
-    current_start = pd.to_datetime(current_session['start_time'])
+    current_session = states[0]
+    current_state = current_session.state_name
+    current_start = current_session.start_time
     today = current_start.weekday()
-    current_time_bin = current_start.hour // 4
-    transitions_by_day = df.groupby(['weekday', 'time_bin']).apply(ustats.build_transition_matrix, include_groups=False)
-    try:
-        # Пробуем предсказать по паттернам недели и дневным бинам
-        next_state_probabilities = transitions_by_day.loc[
-            (today, current_time_bin, current_state)
-        ]
-        predict_by = "День недели и время начала сессии"
-    except KeyError:
-        try:
-            # У пользователя недостаточное разнообразие сессий, пробуем предсказать только по паттернам недели
-            transitions_by_weekday = df.groupby('weekday').apply(ustats.build_transition_matrix, include_groups=False)
-            next_state_probabilities = transitions_by_weekday.loc[(today, current_state)]
-            
-            predict_by = "День недели"
-
-        except KeyError:
-            try:
-                # У пользователя еще меньше данных, в теории этот блок не должен выполниться, но на всякий случай лучше тоже обработать. Смотрим глобально по состоянию
-                global_transitions = ustats.build_transition_matrix(df)
-                next_state_probabilities = global_transitions.loc[current_state]
-                
-                predict_by = "Глобальные переходы состояний"
-
-            except KeyError:
-                await message.answer("У вас слишком мало состояний, попробуйте позже...")
-                return
-
-
-    sorted_probs = next_state_probabilities.sort_values(ascending=False) 
-    next_state = [(sorted_probs.index[0], round(sorted_probs.iloc[0]*100, 2))]
+    current_time_bin = current_start.hour // transitions.TIME_BIN_HOURS
+
+    transitions_from_state = await db.get_state_transitions(
+        tg_obj=message, from_state=current_state
+    ) or []
+
+    # Пробуем предсказать по паттернам недели и дневным бинам
+    counts = ustats.count_transitions(transitions_from_state, weekday=today, time_bin=current_time_bin)
+    predict_by = "День недели и время начала сессии"
+
+    if not counts:
+        # У пользователя недостаточное разнообразие сессий, пробуем предсказать только по паттернам недели
+        counts = ustats.count_transitions(transitions_from_state, weekday=today)
+        predict_by = "День недели"
+
+    if not counts:
+        # У пользователя еще меньше данных, смотрим глобально по состоянию
+        counts = ustats.count_transitions(transitions_from_state)
+        predict_by = "Глобальные переходы состояний"
+
+    if not counts:
+        await message.answer("У вас слишком мало состояний, попробуйте позже...")
+        return
+
+    sorted_probs = ustats.transition_probabilities(counts)
+    next_state = [(sorted_probs[0][0], round(sorted_probs[0][1]*100, 2))]
 
     if len(sorted_probs) > 1:
         for prob in range(1, len(sorted_probs)-1):
-            if sorted_probs.iloc[prob] > 0.01:
-                next_state.append((sorted_probs.index[prob], round(sorted_probs.iloc[prob]*100, 2)))
+            if sorted_probs[prob][1] > 0.01:
+                next_state.append((sorted_probs[prob][0], round(sorted_probs[prob][1]*100, 2)))
 
     await message.answer(msg.format_predict_next_state(next_state, predict_by))
-
@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 
+from database.rows import SessionRow
 from utils import date
 
 
@@ -51,3 +52,72 @@ def pagination_date_kb(info: str, current_day: datetime.date) -> InlineKeyboardB
     builder.row(*buttons)
 
     return builder
+
+
+def history_page_callback(direction: str, cursor: tuple[int, int]) -> str:
+    """direction: older или newer; cursor - SessionRow.cursor"""
+    return f"history_page:{direction}:{cursor[0]}:{cursor[1]}"
+
+
+def history_page_kb(
+    states: list[SessionRow],
+    has_older: bool,
+    has_newer: bool
+) -> InlineKeyboardBuilder:
+    buttons = []
+    if has_older:
+        buttons.append(
+            InlineKeyboardButton(
+                text="⏪ Раньше",
+                callback_data=history_page_callback("older", states[-1].cursor)
+            )
+        )
+
+    day = states[0].start_time.date()
+    buttons.append(
+        InlineKeyboardButton(
+            text=f"📅 {day.day}/{day.month}",
+            callback_data=f"date_history:{day}"
+        )
+    )
+
+    if has_newer:
+        buttons.append(
+            InlineKeyboardButton(
+                text="Позже ⏩",
+                callback_data=history_page_callback("newer", states[0].cursor)
+            )
+        )
+
+    builder = InlineKeyboardBuilder()
+    builder.row(*buttons)
+
+    return builder
+
+
+FULL_STATS_PERIODS = {
+    "week": "Неделя",
+    "month": "Месяц",
+    "year": "Год",
+    "all": "Всё время",
+}
+
+
+def full_stats_kb(current_period: str, current_day: datetime.date) -> InlineKeyboardBuilder:
+    builder = InlineKeyboardBuilder()
+
+    builder.row(*[
+        InlineKeyboardButton(
+            text=f"• {title}" if period == current_period else title,
+            callback_data=f"full_stats:{period}"
+        )
+        for period, title in FULL_STATS_PERIODS.items()
+    ])
+    builder.row(
+        InlineKeyboardButton(
+            text="◀️ Назад",
+            callback_data=f"date_statistics:{current_day}"
+        )
+    )
+
+    return builder
@@ -3,35 +3,87 @@ import sys
 
 sys.path.append(os.getcwd())
 
+import argparse
 import asyncio
 import logging
 
-from aiogram import Bot, Dispatcher
-from aiogram.enums import ParseMode
-from aiogram.client.default import DefaultBotProperties
-from aiogram_sqlite_storage.sqlitestore import SQLStorage
+from utils.startup import StartupProfiler, first_poll_middleware
 
-from config import BOT_TOKEN, STATES_DB_PATH
-from handlers import user_history, user_statistics, base
 
-from database import core as db
-from utils.bot_logging import setup_logging, get_logger
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="TimeTracker bot")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="вывести время импортов и фаз запуска до первого getUpdates")
+    return parser.parse_known_args()[0]
+
+
+# Профайлер создается до остальных импортов, чтобы засечь их время
+args = parse_args()
+profiler = StartupProfiler(enabled=args.profile_startup)
+
+with profiler.phase("imports"):
+    from aiogram import Bot, Dispatcher
+    from aiogram.enums import ParseMode
+    from aiogram.client.default import DefaultBotProperties
+
+    from config import (
+        BOT_TOKEN, STATES_DB_PATH, DB_POOL_SIZE, WEBHOOK_URL,
+        METRICS_FILE, METRICS_INTERVAL, SLOW_QUERY_DUMP_INTERVAL,
+        LOG_JSON, LOG_INFO_RATE
+    )
+    from handlers import user_history, user_statistics, user_data, base, admin
+
+    from database import core as db, tracing
+    from utils import metrics, render_cache
+    from utils.bot_logging import setup_logging, stop_logging, get_logger
 
 setup_logging(
     name='TimeTracker',
     log_file='bot.log',
-    level=logging.INFO
+    level=logging.INFO,
+    json_format=LOG_JSON,
+    info_rate=LOG_INFO_RATE
 )
 
 main_logger = get_logger('main')
 
 
+def report_startup() -> None:
+    report = profiler.report()
+    main_logger.info(report)
+
+
+def build_dispatcher(storage) -> Dispatcher:
+    dp = Dispatcher(storage=storage)
+
+    #dp.include_router(basic_commands.router)
+    dp.include_router(admin.router)
+    dp.include_router(base.router)
+    dp.include_router(user_history.router)
+    dp.include_router(user_statistics.router)
+    dp.include_router(user_data.router)
+
+    for router in (base.router, user_history.router, user_statistics.router, user_data.router):
+        metrics.instrument(router)
+
+    return dp
+
+
 async def main() -> None:
+    metrics_task = None
+    slow_dump_task = None
     try:
-        await db.init_db()
-        main_logger.info("Базы инициализированы")
+        with profiler.phase("init_db"):
+            await db.init_db()
+            main_logger.info("Базы инициализированы")
+
+            await db.open_pool(DB_POOL_SIZE)
+
+        with profiler.phase("storage"):
+            # Хранилище FSM нужно только перед стартом поллинга
+            from aiogram_sqlite_storage.sqlitestore import SQLStorage
 
-        storage = SQLStorage(STATES_DB_PATH)
+            storage = SQLStorage(STATES_DB_PATH)
 
         bot = Bot(
             token=BOT_TOKEN,
@@ -39,19 +91,41 @@ async def main() -> None:
                 parse_mode=ParseMode.HTML
             )
         )
-        dp = Dispatcher(storage=storage)
+        bot.session.middleware(metrics.api_middleware)
+        dp = build_dispatcher(storage)
 
-        #dp.include_router(basic_commands.router)
-        dp.include_router(base.router)
-        dp.include_router(user_history.router)
-        dp.include_router(user_statistics.router)
+        if METRICS_FILE:
+            metrics_task = asyncio.create_task(metrics.write_periodically(METRICS_FILE, METRICS_INTERVAL))
+        if SLOW_QUERY_DUMP_INTERVAL > 0:
+            slow_dump_task = asyncio.create_task(tracing.dump_periodically(SLOW_QUERY_DUMP_INTERVAL))
 
-        # await bot.delete_webhook(drop_pending_updates=True)
+        if WEBHOOK_URL:
+            # aiohttp.web нужен только в этом режиме
+            from utils import webhook
+
+            main_logger.info("Бот запущен (webhook)")
+            await webhook.run_webhook(dp, bot, on_ready=report_startup if profiler.enabled else None)
+            return
+
+        if profiler.enabled:
+            bot.session.middleware(first_poll_middleware(profiler, report_startup))
+
+        # После работы в режиме webhook getUpdates недоступен, пока webhook не снят
+        await bot.delete_webhook()
         main_logger.info("Бот запущен")
         await dp.start_polling(bot)
     except Exception as e:
         main_logger.critical(f"Критическая ошибка при запуске: {e}", exc_info=True)
         raise
+    finally:
+        main_logger.info(f"Кэши: {db.cache_stats()}, сообщения: {render_cache.stats()}")
+        await db.close_pool()
+
+        if metrics_task is not None:
+            metrics_task.cancel()
+            metrics.write(METRICS_FILE)
+        if slow_dump_task is not None:
+            slow_dump_task.cancel()
 
 
 if __name__ == '__main__':
@@ -60,3 +134,6 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         main_logger.info("Bot was interrupted.")
         print('Bot was interrupted.')
+    finally:
+        # Записи, которые еще в очереди, дописываются до выхода
+        stop_logging()
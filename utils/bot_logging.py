@@ -1,8 +1,14 @@
+import atexit
+import json
 import logging
+import queue
 import sys
+import time
 
+from contextvars import ContextVar
+from datetime import datetime
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 
 LOG_DIR = Path('logs')
@@ -13,29 +19,147 @@ FORMATTER = logging.Formatter(
     datefmt='%d-%m-%Y %H:%M:%S'
 )
 
+# Апдейт, который обрабатывается в текущей задаче: объект с полями
+# user_id, handler и started (time.perf_counter()). Заполняется
+# middleware из utils.metrics, читается фильтром логов
+current_update: ContextVar = ContextVar("current_update", default=None)
+
+_listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON с полями апдейта"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in ("user_id", "handler", "latency_ms"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class UpdateContextFilter(logging.Filter):
+    """Добавляет к записи пользователя, обработчик и время с начала обработки апдейта"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        update = current_update.get()
+        if update is None:
+            record.user_id = record.handler = record.latency_ms = None
+            return True
+
+        record.user_id = update.user_id
+        record.handler = update.handler
+        record.latency_ms = round((time.perf_counter() - update.started) * 1000, 2)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничивает INFO и DEBUG до `rate` записей в секунду с одного места вызова.
+
+    Лишние записи отбрасываются до форматирования, количество отброшенных
+    дописывается к следующей пропущенной записи с того же места.
+    Предупреждения и ошибки проходят всегда.
+    """
+
+    def __init__(self, rate: float, burst: int | None = None) -> None:
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        # (имя файла, строка) -> [токены, время последнего пополнения, отброшено]
+        self._buckets: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now, 0]
+
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+
+        bucket[0] -= 1
+        if bucket[2]:
+            record.msg = f"{record.msg} (пропущено похожих записей: {bucket[2]})"
+            bucket[2] = 0
+
+        return True
+
+
+class _LoopQueueHandler(QueueHandler):
+    """
+    QueueHandler, который на стороне event loop только подставляет аргументы
+    в сообщение. Форматирование, запись на диск и ротация выполняются
+    в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+
+        # Traceback нельзя передать в другой поток как объект, только текстом
+        if record.exc_info:
+            record.exc_text = FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
 
 def setup_logging(
         name: str = 'bot',
         log_file: str = 'bot.log',
         level: int = logging.INFO,
         max_bytes: int = 2 ** 23 * 10,  # 10 MB
-        backup_count: int = 5
+        backup_count: int = 5,
+        json_format: bool = False,
+        info_rate: float = 0
 ) -> logging.Logger:
     """Настройка логирования бота
 
+    Записи попадают в очередь, файл и консоль пишет отдельный поток
+    (QueueListener), поэтому event loop не ждет диск. Перед выходом
+    очередь дописывается в stop_logging().
+
     Args:
         name: имя логгера
         log_file: имя файла для логов
         level: уровень логирования
         max_bytes: максимальный размер файла для ротации
         backup_count: количество бэкап файлов
+        json_format: писать записи строками JSON (поля апдейта - отдельными ключами)
+        info_rate: не больше стольких INFO-записей в секунду с одного места вызова (0 - без ограничения)
     """
+    global _listener
+
+    stop_logging()
 
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
     logger.handlers.clear()
 
+    formatter = JsonFormatter() if json_format else FORMATTER
+
     file_handler = RotatingFileHandler(
         filename=LOG_DIR / log_file,
         maxBytes=max_bytes,
@@ -43,25 +167,40 @@ def setup_logging(
         encoding='utf-8'
     )
 
-    file_handler.setFormatter(FORMATTER)
+    file_handler.setFormatter(formatter)
 
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(FORMATTER)
+    console_handler.setFormatter(formatter)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    queue_handler = _LoopQueueHandler(queue.SimpleQueue())
+    if info_rate > 0:
+        queue_handler.addFilter(RateLimitFilter(info_rate))
+    queue_handler.addFilter(UpdateContextFilter())
 
-    """
-    logger.info("=" * 60)
-    logger.info("Логирование инициализировано")
-    logger.info(f"Логи сохраняются в {LOG_DIR / log_file}")
-    logger.info(f"Уровень лоирования: {logging.getLevelName(level)}")
-    logger.info("=" * 60)
-    """
+    _listener = QueueListener(queue_handler.queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+
+    logger.addHandler(queue_handler)
 
     return logger
 
 
+def stop_logging() -> None:
+    """Дописать записи из очереди и остановить поток логирования"""
+    global _listener
+
+    if _listener is None:
+        return
+
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+atexit.register(stop_logging)
+
+
 def get_logger(name: str = 'bot') -> logging.Logger:
     """Получить настроенный логгер"""
 
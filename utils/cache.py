@@ -0,0 +1,118 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Ограниченный по количеству элементов LRU кэш со счетчиками попаданий
+
+    Args:
+        maxsize: максимальное количество элементов
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        if maxsize < 1:
+            raise ValueError("Размер кэша должен быть не меньше 1")
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._data.get(key, _MISSING)
+
+        if value is _MISSING:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SizedLRUCache(LRUCache):
+    """LRU кэш, ограниченный суммарным размером значений
+
+    Args:
+        maxbytes: максимальный суммарный размер значений
+        sizeof: оценка размера значения в байтах
+        maxsize: максимальное количество элементов
+    """
+
+    def __init__(
+        self,
+        maxbytes: int,
+        sizeof: Callable[[Any], int],
+        maxsize: int = 100_000
+    ) -> None:
+        if maxbytes < 1:
+            raise ValueError("Размер кэша должен быть не меньше 1 байта")
+
+        super().__init__(maxsize=maxsize)
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self._sizeof = sizeof
+        self._sizes: dict[Hashable, int] = {}
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self._sizeof(value)
+        if size > self.maxbytes:
+            return
+
+        self.pop(key)
+        self._data[key] = value
+        self._sizes[key] = size
+        self.bytes += size
+
+        while len(self._data) > self.maxsize or self.bytes > self.maxbytes:
+            old_key, _ = self._data.popitem(last=False)
+            self.bytes -= self._sizes.pop(old_key)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        value = self._data.pop(key, _MISSING)
+        if value is _MISSING:
+            return default
+
+        self.bytes -= self._sizes.pop(key)
+        return value
+
+    def clear(self) -> None:
+        super().clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        return {**super().stats(), "bytes": self.bytes, "maxbytes": self.maxbytes}
@@ -4,13 +4,35 @@ from datetime import datetime, timedelta
 
 # BOT_TIMEZONE = timezone(timedelta(hours=3))
 
+# Время в базе - целые секунды от EPOCH по настенным часам бота (без часового
+# пояса, как get_now()). Поэтому сутки всегда равны DAY_SECONDS, а границы
+# дней и дни недели считаются целочисленно и в Python, и в SQL.
+EPOCH = datetime(1970, 1, 1)
+DAY_SECONDS = 24 * 60 * 60
+
 def get_now():
     #return datetime.now(BOT_TIMEZONE)
     return datetime.now()
 
 
-def to_datetime(string_time: str) -> datetime:
-    return datetime.strptime(string_time, "%Y-%m-%d %H:%M:%S")
+def to_epoch(time: datetime) -> int:
+    """datetime -> секунды в формате столбцов start_time/end_time"""
+    return (time - EPOCH) // timedelta(seconds=1)
+
+
+def from_epoch(seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def to_datetime(time: int | str | datetime) -> datetime:
+    """Время из базы (секунды) или строка 'YYYY-MM-DD HH:MM:SS' -> datetime"""
+    if isinstance(time, datetime):
+        return time
+
+    if isinstance(time, int):
+        return from_epoch(time)
+
+    return datetime.strptime(time, "%Y-%m-%d %H:%M:%S")
 
 
 def to_string(datetime_time: datetime) -> str:
@@ -52,34 +74,42 @@ def duration_seconds_from_string(time_str: str) -> int:
     return hours * 60 * 60 + minutes * 60
 
 
+def day_bounds(day: datetime.date) -> tuple[datetime, datetime]:
+    """Полуоткрытые границы дня: [00:00 дня, 00:00 следующего дня)"""
+    if isinstance(day, datetime):
+        day = day.date()
+
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
 def format_without_date(time: datetime):
     return datetime.strftime(time, "%H:%M:%S")
 
 
 def calculate_duration_seconds(
-    start_time: datetime | str,
-    end_time: datetime | str | None = None,
+    start_time: datetime | int | str,
+    end_time: datetime | int | str | None = None,
     duration_seconds: int | None = None
 ) -> int:
     if duration_seconds is not None:
         return int(duration_seconds)
-    
-    if isinstance(start_time, str):
-        start_time = to_datetime(start_time)
-    
+
     if end_time is None:
         end_time = get_now()
-    elif isinstance(end_time, str):
-        end_time = to_datetime(end_time)
-    
-    return int((end_time - start_time).total_seconds())
 
+    # Секунды из базы вычитаются без разбора дат
+    if isinstance(start_time, int) and isinstance(end_time, int):
+        return end_time - start_time
 
-def format_time_hhmm(time: datetime | str) -> str:
-    if isinstance(time, str):
-        time = to_datetime(time)
-    
-    return datetime.strftime(time, "%H:%M")
+    return int((to_datetime(end_time) - to_datetime(start_time)).total_seconds())
+
+
+def format_time_hhmm(time: datetime | int | str) -> str:
+    time = to_datetime(time)
+
+    # Вызывается на каждую строку истории, strftime заметно медленнее
+    return f"{time.hour:02d}:{time.minute:02d}"
 
 def resolve_hhmm_to_datetime(
     hhmm: str, 
@@ -0,0 +1,210 @@
+"""
+Файл истории сессий для /export и /import.
+
+SessionsFile - InputFile aiogram, который собирает CSV или JSON во время
+отправки: порции строк core.iter_user_sessions превращаются в байты
+и сразу уходят в multipart-запрос sendDocument. История за годы не
+собирается в памяти ни списком словарей, ни целым файлом.
+
+Импорт принимает CSV в формате выгрузки (parse_csv). Обязательные
+столбцы - state, start_time, end_time; tag и mood необязательны,
+duration_seconds и лишние столбцы не читаются. Время - по часам бота,
+'ГГГГ-ММ-ДД ЧЧ:ММ:СС' (допускается и 'T' между датой и временем).
+"""
+import codecs
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from typing import AsyncGenerator, AsyncIterator
+
+from aiogram import Bot
+from aiogram.types import InputFile
+
+from data.messages import DEFAULT_STATES
+from utils import date
+
+FORMATS = ("csv", "json")
+COLUMNS = ("state", "tag", "start_time", "end_time", "duration_seconds", "mood")
+REQUIRED_COLUMNS = ("state", "start_time", "end_time")
+
+# Сколько ошибок разбора показывается пользователю
+MAX_ERRORS = 10
+
+# Excel открывает CSV без BOM в однобайтовой кодировке
+_BOM = codecs.BOM_UTF8
+
+
+def _fields(row: tuple) -> tuple:
+    """Строка iter_user_sessions -> значения столбцов COLUMNS"""
+    state_name, tag, start_time, end_time, mood = row
+
+    return (
+        state_name,
+        tag,
+        date.to_string(date.from_epoch(start_time)),
+        None if end_time is None else date.to_string(date.from_epoch(end_time)),
+        None if end_time is None else end_time - start_time,
+        mood,
+    )
+
+
+def _csv_chunk(rows: list[tuple], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(_fields(row) for row in rows)
+
+    return buffer.getvalue().encode()
+
+
+def _json_chunk(rows: list[tuple], first: bool) -> bytes:
+    items = ",\n".join(
+        json.dumps(dict(zip(COLUMNS, _fields(row))), ensure_ascii=False) for row in rows
+    )
+    return (("[\n" if first else ",\n") + items).encode()
+
+
+class SessionsFile(InputFile):
+    """
+    Выгрузка истории, которая строится по мере отправки.
+
+    chunks - асинхронный итератор порций строк (core.iter_user_sessions);
+    он читается один раз, поэтому и файл можно отправить только один раз.
+    После отправки rows и elapsed - количество строк и время от первой
+    порции до последней, включая передачу в Telegram.
+    """
+
+    def __init__(
+        self,
+        chunks: AsyncIterator[list[tuple]],
+        file_format: str = "csv",
+        filename: str | None = None
+    ) -> None:
+        if file_format not in FORMATS:
+            raise ValueError(f"Неизвестный формат выгрузки: {file_format}")
+
+        super().__init__(filename=filename or f"sessions.{file_format}")
+        self.chunks = chunks
+        self.file_format = file_format
+        self.rows = 0
+        self.elapsed = 0.0
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        started = time.perf_counter()
+        first = True
+
+        if self.file_format == "csv":
+            yield _BOM + _csv_chunk([], header=True)
+
+        async for rows in self.chunks:
+            if self.file_format == "csv":
+                yield _csv_chunk(rows, header=False)
+            else:
+                yield _json_chunk(rows, first)
+
+            first = False
+            self.rows += len(rows)
+
+        if self.file_format == "json":
+            yield b"[]\n" if first else b"\n]\n"
+
+        self.elapsed = time.perf_counter() - started
+
+
+def _parse_time(value: str | None, column: str) -> int:
+    try:
+        parsed = datetime.fromisoformat((value or "").strip())
+    except ValueError:
+        raise ValueError(f"{column}: '{value}' не в формате ГГГГ-ММ-ДД ЧЧ:ММ:СС") from None
+
+    if parsed.tzinfo is not None:
+        raise ValueError(f"{column}: время с часовым поясом не поддерживается")
+
+    return date.to_epoch(parsed)
+
+
+def _parse_row(row: dict, now: int) -> tuple | None:
+    """Строка CSV -> (state, tag, start_time, end_time, mood) или None для незакрытой сессии"""
+    state_name = (row.get("state") or "").strip()
+    if state_name not in DEFAULT_STATES:
+        raise ValueError(f"неизвестное состояние '{state_name}'")
+
+    # Текущая сессия из выгрузки: импортировать можно только закрытые
+    if not (row.get("end_time") or "").strip():
+        return None
+
+    start_time = _parse_time(row.get("start_time"), "start_time")
+    end_time = _parse_time(row.get("end_time"), "end_time")
+    if end_time <= start_time:
+        raise ValueError("end_time не позже start_time")
+    if end_time > now:
+        raise ValueError("end_time в будущем")
+
+    mood = (row.get("mood") or "").strip()
+    if not mood:
+        mood = None
+    elif not mood.isdigit() or not 1 <= int(mood) <= 5:
+        raise ValueError(f"оценка '{mood}' не от 1 до 5")
+    else:
+        mood = int(mood)
+
+    return state_name, (row.get("tag") or "").strip() or None, start_time, end_time, mood
+
+
+def parse_csv(data: bytes, now: datetime, max_rows: int) -> tuple[list[tuple], list[str], int]:
+    """
+    Разобрать и проверить CSV для /import.
+
+    Returns:
+        (сессии (state, tag, start_time, end_time, mood) по возрастанию
+        start_time со временем в секундах; ошибки с номерами строк - при
+        ошибках файл не импортируется; количество пропущенных незакрытых сессий)
+    """
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return [], ["файл не в кодировке UTF-8"], 0
+
+    reader = csv.DictReader(io.StringIO(text, newline=""))
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        return [], [f"нет столбцов: {', '.join(missing)}"], 0
+
+    now = date.to_epoch(now)
+    sessions = []
+    errors = []
+    skipped = 0
+
+    for row in reader:
+        if len(sessions) >= max_rows:
+            errors.append(f"больше {max_rows} строк")
+            break
+
+        try:
+            session = _parse_row(row, now)
+        except ValueError as e:
+            errors.append(f"строка {reader.line_num}: {e}")
+            if len(errors) >= MAX_ERRORS:
+                break
+            continue
+
+        if session is None:
+            skipped += 1
+        else:
+            sessions.append(session)
+
+    sessions.sort(key=lambda session: session[2])
+    for previous, session in zip(sessions, sessions[1:]):
+        if len(errors) >= MAX_ERRORS:
+            break
+        if session[2] < previous[3]:
+            errors.append(
+                f"сессии с {date.to_string(date.from_epoch(previous[2]))} "
+                f"и с {date.to_string(date.from_epoch(session[2]))} пересекаются"
+            )
+
+    return sessions, errors, skipped
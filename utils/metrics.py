@@ -0,0 +1,284 @@
+"""
+Метрики процесса в формате Prometheus.
+
+Собираются в памяти процесса:
+    - время обработки апдейта по обработчику и маршруту (команда или
+      префикс callback_data) - outer-middleware роутеров, см. instrument();
+    - количество и время SQL-запросов через database/core.py - соединения
+      пула оборачиваются в database.tracing.traced();
+    - время вызовов Bot API по методу - middleware сессии бота api_middleware().
+
+SQL и Bot API дополнительно суммируются по обработчику, в котором они
+выполнены (через contextvar), так видно, из чего складывается время ответа.
+
+render() возвращает текст в формате Prometheus, write_periodically()
+периодически пишет его в файл (для textfile collector node_exporter).
+"""
+import asyncio
+import bisect
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import Router
+from aiogram.types import CallbackQuery, Message
+
+from utils import bot_logging as bot_log
+
+logger = bot_log.get_logger(__name__)
+
+PREFIX = "timetracker"
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Ограничение числа рядов одной метрики: маршрут берется из данных
+# пользователя, и поддельные callback_data не должны раздувать память
+MAX_SERIES = 500
+OVERFLOW_LABEL = "other"
+
+
+def _label_key(labels: dict[str, str]) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self._series: dict[tuple, Any] = {}
+
+    def _key(self, labels: dict[str, str]) -> tuple:
+        key = _label_key(labels)
+        if key not in self._series and len(self._series) >= MAX_SERIES:
+            key = _label_key({name: OVERFLOW_LABEL for name in labels})
+
+        return key
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+
+        return lines
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = BUCKETS) -> None:
+        super().__init__(name, help)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            # Счетчики по корзинам (последняя - +Inf), сумма
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = 'le="%s"' % (bound if isinstance(bound, str) else f"{bound:g}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+
+        return lines
+
+
+handler_seconds = Histogram("handler_seconds", "Время обработки апдейта обработчиком")
+handler_errors = Counter("handler_errors_total", "Апдейты, обработка которых завершилась исключением")
+handler_sql_statements = Counter("handler_sql_statements_total", "SQL-запросы, выполненные обработчиком")
+handler_sql_seconds = Counter("handler_sql_seconds_total", "Время SQL-запросов обработчика")
+handler_api_seconds = Counter("handler_api_seconds_total", "Время вызовов Bot API из обработчика")
+
+sql_statements = Counter("sql_statements_total", "SQL-запросы через database/core.py")
+sql_seconds = Counter("sql_seconds_total", "Суммарное время SQL-запросов, включая выборку строк")
+slow_queries = Counter("slow_queries_total", "SQL-запросы дольше SLOW_QUERY_MS по вызывающей функции")
+api_seconds = Histogram("api_seconds", "Время вызова Bot API")
+
+write_batch_size = Histogram(
+    "write_batch_size", "Операций записи в одной транзакции группового коммита",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+write_commit_seconds = Histogram("write_commit_seconds", "Время COMMIT пачки записей")
+write_wait_seconds = Histogram("write_wait_seconds", "Время от постановки записи в очередь до ее коммита")
+
+METRICS = (
+    handler_seconds, handler_errors, handler_sql_statements, handler_sql_seconds,
+    handler_api_seconds, sql_statements, sql_seconds, slow_queries, api_seconds,
+    write_batch_size, write_commit_seconds, write_wait_seconds,
+)
+
+
+class _Probe:
+    """
+    Текущий апдейт: счетчики SQL и Bot API заполняются по ходу обработки.
+
+    Хранится в bot_log.current_update, поэтому те же поля (пользователь,
+    обработчик, начало обработки) попадают и в записи лога.
+    """
+
+    __slots__ = ("user_id", "handler", "started", "sql_statements", "sql_seconds", "api_seconds")
+
+    def __init__(self, user_id: int | None) -> None:
+        self.user_id = user_id
+        self.handler = "unknown"
+        self.started = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.api_seconds = 0.0
+
+
+_probe = bot_log.current_update
+
+
+def record_sql(elapsed: float, statements: int = 1) -> None:
+    sql_statements.inc(statements)
+    sql_seconds.inc(elapsed)
+
+    probe = _probe.get()
+    if probe is not None:
+        probe.sql_statements += statements
+        probe.sql_seconds += elapsed
+
+
+def route(event: Message | CallbackQuery) -> str:
+    """Команда сообщения или префикс callback_data до первого ':'"""
+    if isinstance(event, CallbackQuery):
+        return (event.data or "").split(":", 1)[0][:40] or "empty"
+
+    text = event.text or ""
+    if text.startswith("/"):
+        return text.split(maxsplit=1)[0].split("@", 1)[0][:40]
+
+    return "text"
+
+
+async def _outer_middleware(
+    handler: Callable[[Any, dict], Awaitable[Any]],
+    event: Message | CallbackQuery,
+    data: dict
+) -> Any:
+    probe = _Probe(event.from_user.id if event.from_user else None)
+    token = _probe.set(probe)
+
+    failed = False
+    try:
+        result = await handler(event, data)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - probe.started
+        _probe.reset(token)
+
+        # Апдейт проходит outer-middleware всех роутеров до того, который его обработал
+        if failed or probe.handler != "unknown":
+            labels = {"handler": probe.handler, "route": route(event)}
+            handler_seconds.observe(elapsed, **labels)
+            handler_sql_statements.inc(probe.sql_statements, **labels)
+            handler_sql_seconds.inc(probe.sql_seconds, **labels)
+            handler_api_seconds.inc(probe.api_seconds, **labels)
+            if failed:
+                handler_errors.inc(**labels)
+
+    return result
+
+
+async def _inner_middleware(
+    handler: Callable[[Any, dict], Awaitable[Any]],
+    event: Message | CallbackQuery,
+    data: dict
+) -> Any:
+    probe = _probe.get()
+    if probe is not None:
+        probe.handler = data["handler"].callback.__name__
+
+    return await handler(event, data)
+
+
+def instrument(router: Router) -> None:
+    """Подключить метрики к сообщениям и callback-запросам роутера"""
+    for observer in (router.message, router.callback_query):
+        observer.outer_middleware(_outer_middleware)
+        # Имя обработчика известно только после фильтров
+        observer.middleware(_inner_middleware)
+
+
+async def api_middleware(make_request, bot, method):
+    """Middleware сессии бота: время вызовов Bot API"""
+    started = time.perf_counter()
+    try:
+        return await make_request(bot, method)
+    finally:
+        name = getattr(method, "__api_method__", type(method).__name__)
+        # getUpdates - ожидание long polling, а не задержка API
+        if name != "getUpdates":
+            elapsed = time.perf_counter() - started
+            api_seconds.observe(elapsed, method=name)
+
+            probe = _probe.get()
+            if probe is not None:
+                probe.api_seconds += elapsed
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+
+    return "\n".join(lines) + "\n"
+
+
+def write(path: str) -> None:
+    """Записать метрики атомарно: читатель файла не увидит его наполовину"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(render())
+    os.replace(tmp_path, path)
+
+
+async def write_periodically(path: str, interval: float) -> None:
+    """Писать метрики в файл раз в interval секунд до отмены задачи"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            write(path)
+        except OSError as e:
+            logger.error(f"Не удалось записать метрики в {path}: {e}")
+
+
+def reset() -> None:
+    for metric in METRICS:
+        metric._series.clear()
@@ -0,0 +1,46 @@
+"""
+Кэш отрисованных сообщений истории и статистики за прошедшие дни.
+
+Ключ - (users.id, день, вид, версия данных пользователя). Версия - это
+столбец users.data_version, его увеличивает каждая запись в
+database/core.py в той же транзакции. Поэтому после правки сессий, в том
+числе другим экземпляром бота на той же базе, старые записи больше не
+находятся и вытесняются по LRU.
+Версию нужно читать до запросов к базе: запись, закоммиченная позже,
+увеличит версию, и отрисованное по старым данным не будет найдено.
+"""
+import sys
+from datetime import date as date_type
+from typing import Hashable
+
+from aiogram.types import InlineKeyboardMarkup
+
+from config import RENDER_CACHE_BYTES
+from utils.cache import SizedLRUCache
+
+Rendered = tuple[str, InlineKeyboardMarkup]
+
+
+def _sizeof(rendered: Rendered) -> int:
+    """Оценка: текст и клавиатура в JSON, как она уходит в API"""
+    text, markup = rendered
+    return sys.getsizeof(text) + len(markup.model_dump_json(exclude_none=True))
+
+
+_rendered = SizedLRUCache(maxbytes=RENDER_CACHE_BYTES, sizeof=_sizeof)
+
+
+def key(user_id: int, day: date_type, kind: str, version: int) -> Hashable:
+    return user_id, day, kind, version
+
+
+def get(cache_key: Hashable) -> Rendered | None:
+    return _rendered.get(cache_key)
+
+
+def put(cache_key: Hashable, text: str, markup: InlineKeyboardMarkup) -> None:
+    _rendered.put(cache_key, (text, markup))
+
+
+def stats() -> dict:
+    return _rendered.stats()
@@ -0,0 +1,140 @@
+"""
+Профилирование холодного старта бота (python main.py --profile-startup).
+
+Модуль не тянет тяжелых зависимостей, поэтому его можно импортировать
+первым и засекать время всех последующих импортов.
+"""
+import importlib.abc
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Обертка загрузчика, засекающая выполнение модуля"""
+
+    def __init__(self, loader: importlib.abc.Loader, timer: "ImportTimer") -> None:
+        self._loader = loader
+        self._timer = timer
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module) -> None:
+        self._timer.enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timer.leave(module.__name__)
+
+    def __getattr__(self, name: str):
+        return getattr(self._loader, name)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Время импорта каждого модуля: собственное и вместе с вложенными импортами,
+    как в python -X importtime
+    """
+
+    def __init__(self) -> None:
+        self.modules: dict[str, tuple[float, float]] = {}
+        self._stack: list[list[float]] = []
+
+    def install(self) -> None:
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+
+            if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                spec.loader = _TimedLoader(spec.loader, self)
+            return spec
+
+        return None
+
+    def enter(self) -> None:
+        # [время начала, время вложенных импортов]
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def leave(self, name: str) -> None:
+        started, nested = self._stack.pop()
+        cumulative = time.perf_counter() - started
+        self.modules[name] = (cumulative - nested, cumulative)
+
+        if self._stack:
+            self._stack[-1][1] += cumulative
+
+
+class StartupProfiler:
+    """Замеры фаз запуска и импортов. Выключенный профайлер ничего не делает"""
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.imports = ImportTimer()
+
+        if enabled:
+            self.imports.install()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def mark(self, name: str, started: float) -> None:
+        self.phases[name] = time.perf_counter() - started
+
+    def report(self, top: int = 20) -> str:
+        self.imports.uninstall()
+        total = time.perf_counter() - self.started
+
+        lines = ["Профиль запуска:"]
+        for name, elapsed in self.phases.items():
+            lines.append(f"    {name:<12} {elapsed * 1000:9.1f} мс")
+        lines.append(f"    {'всего':<12} {total * 1000:9.1f} мс")
+
+        lines.append(f"Импорты (топ {top} по собственному времени, мс: собственное / с вложенными):")
+        slowest = sorted(self.imports.modules.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (own, cumulative) in slowest[:top]:
+            lines.append(f"    {own * 1000:8.1f} / {cumulative * 1000:8.1f}  {name}")
+
+        return "\n".join(lines)
+
+
+def first_poll_middleware(profiler: StartupProfiler, on_ready):
+    """
+    Middleware сессии бота: фиксирует момент первого запроса getUpdates,
+    то есть готовность принимать апдейты, и вызывает on_ready() один раз.
+    """
+    from aiogram.methods import GetUpdates
+
+    polling_started = time.perf_counter()
+    done = False
+
+    async def middleware(make_request, bot, method):
+        nonlocal done
+
+        if not done and isinstance(method, GetUpdates):
+            done = True
+            profiler.mark("first_poll", polling_started)
+            on_ready()
+
+        return await make_request(bot, method)
+
+    return middleware
@@ -2,4 +2,8 @@ from aiogram.fsm.state import State, StatesGroup
 
 class ChangeStateTag(StatesGroup):
     tag = State()
-    
\ No newline at end of file
+    
+
+
+class ImportSessions(StatesGroup):
+    file = State()
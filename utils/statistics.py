@@ -1,12 +1,139 @@
-import pandas as pd
+from datetime import date as date_type
 
-def build_transition_matrix(group):
-    group = group.sort_values('start_time')
-    group['next_state'] = group['state_name'].shift(-1)
-    group = group.dropna(subset=['next_state'])
+from utils import date
 
-    return pd.crosstab(
-        group['state_name'],
-        group['next_state'],
-        normalize='index'
+
+PRODUCTIVE_STATES = ('work', 'study')
+
+
+def calculate_productivity(state_durations: dict[str, int]) -> int:
+    """Productivity: (study + work) / (study + work + chill), percents. 0 without chill"""
+    productivity_time = sum(state_durations.get(state, 0) for state in PRODUCTIVE_STATES)
+    chill_time = state_durations.get('chill', 0)
+
+    return int((productivity_time / (productivity_time + chill_time)) * 100) if chill_time > 0 else 0
+
+
+def day_statistics(day_data: dict, target_day: date_type) -> dict:
+    """
+    Build the states_statistics payload from per-state window totals.
+
+    Plain Python over one row per state (see db.get_state_totals_between).
+    """
+    totals = day_data['totals']
+    current_state_data = day_data['last_session']
+
+    delta = current_state_data['duration_seconds']
+    delta_dict = {
+        'hours': delta // 3600,
+        'minutes': (delta // 60) % 60,
+        'seconds': delta % 60
+    }
+
+    state_count = sum(state['session_count'] for state in totals.values())
+    chronology = ' → '.join(day_data['chronology'])
+
+    # All states statistics (including sleep)
+    state_durations = {name: state['total_seconds'] for name, state in totals.items()}
+    total_time = sum(state_durations.values())
+
+    # Calculate percentages for all states
+    states_in_percents = {
+        state: [duration, round((duration / total_time) * 100, 1) if total_time > 0 else 0]
+        for state, duration in state_durations.items()
+    }
+
+    # Filter out sleep for special statistics
+    no_sleep_totals = {name: state for name, state in totals.items() if name != 'sleep'}
+
+    if no_sleep_totals:
+        # Longest and shortest total states
+        longest_total_state = max(
+            ((name, state['total_seconds']) for name, state in no_sleep_totals.items()),
+            key=lambda x: x[1]
+        )
+        shortest_total_state = min(
+            ((name, state['total_seconds']) for name, state in no_sleep_totals.items()),
+            key=lambda x: x[1]
+        )
+
+        # Individual sessions (without sleep)
+        longest_name, longest = max(no_sleep_totals.items(), key=lambda x: x[1]['longest_seconds'])
+        shortest_name, shortest = min(no_sleep_totals.items(), key=lambda x: x[1]['shortest_seconds'])
+        longest_session = {'name': longest_name, 'duration': longest['longest_seconds']}
+        shortest_session = {'name': shortest_name, 'duration': shortest['shortest_seconds']}
+
+        # Productivity calculation: (study + work) / chill
+        productivity = calculate_productivity(state_durations)
+
+        # Average session time
+        average_session_time = date.format_time(int(
+            sum(state['total_seconds'] for state in no_sleep_totals.values())
+            / sum(state['session_count'] for state in no_sleep_totals.values())
+        ))
+    else:
+        # If only sleep or no non-sleep states
+        longest_total_state = ('—', 0)
+        shortest_total_state = ('—', 0)
+        longest_session = {'name': '—', 'duration': 0}
+        shortest_session = {'name': '—', 'duration': 0}
+        productivity = 0
+        average_session_time = "0с"
+
+    return {
+        "target_date": target_day.strftime("%d/%m/%Y"),
+        "current_state_name": current_state_data['state_name'],
+        "current_state_tag": current_state_data['tag'],
+        "delta_time": delta_dict,
+        "state_count": state_count,
+        "chronology": chronology,
+        "states_in_precents": states_in_percents,  # All states including sleep
+        "productivity": productivity,  # Without sleep
+        "longest_total": {
+            'name': longest_total_state[0],
+            'duration': date.format_time(longest_total_state[1]) if longest_total_state[1] > 0 else "—"
+        },  # Without sleep
+        "shortest_total": {
+            'name': shortest_total_state[0],
+            'duration': date.format_time(shortest_total_state[1]) if shortest_total_state[1] > 0 else "—"
+        },  # Without sleep
+        "longest_session": {
+            'name': longest_session['name'],
+            'duration': date.format_time(longest_session['duration']) if longest_session['duration'] > 0 else "—"
+        },  # Without sleep
+        "shortest_session": {
+            'name': shortest_session['name'],
+            'duration': date.format_time(shortest_session['duration']) if shortest_session['duration'] > 0 else "—"
+        },  # Without sleep
+        "average_session": average_session_time  # Without sleep
+    }
+
+
+def count_transitions(
+    transitions: list[dict],
+    weekday: int | None = None,
+    time_bin: int | None = None
+) -> dict[str, int]:
+    """Sum transition counts by target state, optionally within one weekday and time bin"""
+    counts: dict[str, int] = {}
+
+    for row in transitions:
+        if weekday is not None and row['weekday'] != weekday:
+            continue
+        if time_bin is not None and row['time_bin'] != time_bin:
+            continue
+
+        counts[row['state_name']] = counts.get(row['state_name'], 0) + row['count']
+
+    return counts
+
+
+def transition_probabilities(counts: dict[str, int]) -> list[tuple[str, float]]:
+    """Normalize transition counts to probabilities, most likely state first"""
+    total = sum(counts.values())
+
+    return sorted(
+        ((state, count / total) for state, count in counts.items()),
+        key=lambda item: item[1],
+        reverse=True
     )
@@ -0,0 +1,106 @@
+"""
+Режим webhook: Telegram присылает апдейты POST-запросами на aiohttp-сервер
+бота вместо long polling.
+
+Апдейт подтверждается сразу, а обрабатывается в фоне. При остановке
+(SIGINT/SIGTERM) сервер перестает принимать запросы и дожидается уже
+принятых апдейтов, и только потом закрывает сессию бота.
+"""
+import asyncio
+import re
+import signal
+from typing import Callable
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET
+from utils import bot_logging as bot_log
+
+logger = bot_log.get_logger(__name__)
+
+# Ограничения Telegram на secret_token
+_SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+DRAIN_TIMEOUT = 30
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler, который при закрытии ждет фоновую обработку апдейтов"""
+
+    def __init__(self, *args, drain_timeout: float = DRAIN_TIMEOUT, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.drain_timeout = drain_timeout
+
+    async def close(self) -> None:
+        pending = set(self._background_feed_update_tasks)
+        if pending:
+            logger.info(f"Ожидание обработки {len(pending)} апдейтов перед остановкой")
+            _, not_done = await asyncio.wait(pending, timeout=self.drain_timeout)
+            if not_done:
+                logger.warning(f"Не дождались {len(not_done)} апдейтов за {self.drain_timeout} с")
+
+        await super().close()
+
+
+def build_app(
+    dp: Dispatcher,
+    bot: Bot,
+    secret_token: str,
+    path: str = WEBHOOK_PATH
+) -> web.Application:
+    """aiohttp-приложение с обработчиком апдейтов; startup/shutdown диспетчера привязаны к нему"""
+    app = web.Application()
+    DrainingRequestHandler(dispatcher=dp, bot=bot, secret_token=secret_token).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+
+    return app
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    on_ready: Callable[[], None] | None = None
+) -> None:
+    """Запустить сервер, зарегистрировать webhook и работать до SIGINT/SIGTERM"""
+    if not _SECRET_RE.fullmatch(WEBHOOK_SECRET):
+        raise RuntimeError("WEBHOOK_SECRET не задан или содержит недопустимые символы (A-Z, a-z, 0-9, _, -)")
+
+    runner = web.AppRunner(build_app(dp, bot, WEBHOOK_SECRET))
+    await runner.setup()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    signals = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+            signals.append(sig)
+        except NotImplementedError:
+            # Windows: остановка через KeyboardInterrupt
+            pass
+
+    try:
+        site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+        await site.start()
+
+        # Webhook ставится, когда сервер уже принимает запросы
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logger.info(f"Webhook слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+        if on_ready is not None:
+            on_ready()
+
+        await stop.wait()
+        logger.info("Остановка webhook-сервера")
+    finally:
+        # Сначала закрывается прием запросов, затем on_shutdown:
+        # DrainingRequestHandler.close и shutdown диспетчера
+        await runner.cleanup()
+        for sig in signals:
+            loop.remove_signal_handler(sig)